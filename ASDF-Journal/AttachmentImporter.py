@@ -0,0 +1,147 @@
+"""
+Imports attachments and pasted images in the background while placeholders for their references are shown in the
+editor
+"""
+
+import os
+import uuid
+from typing import List
+
+from PyQt5.QtCore import QObject, Qt, pyqtSignal
+from PyQt5.QtGui import QImage, QTextCursor
+from PyQt5.QtWidgets import QPlainTextEdit, QProgressDialog
+
+import ImageEncoder
+import Utilities
+from BackgroundTask import BackgroundTask
+
+
+class AttachmentImporter(QObject):
+    """
+    Imports one batch of files. A placeholder reference is inserted at the cursor for each file and replaced with the
+    real reference as soon as the file is imported, or removed if it fails. If the user switched to another entry in
+    the meantime, the placeholder is replaced in the saved entry instead.
+    """
+    # emitted from the worker threads with the position of the file, the attachment name (empty if the file was not
+    # imported) and the error (empty if it was)
+    file_imported = pyqtSignal(int, str, str)
+    # emitted when every file has been handled
+    done = pyqtSignal()
+
+    def __init__(self, editor: QPlainTextEdit, entry_path: str):
+        """
+        :param editor: the markdown editor
+        :param entry_path: path of the entry shown in the editor
+        """
+        super(AttachmentImporter, self).__init__(editor)
+        self.editor = editor
+        self.entry_path = entry_path
+        self.placeholders: List[str] = []
+        self.errors: List[str] = []
+        self.task = BackgroundTask(self)
+        self.progress_dialog = None
+        self.file_imported.connect(self.finalize_reference)
+
+    def start(self, paths: List[str]) -> None:
+        """
+        Inserts the placeholders and starts importing files
+        :param paths: paths of the files to import
+        :return: None
+        """
+        store = Utilities.get_attachment_store()
+        self.run([os.path.basename(path) for path in paths], store.import_files,
+                 [(path, Utilities.attachment_file_name(path)) for path in paths])
+
+    def start_image(self, image: QImage, name: str) -> None:
+        """
+        Inserts a placeholder and starts encoding and saving a pasted image
+        :param image: the image
+        :param name: file name to give the image, without the extension
+        :return: None
+        """
+        format_name, quality, max_dimension = Utilities.get_pasted_image_settings()
+        self.run([name], ImageEncoder.import_image, Utilities.get_attachment_store(), QImage(image), name,
+                 ImageEncoder.image_format(format_name), quality, max_dimension)
+
+    def run(self, labels: List[str], function, *args) -> None:
+        """
+        Inserts a placeholder for each item and runs the import in the background
+        :param labels: names shown in the placeholders
+        :param function: function that imports the items and reports each one through its on_done argument
+        :param args: arguments of the function
+        :return: None
+        """
+        token = uuid.uuid4().hex[:8]
+        self.placeholders = ["[Importing {}...](importing:{}-{})".format(label.replace("]", ""), token, index)
+                             for index, label in enumerate(labels)]
+        self.editor.insertPlainText("".join(placeholder + "\n\n" for placeholder in self.placeholders))
+
+        self.progress_dialog = QProgressDialog("Importing attachments...", "Cancel", 0, 1000, self.editor)
+        self.progress_dialog.setWindowTitle("Import")
+        # the editor stays usable while files are being imported
+        self.progress_dialog.setWindowModality(Qt.NonModal)
+        self.progress_dialog.setMinimumDuration(500)
+        self.progress_dialog.canceled.connect(self.task.cancel)
+        self.task.progress.connect(
+            lambda done, total: self.progress_dialog.setValue(int(done * 1000 / total) if total else 0))
+        self.task.finished.connect(self.import_finished)
+        self.task.failed.connect(self.import_failed)
+        self.task.start(function, *args, on_done=self.file_imported.emit)
+
+    def cancel(self) -> None:
+        self.task.cancel()
+
+    def finalize_reference(self, index: int, name: str, error: str) -> None:
+        """
+        Replaces the placeholder of a file with its reference, or removes it if the file was not imported
+        :param index: position of the file
+        :param name: file name of the attachment
+        :param error: why the file was not imported
+        :return: None
+        """
+        if error and error != "cancelled":
+            self.errors.append(error)
+        self.replace_placeholder(self.placeholders[index], Utilities.attachment_reference(name).rstrip("\n")
+                                 if name else "")
+
+    def replace_placeholder(self, placeholder: str, text: str) -> None:
+        """
+        Replaces a placeholder in the editor, or in the entry it was inserted into if that entry is no longer shown;
+        placeholders are removed along with the blank line after them if the text is empty
+        :param placeholder: the placeholder
+        :param text: the text to replace it with
+        :return: None
+        """
+        cursor = self.editor.document().find(placeholder)
+        if not cursor.isNull():
+            if not text:
+                cursor.movePosition(QTextCursor.NextCharacter, QTextCursor.KeepAnchor, 2)
+                if cursor.selectedText() != placeholder + "\u2029\u2029":
+                    cursor = self.editor.document().find(placeholder)
+            cursor.insertText(text)
+            return
+        if not self.entry_path or not os.path.isfile(self.entry_path):
+            return
+        # read and written without translating line endings, so that the entry keeps the ones it was saved with
+        with open(self.entry_path, encoding="utf8", newline="") as entry:
+            entry_text = entry.read()
+        if placeholder in entry_text:
+            if not text:
+                entry_text = entry_text.replace(placeholder + "\r\n\r\n", "").replace(placeholder + "\n\n", "")
+            Utilities.save_text_atomically(self.entry_path, entry_text.replace(placeholder, text), newline="")
+            Utilities.get_entry_index().update_entry(self.entry_path)
+
+    def import_finished(self, names: List[str]) -> None:
+        self.progress_dialog.reset()
+        self.progress_dialog.deleteLater()
+        if self.errors:
+            Utilities.alert_user("These attachments could not be imported:\n" + "\n".join(self.errors))
+        self.done.emit()
+
+    def import_failed(self, error: str) -> None:
+        self.progress_dialog.reset()
+        self.progress_dialog.deleteLater()
+        for placeholder in self.placeholders:
+            self.replace_placeholder(placeholder, "")
+        Utilities.alert_user("Attachments could not be imported: " + error)
+        self.done.emit()
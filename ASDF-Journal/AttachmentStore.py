@@ -0,0 +1,393 @@
+"""
+Content-addressed lookup of the attachments in a journal, stored as a SQLite sidecar in the journal folder, so that
+importing a file that is already attached reuses the existing attachment instead of storing another copy
+"""
+
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+import Export
+import Journal
+import Tracing
+
+STORE_FILE_NAME = ".attachment_index.sqlite"
+HASH_BUFFER_SIZE = 1024 * 1024
+IMPORT_WORKERS = 4
+
+
+def hash_file(path: str) -> str:
+    """
+    :return: the sha256 of a file, which is the content address of an attachment
+    """
+    content_hash = hashlib.sha256()
+    with open(path, "rb") as hashed_file:
+        while True:
+            chunk = hashed_file.read(HASH_BUFFER_SIZE)
+            if not chunk:
+                break
+            content_hash.update(chunk)
+    return content_hash.hexdigest()
+
+
+class AttachmentFile:
+    """
+    A single file in the attachments folder; its hash is only computed when another file of the same size is imported
+    """
+    __slots__ = ("name", "size", "mtime", "hash")
+
+    def __init__(self, name: str, size: int, mtime: int, content_hash: Optional[str]):
+        self.name = name
+        self.size = size
+        self.mtime = mtime
+        self.hash = content_hash
+
+
+class DedupeStats:
+    """
+    What a dedupe pass did
+    """
+    __slots__ = ("removed", "bytes_reclaimed", "entries_updated", "cancelled")
+
+    def __init__(self):
+        # names of the duplicate attachments that were removed
+        self.removed = []
+        self.bytes_reclaimed = 0
+        self.entries_updated = 0
+        self.cancelled = False
+
+
+class AttachmentStore:
+    """
+    Maps the sha256 of each attachment to its file name. Files are only hashed when needed, so the index of a journal
+    with many large attachments is cheap to build: an imported file is compared with the existing attachments of the
+    same size, and a hash is kept until the file's size or mtime changes. Files can be imported from several threads.
+    """
+
+    def __init__(self, journal_dir: str):
+        self.journal_dir = journal_dir
+        self.attachments_dir = os.path.join(journal_dir, "attachments")
+        self._files: Dict[str, AttachmentFile] = {}
+        # names of attachments that are being copied
+        self._reserved = set()
+        self._db = None
+        self._lock = threading.RLock()
+        self._open_db()
+
+    def _open_db(self) -> None:
+        """
+        Opens the index database; the index is kept in memory only if the journal folder is not writable
+        :return: None
+        """
+        if not os.path.isdir(self.journal_dir):
+            return
+        try:
+            self._db = sqlite3.connect(os.path.join(self.journal_dir, STORE_FILE_NAME), check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS files (name TEXT PRIMARY KEY, size INTEGER, mtime INTEGER, "
+                             "hash TEXT)")
+            self._db.commit()
+            for name, size, mtime, content_hash in self._db.execute("SELECT name, size, mtime, hash FROM files"):
+                self._files[name] = AttachmentFile(name, size, mtime, content_hash)
+        except sqlite3.Error:
+            self._db = None
+            self._files.clear()
+
+    def _save(self, files: List[AttachmentFile], removed: List[str]) -> None:
+        if self._db is None:
+            return
+        try:
+            with self._lock, self._db:
+                self._db.executemany("DELETE FROM files WHERE name = ?", [(name,) for name in removed])
+                self._db.executemany("INSERT OR REPLACE INTO files (name, size, mtime, hash) VALUES (?, ?, ?, ?)",
+                                     [(file.name, file.size, file.mtime, file.hash) for file in files])
+        except sqlite3.Error:
+            pass
+
+    def refresh(self) -> None:
+        """
+        Brings the index up to date with the attachments folder; hashes of changed files are dropped
+        :return: None
+        """
+        found = {}
+        try:
+            with os.scandir(self.attachments_dir) as scan:
+                for dir_entry in scan:
+                    if dir_entry.is_file() and not dir_entry.name.startswith("."):
+                        found[dir_entry.name] = dir_entry.stat()
+        except OSError:
+            pass
+        with self._lock:
+            removed = [name for name in self._files if name not in found]
+            for name in removed:
+                del self._files[name]
+            changed = []
+            for name, stat_result in found.items():
+                file = self._files.get(name)
+                if file is None or file.size != stat_result.st_size or file.mtime != stat_result.st_mtime_ns:
+                    file = AttachmentFile(name, stat_result.st_size, stat_result.st_mtime_ns, None)
+                    self._files[name] = file
+                    changed.append(file)
+            if changed or removed:
+                self._save(changed, removed)
+
+    def _hash_of(self, file: AttachmentFile) -> Optional[str]:
+        if file.hash is None:
+            try:
+                file.hash = hash_file(os.path.join(self.attachments_dir, file.name))
+            except OSError:
+                return None
+            self._save([file], [])
+        return file.hash
+
+    def content_hash(self, name: str) -> Optional[str]:
+        """
+        :param name: file name of an attachment
+        :return: its sha256, computed if the file is new or changed since it was last hashed, or None if it is missing
+        """
+        try:
+            stat_result = os.stat(os.path.join(self.attachments_dir, name))
+        except OSError:
+            return None
+        with self._lock:
+            file = self._files.get(name)
+            if file is None or file.size != stat_result.st_size or file.mtime != stat_result.st_mtime_ns:
+                file = AttachmentFile(name, stat_result.st_size, stat_result.st_mtime_ns, None)
+                self._files[name] = file
+        return self._hash_of(file)
+
+    def find(self, content_hash: str, size: int) -> Optional[str]:
+        """
+        :param content_hash: sha256 of a file
+        :param size: size of the file
+        :return: the name of an attachment with the same content, or None
+        """
+        with self._lock:
+            candidates = sorted((file for file in self._files.values() if file.size == size),
+                                key=lambda file: file.name)
+        for file in candidates:
+            if self._hash_of(file) == content_hash:
+                return file.name
+        return None
+
+    def _has_size(self, size: int) -> bool:
+        with self._lock:
+            return any(file.size == size for file in self._files.values())
+
+    def _reserve_name(self, name: str) -> str:
+        """
+        :return: a file name based on the given one that is not used by an attachment or by another import
+        """
+        base, extension = os.path.splitext(name)
+        number = 1
+        with self._lock:
+            while name in self._files or name in self._reserved or \
+                    os.path.lexists(os.path.join(self.attachments_dir, name)):
+                name = "{}_{}{}".format(base, number, extension)
+                number += 1
+            self._reserved.add(name)
+        return name
+
+    def add(self, name: str, content_hash: Optional[str] = None) -> None:
+        """
+        Records a file that was just written to the attachments folder
+        :param name: file name of the attachment
+        :param content_hash: its sha256, if already known
+        :return: None
+        """
+        stat_result = os.stat(os.path.join(self.attachments_dir, name))
+        file = AttachmentFile(name, stat_result.st_size, stat_result.st_mtime_ns, content_hash)
+        with self._lock:
+            self._files[name] = file
+            self._reserved.discard(name)
+        self._save([file], [])
+
+    def import_file(self, path: str, name: str) -> str:
+        """
+        Copies a file into the attachments folder unless an attachment with the same content exists
+        :param path: path of the file to import
+        :param name: file name to give the attachment if it is copied
+        :return: the file name of the attachment to reference
+        """
+        self.refresh()
+        return self._import_file(path, name, lambda length: None)
+
+    def _import_file(self, path: str, name: str, on_chunk: Callable[[int], None]) -> str:
+        size = os.path.getsize(path)
+        content_hash = None
+        # a file can only be a duplicate of attachments of the same size, so it is not hashed if there are none
+        if self._has_size(size):
+            content_hash = hash_file(path)
+            existing = self.find(content_hash, size)
+            if existing is not None:
+                on_chunk(size)
+                return existing
+        name = self._reserve_name(name)
+        try:
+            # copied through a hidden temporary file, which is removed if the copy fails or is cancelled
+            with Tracing.span("import attachment", "attachments", size=size):
+                Export.export_attachment(path, os.path.join(self.attachments_dir, name), "copy", on_chunk)
+        except BaseException:
+            with self._lock:
+                self._reserved.discard(name)
+            raise
+        self.add(name, content_hash)
+        return name
+
+    def import_files(self, files: List[Tuple[str, str]], workers: int = IMPORT_WORKERS,
+                     progress: Optional[Callable[[int, int], None]] = None,
+                     cancel_event: Optional[threading.Event] = None,
+                     on_done: Optional[Callable[[int, str, str], None]] = None) -> List[str]:
+        """
+        Imports files on a pool of threads, copying them in chunks inside the kernel where possible
+        :param files: the path of each file and the file name to give it if it is copied
+        :param workers: number of files copied at the same time
+        :param progress: called from the worker threads with the number of bytes done and the total number of bytes
+        :param cancel_event: stops the import when set; files being copied are discarded
+        :param on_done: called from the worker threads as each file finishes, with its position in files, the file
+        name of the attachment to reference, or an empty string if it failed, and the error, or an empty string
+        :return: the file name of each attachment, or an empty string for files that were not imported
+        """
+        self.refresh()
+        sizes = []
+        for path, _ in files:
+            try:
+                sizes.append(os.path.getsize(path))
+            except OSError:
+                sizes.append(0)
+        total = sum(sizes)
+        done = [0]
+        lock = threading.Lock()
+        # files of the same size are imported one at a time, so that identical files in the batch are only copied once
+        size_locks = {size: threading.Lock() for size in sizes}
+
+        def on_chunk(length: int) -> None:
+            if cancel_event is not None and cancel_event.is_set():
+                raise Export.SyncCancelled()
+            with lock:
+                done[0] += length
+                done_bytes = done[0]
+            if progress is not None:
+                progress(done_bytes, total)
+
+        def import_one(index: int) -> str:
+            path, name = files[index]
+            error = ""
+            try:
+                if cancel_event is not None and cancel_event.is_set():
+                    raise Export.SyncCancelled()
+                with size_locks[sizes[index]]:
+                    result = self._import_file(path, name, on_chunk)
+            except Export.SyncCancelled:
+                result, error = "", "cancelled"
+            except OSError as os_error:
+                result, error = "", "{}: {}".format(os.path.basename(path), os_error.strerror or os_error)
+            if on_done is not None:
+                on_done(index, result, error)
+            return result
+
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            return list(executor.map(import_one, range(len(files))))
+
+    def import_bytes(self, data: bytes, name: str) -> str:
+        """
+        Writes data to the attachments folder unless an attachment with the same content exists
+        :param data: content of the attachment
+        :param name: file name to give the attachment if it is written
+        :return: the file name of the attachment to reference
+        """
+        self.refresh()
+        content_hash = hashlib.sha256(data).hexdigest()
+        existing = self.find(content_hash, len(data))
+        if existing is not None:
+            return existing
+        name = self._reserve_name(name)
+        try:
+            with open(os.path.join(self.attachments_dir, name), "wb") as attachment:
+                attachment.write(data)
+        finally:
+            with self._lock:
+                self._reserved.discard(name)
+        self.add(name, content_hash)
+        return name
+
+    def dedupe(self, entries_dir: str, progress: Optional[Callable[[int, int], None]] = None,
+               cancel_event: Optional[threading.Event] = None) -> DedupeStats:
+        """
+        Removes attachments whose content is identical to another attachment, keeping the first by name, and points
+        references in the entries to the attachment that was kept. Only files that share a size are hashed.
+        :param entries_dir: folder containing the entries
+        :param progress: called with the number of files hashed and entries read, and the total number of both
+        :param cancel_event: stops the pass when set; nothing is removed once it is cancelled
+        :return: statistics about the pass
+        """
+        self.refresh()
+        stats = DedupeStats()
+        by_size: Dict[int, List[AttachmentFile]] = {}
+        with self._lock:
+            for file in self._files.values():
+                by_size.setdefault(file.size, []).append(file)
+        candidates = [files for files in by_size.values() if len(files) > 1]
+        entry_names = [name for name in os.listdir(entries_dir) if name.endswith(".md") and not name.startswith(".")]
+        total = sum(len(files) for files in candidates) + len(entry_names)
+        done = 0
+        replacements: Dict[str, str] = {}
+        for files in candidates:
+            kept: Dict[str, str] = {}
+            for file in sorted(files, key=lambda file: file.name):
+                if cancel_event is not None and cancel_event.is_set():
+                    stats.cancelled = True
+                    return stats
+                content_hash = self._hash_of(file)
+                done += 1
+                if progress is not None:
+                    progress(done, total)
+                if content_hash is None:
+                    continue
+                if content_hash in kept:
+                    replacements[file.name] = kept[content_hash]
+                else:
+                    kept[content_hash] = file.name
+        if not replacements:
+            return stats
+        # references are only rewritten before the duplicates are removed, so an interrupted pass loses nothing
+        pattern = re.compile(r"\.\./attachments/(" + "|".join(re.escape(name) for name in replacements) + r")(?=\))")
+        for name in entry_names:
+            if cancel_event is not None and cancel_event.is_set():
+                stats.cancelled = True
+                return stats
+            path = os.path.join(entries_dir, name)
+            done += 1
+            if progress is not None:
+                progress(done, total)
+            try:
+                with open(path, encoding="utf8", newline="") as entry:
+                    text = entry.read()
+            except FileNotFoundError:
+                continue
+            if "../attachments/" not in text:
+                continue
+            new_text = pattern.sub(lambda match: "../attachments/" + replacements[match.group(1)], text)
+            if new_text != text:
+                Journal.save_text_atomically(path, new_text, newline="")
+                stats.entries_updated += 1
+        removed = []
+        for name in replacements:
+            try:
+                os.remove(os.path.join(self.attachments_dir, name))
+            except OSError:
+                continue
+            stats.removed.append(name)
+            with self._lock:
+                stats.bytes_reclaimed += self._files.pop(name).size
+            removed.append(name)
+        self._save([], removed)
+        return stats
+
+    def close(self) -> None:
+        if self._db is not None:
+            self._db.close()
+            self._db = None
@@ -0,0 +1,51 @@
+"""
+Runs long operations on a background thread and reports their progress to the interface
+"""
+
+import threading
+
+from PyQt5.QtCore import QObject, pyqtSignal
+
+
+class BackgroundTask(QObject):
+    """
+    Runs a function on a background thread. The function is passed progress and cancel_event keyword arguments; it
+    should call progress(done, total) as it works and stop when cancel_event is set. Signals are delivered on the GUI
+    thread.
+    """
+    # emitted with the amount of work done and the total amount of work
+    progress = pyqtSignal(object, object)
+    # emitted with the return value of the function
+    finished = pyqtSignal(object)
+    # emitted with a description of the error if the function raised an exception
+    failed = pyqtSignal(str)
+
+    def __init__(self, parent=None):
+        super(BackgroundTask, self).__init__(parent)
+        self.cancel_event = threading.Event()
+        self.thread = None
+
+    def start(self, function, *args, **kwargs) -> None:
+        """
+        :param function: function to run
+        :param args: arguments of the function
+        :param kwargs: keyword arguments of the function
+        :return: None
+        """
+        self.thread = threading.Thread(target=self.run, args=(function, args, kwargs), name="BackgroundTask",
+                                       daemon=True)
+        self.thread.start()
+
+    def run(self, function, args, kwargs) -> None:
+        try:
+            result = function(*args, progress=self.progress.emit, cancel_event=self.cancel_event, **kwargs)
+        except Exception as error:
+            self.failed.emit(str(error))
+            return
+        self.finished.emit(result)
+
+    def cancel(self) -> None:
+        self.cancel_event.set()
+
+    def is_running(self) -> bool:
+        return self.thread is not None and self.thread.is_alive()
@@ -2,14 +2,13 @@
 Calendar for selecting entries by date
 """
 
-from datetime import datetime
-from typing import List
+from typing import Dict, List, Set, Tuple
 
 from PyQt5.QtCore import QDate, Qt, pyqtSignal
-from PyQt5.QtGui import QTextCharFormat, QCloseEvent
+from PyQt5.QtGui import QTextCharFormat, QCloseEvent, QShowEvent
 from PyQt5.QtWidgets import QCalendarWidget, QDesktopWidget
 
-import Utilities
+from EntryIndex import Entry
 
 
 class Calendar(QCalendarWidget):
@@ -22,27 +21,62 @@ class Calendar(QCalendarWidget):
         self.setSelectionMode(QCalendarWidget.SelectionMode.SingleSelection)
 
         desktop = QDesktopWidget()
-        self.resize(desktop.availableGeometry().size().width() * 0.5, desktop.availableGeometry().size().height() * 0.5)
+        self.resize(int(desktop.availableGeometry().size().width() * 0.5),
+                    int(desktop.availableGeometry().size().height() * 0.5))
 
         for weekend in (Qt.DayOfWeek.Sunday, Qt.DayOfWeek.Saturday):
             self.setWeekdayTextFormat(weekend, self.weekdayTextFormat(Qt.DayOfWeek.Wednesday))
 
-    def highlight_dates_with_entries(self, entries: List[str]) -> None:
+        self.entry_format = QTextCharFormat()
+        self.entry_format.setFontWeight(100)
+        self.entry_format.setFontUnderline(True)
+        # days that have at least one entry, grouped by (year, month)
+        self.entry_days: Dict[Tuple[int, int], Set[int]] = {}
+        # days that are currently highlighted, grouped by (year, month)
+        self.highlighted_days: Dict[Tuple[int, int], Set[int]] = {}
+
+        self.currentPageChanged.connect(lambda year, month: self.highlight_visible_months())
+
+    def highlight_dates_with_entries(self, entries: List[Entry]) -> None:
         """
-        Highlights the dates that contain at least one entry
-        :param entries: List of file names of entries
+        Stores the dates that contain at least one entry; only the months that are visible are highlighted
+        :param entries: entries from the entry index
         :return: None
         """
-        datetime_format_file = Utilities.replace_chars_for_file(Utilities.get_datetime_format())
-        length_formatted_date = len(datetime.now().strftime(datetime_format_file))
-        text_format = QTextCharFormat()
-        text_format.setFontWeight(100)
-        text_format.setFontUnderline(True)
-
+        entry_days = {}
         for entry in entries:
-            entry_datetime = datetime.strptime(entry[0:length_formatted_date], datetime_format_file)
-            qdate = QDate(entry_datetime.year, entry_datetime.month, entry_datetime.day)
-            self.setDateTextFormat(qdate, text_format)
+            if entry.timestamp:
+                entry_days.setdefault((entry.timestamp.year, entry.timestamp.month), set()).add(entry.timestamp.day)
+        self.entry_days = entry_days
+        if self.isVisible():
+            self.highlight_visible_months()
+
+    def highlight_visible_months(self) -> None:
+        """
+        Highlights the days with entries in the shown month and in the neighbouring months, whose first and last days
+        are also shown, and removes highlights from days that no longer have entries
+        :return: None
+        """
+        page = QDate(self.yearShown(), self.monthShown(), 1)
+        for month_offset in (-1, 0, 1):
+            month = page.addMonths(month_offset)
+            key = (month.year(), month.month())
+            days = self.entry_days.get(key, set())
+            highlighted = self.highlighted_days.get(key, set())
+            for day in highlighted - days:
+                self.setDateTextFormat(QDate(key[0], key[1], day), QTextCharFormat())
+            for day in days - highlighted:
+                self.setDateTextFormat(QDate(key[0], key[1], day), self.entry_format)
+            self.highlighted_days[key] = set(days)
+
+    def showEvent(self, event: QShowEvent) -> None:
+        """
+        Overrides showEvent to highlight the visible months, since highlights are not updated while hidden
+        :param event: QShowEvent
+        :return: None
+        """
+        self.highlight_visible_months()
+        super().showEvent(event)
 
     def closeEvent(self, event: QCloseEvent) -> None:
         """
@@ -0,0 +1,171 @@
+"""
+Command line interface for batch work on a journal without starting the interface: exporting, indexing, statistics and
+adding entries. Has no Qt dependency, so that it starts quickly and runs without a display.
+
+Usage: asdf-journal.py [--journal FOLDER] export <folder> [--html [--workers N]] [--no-attachments]
+       asdf-journal.py [--journal FOLDER] index [--rebuild]
+       asdf-journal.py [--journal FOLDER] stats
+       asdf-journal.py [--journal FOLDER] new [--title TITLE] [--text TEXT] [--attach FILE ...]
+"""
+
+import argparse
+import os
+import sys
+import time
+from collections import Counter
+from typing import List
+
+import Journal
+
+
+def format_size(size: int) -> str:
+    """
+    :param size: size in bytes
+    :return: the size in the largest unit it is at least one of
+    """
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return "{:.0f} {}".format(size, unit) if unit == "B" else "{:.1f} {}".format(size, unit)
+        size /= 1024
+
+
+def check_journal() -> bool:
+    """
+    :return: whether the journal has an entries folder; prints an error if not
+    """
+    if not Journal.get_journal_dir() or not os.path.isdir(Journal.get_entries_dir()):
+        print("error: no journal at \"{}\"; open one in the app or pass --journal".format(Journal.get_journal_dir()),
+              file=sys.stderr)
+        return False
+    return True
+
+
+def export(args: argparse.Namespace) -> int:
+    import Export
+    start = time.perf_counter()
+    # entries edited in place do not change the mtime of the entries folder, which the index relies on
+    Journal.get_entry_index().refresh(force=True)
+    if args.html:
+        site, attachments_dir = Journal.export_site(args.folder, workers=args.workers)
+        print("entries: {} converted, {} unchanged, {} removed, {} index pages in {:.2f} s ({:.0f} entries/s)".format(
+            site.converted, site.skipped, site.removed, site.index_pages, site.seconds, site.entries_per_second))
+        for name in site.failed:
+            print("error: could not convert entry {}".format(name), file=sys.stderr)
+        failed = bool(site.failed)
+    else:
+        stats, attachments_dir = Journal.export_journal(args.folder)
+        print("entries: {} written, {} rewritten, {} unchanged, {} written".format(
+            stats.written, stats.patched, stats.skipped, format_size(stats.bytes_written)))
+        failed = False
+    if not args.no_attachments and os.path.isdir(Journal.get_attachments_dir()):
+        sync = Export.sync_attachments(Journal.get_attachments_dir(), attachments_dir,
+                                       Journal.get_attachment_export_mode())
+        print("attachments: {} copied, {} linked, {} unchanged, {} copied".format(
+            sync.copied, sync.linked, sync.skipped, format_size(sync.bytes_copied)))
+        for name in sync.failed:
+            print("error: could not export attachment {}".format(name), file=sys.stderr)
+        failed = failed or bool(sync.failed)
+    print("exported to {} in {:.2f} s".format(os.path.dirname(attachments_dir), time.perf_counter() - start))
+    return 1 if failed else 0
+
+
+def index(args: argparse.Namespace) -> int:
+    import EntryIndex
+    import SearchIndex
+    start = time.perf_counter()
+    if args.rebuild:
+        # nothing has opened the indexes yet, so removing them makes every entry be read again; their journal files
+        # are removed too, or SQLite would replay them into the new databases
+        for name in (EntryIndex.INDEX_FILE_NAME, SearchIndex.SEARCH_FILE_NAME):
+            for suffix in ("", "-wal", "-shm", "-journal"):
+                path = os.path.join(Journal.get_journal_dir(), name + suffix)
+                if os.path.exists(path):
+                    os.remove(path)
+    entries = Journal.get_entry_index().entries()
+    search_index = SearchIndex.SearchIndex(Journal.get_journal_dir())
+    if not search_index.available:
+        print("warning: full-text search is not available with this sqlite", file=sys.stderr)
+    try:
+        search_index.sync(entries)
+        search_index.wait()
+    finally:
+        search_index.close()
+    print("indexed {} entries in {:.2f} s".format(len(entries), time.perf_counter() - start))
+    return 0
+
+
+def stats(args: argparse.Namespace) -> int:
+    entries = Journal.get_entry_index().entries()
+    timestamps = [entry.timestamp for entry in entries if entry.timestamp is not None]
+    print("entries: {}".format(len(entries)))
+    print("size: {}".format(format_size(sum(entry.size for entry in entries))))
+    if timestamps:
+        print("first: {}".format(min(timestamps).strftime(Journal.get_datetime_format())))
+        print("last: {}".format(max(timestamps).strftime(Journal.get_datetime_format())))
+        for year, count in sorted(Counter(timestamp.year for timestamp in timestamps).items()):
+            print("  {}: {}".format(year, count))
+    attachments = 0
+    attachments_size = 0
+    if os.path.isdir(Journal.get_attachments_dir()):
+        with os.scandir(Journal.get_attachments_dir()) as scan:
+            for dir_entry in scan:
+                if dir_entry.is_file():
+                    attachments += 1
+                    attachments_size += dir_entry.stat().st_size
+    print("attachments: {} ({})".format(attachments, format_size(attachments_size)))
+    return 0
+
+
+def new(args: argparse.Namespace) -> int:
+    text = sys.stdin.read() if args.text == "-" else args.text or ""
+    for path in args.attach:
+        if not os.path.isfile(path):
+            print("error: no file at \"{}\"".format(path), file=sys.stderr)
+            return 1
+    if args.attach:
+        os.makedirs(Journal.get_attachments_dir(), exist_ok=True)
+        text = (text.rstrip("\n") + "\n\n" if text else "") + Journal.copy_files_to_attachments(args.attach)
+    print(Journal.new_entry(args.title, text))
+    return 0
+
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="asdf-journal", description="Works on a journal without the interface")
+    parser.add_argument("--journal", help="folder of the journal; the journal open in the app by default")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = commands.add_parser("export", help="export the journal as a single markdown file")
+    export_parser.add_argument("folder", help="folder to export to")
+    export_parser.add_argument("--html", action="store_true", help="export a static HTML site instead")
+    export_parser.add_argument("--workers", type=int, help="number of processes converting entries to HTML; every "
+                                                           "core by default")
+    export_parser.add_argument("--no-attachments", action="store_true", help="do not export the attachments")
+    export_parser.set_defaults(run=export)
+
+    index_parser = commands.add_parser("index", help="bring the entry and search indexes up to date")
+    index_parser.add_argument("--rebuild", action="store_true", help="rescan every entry")
+    index_parser.set_defaults(run=index)
+
+    commands.add_parser("stats", help="show statistics about the journal").set_defaults(run=stats)
+
+    new_parser = commands.add_parser("new", help="add an entry and print its path")
+    new_parser.add_argument("--title", default="", help="title of the entry")
+    new_parser.add_argument("--text", help="text of the entry, or - to read it from standard input")
+    new_parser.add_argument("--attach", nargs="+", default=[], metavar="FILE", help="files to attach to the entry")
+    new_parser.set_defaults(run=new)
+    return parser.parse_args(argv)
+
+
+def main(argv: List[str]) -> int:
+    """
+    Runs a command
+    :param argv: the command line arguments, without the program name
+    :return: the exit status
+    """
+    args = parse_args(argv)
+    Journal.create_default_settings()
+    if args.journal:
+        Journal.use_journal(os.path.abspath(args.journal))
+    if not check_journal():
+        return 1
+    return args.run(args)
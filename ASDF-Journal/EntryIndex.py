@@ -0,0 +1,247 @@
+"""
+Persistent index of the entries in a journal, stored as a SQLite sidecar in the journal folder
+"""
+
+import bisect
+import os
+import sqlite3
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+import Journal
+import Tracing
+
+INDEX_FILE_NAME = ".journal_index.sqlite"
+ENTRY_EXTENSION = ".md"
+# directory mtimes newer than this many seconds are not trusted, since changes made within the filesystem's timestamp
+# granularity would not be detected
+MTIME_GRACE_SECONDS = 2.0
+
+
+def parse_entry_datetime(name: str, datetime_format: str) -> Optional[datetime]:
+    """
+    Parses the timestamp at the start of an entry file name
+    :param name: file name of the entry
+    :param datetime_format: the datetime format from data.json
+    :return: the timestamp, or None if the file name does not start with one
+    """
+    file_format = Journal.replace_chars_for_file(datetime_format)
+    length = len(datetime.now().strftime(file_format))
+    try:
+        return datetime.strptime(name[0:length], file_format)
+    except ValueError:
+        return None
+
+
+def entry_display_text(name: str) -> str:
+    """
+    :param name: file name of an entry
+    :return: the text shown for the entry in the entry selector
+    """
+    return os.path.splitext(name)[0].replace("_", " ")
+
+
+class Entry:
+    """
+    A single journal entry in the index
+    """
+    __slots__ = ("name", "timestamp", "title", "size", "mtime")
+
+    def __init__(self, name: str, timestamp: Optional[datetime], title: str, size: int, mtime: int):
+        self.name = name
+        self.timestamp = timestamp
+        self.title = title
+        self.size = size
+        self.mtime = mtime
+
+
+class EntryIndex:
+    """
+    Keeps the name, timestamp, title, size and mtime of every entry. The entries directory is only rescanned when its
+    mtime changes, and only entries whose stat data changed are re-parsed.
+    """
+
+    def __init__(self, journal_dir: str, datetime_format: str):
+        self.journal_dir = journal_dir
+        self.entries_dir = os.path.join(journal_dir, "entries")
+        self.datetime_format = datetime_format
+        self._entries: Dict[str, Entry] = {}
+        self._sorted: List[Entry] = []
+        # names of the sorted entries, to find an entry with bisect
+        self._names: List[str] = []
+        self._dir_mtime = None
+        self._db = None
+        # functions called with (updated entries, removed names) whenever the index changes
+        self.listeners: List[Callable[[List[Entry], List[str]], None]] = []
+        self._open_db()
+        self._load()
+
+    def _open_db(self) -> None:
+        """
+        Opens the index database; the index is kept in memory only if the journal folder is not writable
+        :return: None
+        """
+        if not os.path.isdir(self.entries_dir):
+            return
+        try:
+            # the index may be opened on a background thread and then used on the GUI thread, never at the same time
+            self._db = sqlite3.connect(os.path.join(self.journal_dir, INDEX_FILE_NAME), check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            self._db.execute("CREATE TABLE IF NOT EXISTS entries (name TEXT PRIMARY KEY, timestamp TEXT, title TEXT, "
+                             "size INTEGER, mtime INTEGER)")
+            self._db.commit()
+        except sqlite3.Error:
+            self._db = None
+
+    def _load(self) -> None:
+        """
+        Loads the stored index into memory
+        :return: None
+        """
+        if self._db is None:
+            return
+        try:
+            meta = dict(self._db.execute("SELECT key, value FROM meta"))
+            if meta.get("datetime_format") != self.datetime_format:
+                # timestamps were parsed with a different format, so they all need to be parsed again
+                with self._db:
+                    self._db.execute("DELETE FROM entries")
+                return
+            for name, timestamp, title, size, mtime in self._db.execute(
+                    "SELECT name, timestamp, title, size, mtime FROM entries"):
+                self._entries[name] = Entry(name, datetime.fromisoformat(timestamp) if timestamp else None, title,
+                                            size, mtime)
+            self._dir_mtime = int(meta["dir_mtime"]) if meta.get("dir_mtime") else None
+        except (sqlite3.Error, ValueError):
+            self._entries.clear()
+            self._dir_mtime = None
+        self._sort()
+
+    def _sort(self) -> None:
+        self._sorted = sorted(self._entries.values(), key=lambda entry: entry.name)
+        self._names = [entry.name for entry in self._sorted]
+
+    def _make_entry(self, name: str, stat_result: os.stat_result) -> Entry:
+        timestamp = parse_entry_datetime(name, self.datetime_format)
+        title = os.path.splitext(name)[0]
+        if timestamp:
+            title = title[len(timestamp.strftime(Journal.replace_chars_for_file(self.datetime_format))):]
+        return Entry(name, timestamp, title.replace("_", " ").strip(), stat_result.st_size, stat_result.st_mtime_ns)
+
+    def refresh(self, force: bool = False) -> bool:
+        """
+        Brings the index up to date with the entries directory
+        :param force: rescan even if the directory mtime has not changed
+        :return: True if any entries were added, removed or changed
+        """
+        try:
+            dir_mtime = os.stat(self.entries_dir).st_mtime_ns
+        except OSError:
+            removed = list(self._entries)
+            self._entries.clear()
+            self._sorted = []
+            self._names = []
+            self._notify([], removed)
+            return bool(removed)
+        recent = time.time() - dir_mtime / 1e9 < MTIME_GRACE_SECONDS
+        if not force and not recent and dir_mtime == self._dir_mtime:
+            return False
+
+        updated = []
+        seen = set()
+        with Tracing.span("scan entries", "index"), os.scandir(self.entries_dir) as scan:
+            for dir_entry in scan:
+                # hidden files, such as temporary files of atomic saves, were never listed by glob("*.md")
+                if not dir_entry.name.endswith(ENTRY_EXTENSION) or dir_entry.name.startswith(".") or \
+                        not dir_entry.is_file():
+                    continue
+                seen.add(dir_entry.name)
+                stat_result = dir_entry.stat()
+                entry = self._entries.get(dir_entry.name)
+                if entry is None or entry.size != stat_result.st_size or entry.mtime != stat_result.st_mtime_ns:
+                    entry = self._make_entry(dir_entry.name, stat_result)
+                    self._entries[entry.name] = entry
+                    updated.append(entry)
+        removed = [name for name in self._entries if name not in seen]
+        for name in removed:
+            del self._entries[name]
+
+        if updated or removed:
+            self._sort()
+        self._dir_mtime = dir_mtime
+        self._store(updated, removed)
+        self._notify(updated, removed)
+        return bool(updated or removed)
+
+    def update_entry(self, path: str) -> None:
+        """
+        Updates a single entry after it has been written, without rescanning the directory
+        :param path: path of the entry
+        :return: None
+        """
+        name = os.path.basename(path)
+        try:
+            stat_result = os.stat(path)
+        except OSError:
+            if self._entries.pop(name, None):
+                self._sort()
+                self._store([], [name])
+                self._notify([], [name])
+            return
+        is_new = name not in self._entries
+        entry = self._make_entry(name, stat_result)
+        self._entries[name] = entry
+        if is_new:
+            self._sort()
+        else:
+            self._sorted[bisect.bisect_left(self._names, name)] = entry
+        self._store([entry], [])
+        self._notify([entry], [])
+
+    def _notify(self, updated: List[Entry], removed: List[str]) -> None:
+        if updated or removed:
+            for listener in self.listeners:
+                listener(updated, removed)
+
+    def _store(self, updated: List[Entry], removed: List[str]) -> None:
+        """
+        Writes changes to the index database in a single transaction
+        :return: None
+        """
+        if self._db is None:
+            return
+        try:
+            with self._db:
+                self._db.executemany("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+                                     [(entry.name, entry.timestamp.isoformat() if entry.timestamp else None,
+                                       entry.title, entry.size, entry.mtime) for entry in updated])
+                self._db.executemany("DELETE FROM entries WHERE name = ?", [(name,) for name in removed])
+                self._db.executemany("INSERT OR REPLACE INTO meta VALUES (?, ?)",
+                                     [("datetime_format", self.datetime_format),
+                                      ("dir_mtime", str(self._dir_mtime) if self._dir_mtime else "")])
+        except sqlite3.Error:
+            pass
+
+    def entries(self) -> List[Entry]:
+        """
+        :return: all entries sorted by file name (oldest first)
+        """
+        return self._sorted
+
+    def names(self) -> List[str]:
+        """
+        :return: file names of all entries sorted oldest first
+        """
+        return list(self._names)
+
+    def path(self, entry: Entry) -> str:
+        """
+        :return: the full path of an entry
+        """
+        return os.path.join(self.entries_dir, entry.name)
+
+    def close(self) -> None:
+        if self._db is not None:
+            self._db.close()
+            self._db = None
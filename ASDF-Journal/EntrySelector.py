@@ -2,30 +2,230 @@
 List of entries in the journal that the user can select from
 """
 
-import glob
+import bisect
 import os
-from datetime import datetime
-from typing import List
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
 
-from PyQt5.QtCore import QDate, Qt, QPoint
+from PyQt5.QtCore import QDate, Qt, QPoint, QFileSystemWatcher, QTimer, QAbstractListModel, QModelIndex, pyqtSignal
 from PyQt5.QtGui import QFont
-from PyQt5.QtWidgets import QListWidget, QAbstractItemView, QMenu, QAction, QListWidgetItem, QInputDialog
+from PyQt5.QtWidgets import QListView, QAbstractItemView, QMenu, QAction, QInputDialog, QLineEdit
 
 import Utilities
+from EntryIndex import Entry, entry_display_text, parse_entry_datetime
+from SearchIndex import SearchIndex
 
 
-class EntrySelector(QListWidget):
+class EntryListModel(QAbstractListModel):
+    """
+    Model of the entries in the journal, newest first, or of the results of a search, best match first. Only the file
+    names are stored; the display text and path of a row are derived when the view asks for them. Rows are handed to
+    the view in pages as it scrolls.
+    """
+    PAGE_SIZE = 1000
+
+    def __init__(self, parent=None):
+        super(EntryListModel, self).__init__(parent)
+        self.entries_dir = ""
+        # file names sorted oldest first; row r of the model is names[len(names) - 1 - r]
+        self.names: List[str] = []
+        # file names of search results in the order they are displayed, or None when not searching
+        self.filter_names: Optional[List[str]] = None
+        self.filter_rows: Dict[str, int] = {}
+        self.loaded = 0
+
+    def set_entries(self, entries_dir: str, names: List[str]) -> None:
+        """
+        Replaces all of the entries in the model
+        :param entries_dir: directory containing the entries
+        :param names: file names of the entries sorted oldest first
+        :return: None
+        """
+        self.beginResetModel()
+        self.entries_dir = entries_dir
+        self.names = names
+        self.filter_names = None
+        self.filter_rows = {}
+        self.loaded = min(self.PAGE_SIZE, len(names))
+        self.endResetModel()
+
+    def set_filter(self, names: Optional[List[str]]) -> None:
+        """
+        Shows only the given entries, in the given order
+        :param names: file names of the entries to show, or None to show all entries
+        :return: None
+        """
+        self.beginResetModel()
+        self.filter_names = names
+        self.filter_rows = {name: row for row, name in enumerate(names)} if names is not None else {}
+        self.loaded = min(self.PAGE_SIZE, self.entry_count())
+        self.endResetModel()
+
+    def is_filtered(self) -> bool:
+        return self.filter_names is not None
+
+    def rowCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        return 0 if parent.isValid() else self.loaded
+
+    def data(self, index: QModelIndex, role: int = Qt.DisplayRole):
+        if not index.isValid() or index.row() >= self.loaded:
+            return None
+        if role == Qt.DisplayRole:
+            return entry_display_text(self.name(index.row()))
+        if role == Qt.UserRole:
+            return self.path(index.row())
+        return None
+
+    def canFetchMore(self, parent: QModelIndex) -> bool:
+        return not parent.isValid() and self.loaded < self.entry_count()
+
+    def fetchMore(self, parent: QModelIndex) -> None:
+        if parent.isValid():
+            return
+        self.ensure_loaded(self.loaded + self.PAGE_SIZE - 1)
+
+    def ensure_loaded(self, row: int) -> None:
+        """
+        Makes sure that the given row has been handed to the view
+        :param row: row that needs to be available
+        :return: None
+        """
+        new_loaded = min(self.entry_count(), max(row + 1, self.loaded))
+        if new_loaded > self.loaded:
+            self.beginInsertRows(QModelIndex(), self.loaded, new_loaded - 1)
+            self.loaded = new_loaded
+            self.endInsertRows()
+
+    def entry_count(self) -> int:
+        """
+        :return: number of entries shown, including rows that have not been fetched by the view yet
+        """
+        return len(self.filter_names) if self.filter_names is not None else len(self.names)
+
+    def name(self, row: int) -> str:
+        if self.filter_names is not None:
+            return self.filter_names[row]
+        return self.names[len(self.names) - 1 - row]
+
+    def path(self, row: int) -> str:
+        return os.path.join(self.entries_dir, self.name(row))
+
+    def row_of(self, name: str) -> int:
+        """
+        :param name: file name of an entry
+        :return: the row of the entry, or -1 if it is not shown
+        """
+        if self.filter_names is not None:
+            return self.filter_rows.get(name, -1)
+        i = bisect.bisect_left(self.names, name)
+        if i < len(self.names) and self.names[i] == name:
+            return len(self.names) - 1 - i
+        return -1
+
+    def row_for_date(self, day: datetime, datetime_format: str) -> int:
+        """
+        Finds the first entry on the given day with a binary search over the file names, which sort by timestamp. If
+        there is no entry on that day, the closest entry before or after it is used instead. Only valid when the model
+        is not filtered.
+        :param day: midnight of the day to find
+        :param datetime_format: the datetime format from data.json
+        :return: the row of the entry, or -1 if there are no entries
+        """
+        if not self.names:
+            return -1
+        next_day = day + timedelta(days=1)
+        i = bisect.bisect_left(self.names, day.strftime(Utilities.replace_chars_for_file(datetime_format)))
+        after = parse_entry_datetime(self.names[i], datetime_format) if i < len(self.names) else None
+        before = parse_entry_datetime(self.names[i - 1], datetime_format) if i > 0 else None
+        if after is None and before is None:
+            # no timestamped neighbours, so fall back to the entry after the day or else the newest entry
+            return max(len(self.names) - 1 - i, 0)
+        if before is None or (after is not None and (after < next_day or after - next_day <= day - before)):
+            return len(self.names) - 1 - i
+        return len(self.names) - i
+
+    def insert_name(self, name: str) -> None:
+        i = bisect.bisect_left(self.names, name)
+        if i < len(self.names) and self.names[i] == name:
+            return
+        row = len(self.names) - i
+        if self.filter_names is None and row < self.loaded:
+            self.beginInsertRows(QModelIndex(), row, row)
+            self.names.insert(i, name)
+            self.loaded += 1
+            self.endInsertRows()
+        else:
+            self.names.insert(i, name)
+
+    def remove_name(self, name: str) -> None:
+        i = bisect.bisect_left(self.names, name)
+        if i >= len(self.names) or self.names[i] != name:
+            return
+        if self.filter_names is not None:
+            del self.names[i]
+            row = self.filter_rows.get(name, -1)
+            if 0 <= row < self.loaded:
+                self.beginRemoveRows(QModelIndex(), row, row)
+                del self.filter_names[row]
+                self.loaded -= 1
+                self.endRemoveRows()
+            elif row >= 0:
+                del self.filter_names[row]
+            self.filter_rows = {name: row for row, name in enumerate(self.filter_names)}
+            return
+        row = len(self.names) - 1 - i
+        if row < self.loaded:
+            self.beginRemoveRows(QModelIndex(), row, row)
+            del self.names[i]
+            self.loaded -= 1
+            self.endRemoveRows()
+        else:
+            del self.names[i]
+
+
+class EntrySelector(QListView):
+    # emitted with the paths of the new and previous current entries
+    current_entry_changed = pyqtSignal(str, str)
+
     def __init__(self, parent):
         super(EntrySelector, self).__init__(parent)
         self.setSelectionMode(QAbstractItemView.SelectionMode.SingleSelection)
+        self.setUniformItemSizes(True)
         font = QFont()
         font.setFamily("Verdana")
         font.setPointSize(14)
         self.setFont(font)
 
+        self.entry_model = EntryListModel(self)
+        self.setModel(self.entry_model)
+        self.current_path = ""
+        self.selectionModel().currentChanged.connect(self.current_index_changed)
+        self.entry_model.modelReset.connect(self.model_reset)
+
         self.setContextMenuPolicy(Qt.CustomContextMenu)
         self.customContextMenuRequested.connect(self.showContextMenu)
 
+        self.entry_index = None
+        self.search_index = None
+
+        # Search box shown by the main window; the list is filtered to the results as the user types
+        self.search_box = QLineEdit()
+        self.search_box.setPlaceholderText("Search entries")
+        self.search_box.setClearButtonEnabled(True)
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(150)
+        self.search_timer.timeout.connect(self.apply_search)
+        self.search_box.textChanged.connect(lambda: self.search_timer.start())
+
+        # Watches the entries directory so that changes made outside the app show up; events are batched by the timer
+        self.watcher = QFileSystemWatcher(self)
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setSingleShot(True)
+        self.refresh_timer.setInterval(100)
+        self.refresh_timer.timeout.connect(self.update_entry_selector)
+        self.watcher.directoryChanged.connect(lambda: self.refresh_timer.start())
+
     def showContextMenu(self, pos: QPoint) -> None:
         global_pos = self.mapToGlobal(pos)
 
@@ -44,40 +244,180 @@ class EntrySelector(QListWidget):
         name, confirm = QInputDialog.getText(self, "Rename Entry", "", text=os.path.splitext(os.path.basename(entry_path))[0])
 
         if confirm:
-            os.rename(entry_path, os.path.join(os.path.dirname(entry_path), name) + ".md")
+            new_path = os.path.join(os.path.dirname(entry_path), name) + ".md"
+            os.rename(entry_path, new_path)
             self.update_entry_selector()
+            self.select_entry(new_path)
 
     def delete_current_entry(self) -> None:
-        os.remove(os.path.join(Utilities.get_entries_dir(), self.currentItem().text()))
-        self.takeItem(self.currentRow())
+        os.remove(self.current_entry_path())
+        self.update_entry_selector()
+
+    def current_index_changed(self, current: QModelIndex, previous: QModelIndex) -> None:
+        """
+        Emits current_entry_changed with paths, since the previous index is no longer valid if its row was removed
+        :return: None
+        """
+        previous_path = self.current_path
+        self.current_path = (current.data(Qt.UserRole) or "") if current.isValid() else ""
+        if self.current_path != previous_path:
+            self.current_entry_changed.emit(self.current_path, previous_path)
+
+    def model_reset(self) -> None:
+        """
+        Clears the current entry when the model is reset, since the selection model does not report it
+        :return: None
+        """
+        if self.current_path:
+            previous_path = self.current_path
+            self.current_path = ""
+            self.current_entry_changed.emit("", previous_path)
 
     def update_entry_selector(self) -> None:
         """
-        Updates the entry selector when a new journal is opened
+        Updates the entry selector to match the entries directory. Only the entries that were added or removed are
+        changed, unless a different journal was opened, in which case the list is rebuilt.
         :return: None
         """
-        self.clear()
         entries_dir = Utilities.get_entries_dir()
 
         if not Utilities.get_journal_dir():
+            self.reset_entries()
             return
 
         if not os.path.isdir(entries_dir):
+            self.reset_entries()
             Utilities.alert_user("Selected folder does not contain a journal.")
             return
 
-        for entry in sorted(glob.glob(os.path.join(entries_dir, "*.md")), reverse=True):
+        # getting the index refreshes it, which applies any changes to the current index through apply_index_changes
+        entry_index = Utilities.get_entry_index()
+        if entry_index is self.entry_index:
+            return
 
-            entry_item = QListWidgetItem(self)
-            entry_item.setText(os.path.splitext(os.path.basename(entry))[0].replace("_", " "))
-            entry_item.setData(Qt.UserRole, entry)
-            self.addItem(entry_item)
+        self.reset_entries()
+        self.entry_index = entry_index
+        self.entry_index.listeners.append(self.apply_index_changes)
+        self.search_index = SearchIndex(Utilities.get_journal_dir())
+        self.search_index.sync(entry_index.entries())
+        self.watcher.addPath(entries_dir)
+        self.entry_model.set_entries(entries_dir, entry_index.names())
 
-        if self.count():
-            self.setCurrentRow(0)
+        if self.entry_model.entry_count():
+            self.set_current_row(0)
+
+    def reset_entries(self) -> None:
+        """
+        Clears the list and stops listening to the previous journal
+        :return: None
+        """
+        if self.entry_index is not None and self.apply_index_changes in self.entry_index.listeners:
+            self.entry_index.listeners.remove(self.apply_index_changes)
+        self.entry_index = None
+        if self.search_index is not None:
+            self.search_index.close()
+            self.search_index = None
+        self.search_timer.stop()
+        self.search_box.blockSignals(True)
+        self.search_box.clear()
+        self.search_box.blockSignals(False)
+        if self.watcher.directories():
+            self.watcher.removePaths(self.watcher.directories())
+        self.entry_model.set_entries("", [])
+
+    def apply_index_changes(self, updated: List[Entry], removed: List[str]) -> None:
+        """
+        Inserts and removes rows for entries that were added to or removed from the index
+        :param updated: entries that were added or modified
+        :param removed: file names of entries that were removed
+        :return: None
+        """
+        for name in removed:
+            self.entry_model.remove_name(name)
+        for entry in updated:
+            self.entry_model.insert_name(entry.name)
+        if self.search_index is not None:
+            self.search_index.update(updated, removed)
+
+    def apply_search(self) -> None:
+        """
+        Filters the list to the entries matching the text in the search box
+        :return: None
+        """
+        text = self.search_box.text()
+        if text.strip() and self.search_index is not None:
+            self.set_filter(self.search_index.search(text))
+        elif self.entry_model.is_filtered():
+            self.set_filter(None)
+
+    def clear_search(self) -> None:
+        """
+        Clears the search box and shows all entries again
+        :return: None
+        """
+        self.search_timer.stop()
+        self.search_box.blockSignals(True)
+        self.search_box.clear()
+        self.search_box.blockSignals(False)
+        if self.entry_model.is_filtered():
+            self.set_filter(None)
+
+    def set_filter(self, names: Optional[List[str]]) -> None:
+        """
+        Filters the list while keeping the current entry if it is still shown, so that the editor is not reloaded on
+        every keystroke
+        :param names: file names of the entries to show, or None to show all entries
+        :return: None
+        """
+        previous_path = self.current_path
+        self.blockSignals(True)
+        self.entry_model.set_filter(names)
+        row = self.entry_model.row_of(os.path.basename(previous_path)) if previous_path else -1
+        if row < 0 and self.entry_model.entry_count():
+            row = 0
+        if row >= 0:
+            self.set_current_row(row)
+        self.blockSignals(False)
+        if self.current_path != previous_path:
+            self.current_entry_changed.emit(self.current_path, previous_path)
+
+    def select_entry(self, path: str) -> None:
+        """
+        Selects the entry with the given path if it is in the list
+        :param path: path of the entry
+        :return: None
+        """
+        row = self.entry_model.row_of(os.path.basename(path))
+        if row < 0 and self.entry_model.is_filtered():
+            self.clear_search()
+            row = self.entry_model.row_of(os.path.basename(path))
+        if row >= 0:
+            self.set_current_row(row)
+
+    def set_current_row(self, row: int) -> None:
+        """
+        Makes the entry at the given row current, fetching it into the view first if needed
+        :param row: the row to select
+        :return: None
+        """
+        self.entry_model.ensure_loaded(row)
+        self.setCurrentIndex(self.entry_model.index(row))
+
+    def current_row(self) -> int:
+        return self.currentIndex().row()
 
     def current_entry_path(self):
-        return self.currentItem().data(Qt.UserRole) if self.currentItem() else ""
+        return self.current_path
+
+    def neighbour_paths(self) -> List[str]:
+        """
+        :return: paths of the entries directly above and below the current one
+        """
+        row = self.current_row()
+        if row < 0:
+            return []
+        return [self.entry_model.path(neighbour) for neighbour in (row - 1, row + 1)
+                if 0 <= neighbour < self.entry_model.entry_count()]
 
     def navigate_direction(self, direction_up: bool) -> None:
         """
@@ -85,20 +425,17 @@ class EntrySelector(QListWidget):
         :param direction_up: whether to go up or down
         :return: None
         """
-        if direction_up and self.currentRow() > 0:
-            self.setCurrentRow(self.currentRow() - 1)
-        elif not direction_up and self.currentRow() < (self.count() - 1):
-            self.setCurrentRow(self.currentRow() + 1)
+        if direction_up and self.current_row() > 0:
+            self.set_current_row(self.current_row() - 1)
+        elif not direction_up and self.current_row() < (self.entry_model.entry_count() - 1):
+            self.set_current_row(self.current_row() + 1)
 
     def get_all_entries(self) -> List[str]:
         """
         Gets all entries in current journal
         :return: list of file names
         """
-        entries = []
-        for entry in sorted(glob.glob(os.path.join(Utilities.get_entries_dir(), "*.md"))):
-            entries.append(os.path.basename(entry))
-        return entries
+        return Utilities.get_entry_index().names()
 
     def set_entry_date(self, date: QDate) -> None:
         """
@@ -106,16 +443,8 @@ class EntrySelector(QListWidget):
         :param date: The date selected in the calendar
         :return: None
         """
-        calendar_datetime = datetime(date.year(), date.month(), date.day())
-        formatted_datetime = Utilities.replace_chars_for_file(
-            calendar_datetime.strftime(Utilities.get_datetime_format()))
-        formatted_datetime_length = len(datetime.now().strftime(Utilities.get_datetime_format()))
-        entries = sorted(glob.glob(os.path.join(Utilities.get_entries_dir(), "*.md")), reverse=True)
-        for i in range(len(entries)):
-            entries[i] = os.path.basename(entries[i])[0:formatted_datetime_length]
-
-        if entries:
-            i = len(entries) - 1
-            while i > 0 and entries[i] < formatted_datetime:
-                i -= 1
-            self.setCurrentRow(i)
+        self.clear_search()
+        row = self.entry_model.row_for_date(datetime(date.year(), date.month(), date.day()),
+                                            Utilities.get_datetime_format())
+        if row >= 0:
+            self.set_current_row(row)
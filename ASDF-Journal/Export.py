@@ -0,0 +1,401 @@
+"""
+Exports a journal as a single markdown file along with its attachments; has no Qt dependency so that it can be used and
+benchmarked without the interface
+"""
+
+import errno
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:
+    # not available on Windows, where attachments are always copied
+    fcntl = None
+
+import Tracing
+
+# size of the chunks copied from entries to the export file, and of the export file's write buffer
+COPY_BUFFER_SIZE = 1024 * 1024
+MANIFEST_NAME = ".export_manifest.json"
+MANIFEST_VERSION = 1
+# size of the chunks copied by the kernel when syncing attachments; cancellation and progress are checked between them
+SYNC_CHUNK_SIZE = 8 * 1024 * 1024
+SYNC_WORKERS = 4
+# how attachments are exported: copied, hard linked or reflinked (copy-on-write clones on btrfs, xfs and similar)
+ATTACHMENT_MODES = ("copy", "hardlink", "reflink")
+# ioctl that clones a file on Linux
+FICLONE = 0x40049409
+
+
+class ExportStats:
+    """
+    What an export did: how many entries were copied, rewritten in place or left untouched, and how many bytes written
+    """
+    __slots__ = ("written", "patched", "skipped", "bytes_written", "full")
+
+    def __init__(self):
+        self.written = 0
+        self.patched = 0
+        self.skipped = 0
+        self.bytes_written = 0
+        # whether the whole file had to be rewritten
+        self.full = False
+
+    def __repr__(self):
+        return "ExportStats(written={}, patched={}, skipped={}, bytes_written={}, full={})".format(
+            self.written, self.patched, self.skipped, self.bytes_written, self.full)
+
+
+def copy_entry(entry_path: str, output, buffer: memoryview) -> Tuple[int, int, str]:
+    """
+    Streams an entry into the export file through a reused buffer
+    :param entry_path: path of the entry
+    :param output: export file opened in binary mode
+    :param buffer: buffer to read into
+    :return: number of bytes copied, the mtime of the entry in nanoseconds and the hash of the entry
+    """
+    content_hash = hashlib.sha1()
+    size = 0
+    with open(entry_path, "rb", buffering=0) as entry_file:
+        mtime = os.fstat(entry_file.fileno()).st_mtime_ns
+        while True:
+            length = entry_file.readinto(buffer)
+            if not length:
+                break
+            content_hash.update(buffer[:length])
+            output.write(buffer[:length])
+            size += length
+    return size, mtime, content_hash.hexdigest()
+
+
+def hash_entry(entry_path: str, buffer: memoryview) -> str:
+    content_hash = hashlib.sha1()
+    with open(entry_path, "rb", buffering=0) as entry_file:
+        while True:
+            length = entry_file.readinto(buffer)
+            if not length:
+                break
+            content_hash.update(buffer[:length])
+    return content_hash.hexdigest()
+
+
+def load_manifest(manifest_path: str, output_path: str, separator: str) -> Optional[dict]:
+    """
+    :return: the manifest of the previous export, or None if it is missing or does not describe the export file
+    """
+    try:
+        with open(manifest_path, encoding="utf8") as manifest_file:
+            manifest = json.load(manifest_file)
+        output_size = os.path.getsize(output_path)
+    except (OSError, ValueError):
+        return None
+    if manifest.get("version") != MANIFEST_VERSION or manifest.get("separator") != separator or \
+            manifest.get("output_size") != output_size:
+        return None
+    return manifest
+
+
+def save_manifest(manifest_path: str, manifest: dict) -> None:
+    """
+    Atomically writes the manifest next to the export file
+    :return: None
+    """
+    fd, temp_path = tempfile.mkstemp(prefix=".export-", suffix=".json", dir=os.path.dirname(manifest_path))
+    try:
+        with os.fdopen(fd, "w", encoding="utf8") as temp_file:
+            # dumps uses the C encoder, which is several times faster than dump for large manifests
+            temp_file.write(json.dumps(manifest))
+        os.replace(temp_path, manifest_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def export_single_file(entries_dir: str, names: List[str], separator: str, output_path: str,
+                       manifest_path: Optional[str] = None) -> ExportStats:
+    """
+    Writes every entry, each preceded by the separator, into a single file. The offset, size, mtime and hash of each
+    entry are kept in a manifest, so a later export of the same journal only appends new entries, overwrites entries
+    that changed without changing length, and rewrites the file from the first entry that was added, removed or
+    resized. Entries are copied byte for byte.
+    :param entries_dir: folder containing the entries
+    :param names: file names of the entries in the order they are exported
+    :param separator: text written before each entry
+    :param output_path: path of the export file
+    :param manifest_path: path of the manifest; defaults to a hidden file next to the export file
+    :return: statistics about the export
+    """
+    if manifest_path is None:
+        manifest_path = os.path.join(os.path.dirname(output_path), MANIFEST_NAME)
+    separator_bytes = separator.encode("utf8")
+    # reused for every entry, since allocating a large buffer per read is slower than copying a small entry
+    buffer = memoryview(bytearray(COPY_BUFFER_SIZE))
+    manifest = load_manifest(manifest_path, output_path, separator)
+    previous = manifest["entries"] if manifest else []
+    stats = ExportStats()
+    stats.full = manifest is None
+    # [name, size, mtime_ns, hash, offset] of each exported entry; offset is where its separator starts
+    exported = []
+    # the manifest no longer describes the file while it is being modified, so an interrupted export starts over
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+    with open(output_path, "r+b" if manifest else "wb", buffering=COPY_BUFFER_SIZE) as output:
+        offset = 0
+        index = 0
+        # entries that kept their name and length stay where they are, and are overwritten in place if they changed
+        while index < len(names) and index < len(previous):
+            name, size, mtime, content_hash, old_offset = previous[index]
+            if names[index] != name:
+                break
+            entry_path = os.path.join(entries_dir, name)
+            stat_result = os.stat(entry_path)
+            if stat_result.st_size != size:
+                break
+            if stat_result.st_mtime_ns != mtime:
+                new_hash = hash_entry(entry_path, buffer)
+                if new_hash != content_hash:
+                    output.seek(old_offset + len(separator_bytes))
+                    _, _, content_hash = copy_entry(entry_path, output, buffer)
+                    stats.patched += 1
+                    stats.bytes_written += size
+                else:
+                    stats.skipped += 1
+            else:
+                stats.skipped += 1
+            exported.append([name, size, stat_result.st_mtime_ns, content_hash, offset])
+            offset += len(separator_bytes) + size
+            index += 1
+        # everything after the first entry that was added, removed or resized is rewritten
+        output.seek(offset)
+        output.truncate()
+        for name in names[index:]:
+            entry_path = os.path.join(entries_dir, name)
+            output.write(separator_bytes)
+            size, mtime, content_hash = copy_entry(entry_path, output, buffer)
+            exported.append([name, size, mtime, content_hash, offset])
+            offset += len(separator_bytes) + size
+            stats.written += 1
+            stats.bytes_written += len(separator_bytes) + size
+    save_manifest(manifest_path, {"version": MANIFEST_VERSION, "separator": separator, "output_size": offset,
+                                  "entries": exported})
+    return stats
+
+
+class SyncStats:
+    """
+    What an attachment sync did
+    """
+    __slots__ = ("copied", "linked", "skipped", "failed", "bytes_copied", "cancelled")
+
+    def __init__(self):
+        self.copied = 0
+        self.linked = 0
+        self.skipped = 0
+        # names of attachments that could not be exported
+        self.failed = []
+        self.bytes_copied = 0
+        self.cancelled = False
+
+    def __repr__(self):
+        return "SyncStats(copied={}, linked={}, skipped={}, failed={}, bytes_copied={}, cancelled={})".format(
+            self.copied, self.linked, self.skipped, len(self.failed), self.bytes_copied, self.cancelled)
+
+
+class SyncCancelled(Exception):
+    pass
+
+
+def file_hash(path: str) -> str:
+    content_hash = hashlib.sha1()
+    with open(path, "rb") as hashed_file:
+        while True:
+            chunk = hashed_file.read(COPY_BUFFER_SIZE)
+            if not chunk:
+                break
+            content_hash.update(chunk)
+    return content_hash.hexdigest()
+
+
+def is_synced(source: os.stat_result, source_path: str, destination_path: str) -> bool:
+    """
+    :return: whether the destination already holds the same file: the same inode, the same size and mtime, or the same
+    size and hash, in which case its mtime is updated so that the hash is not needed next time
+    """
+    try:
+        destination = os.stat(destination_path)
+    except OSError:
+        return False
+    if (destination.st_dev, destination.st_ino) == (source.st_dev, source.st_ino):
+        return True
+    if destination.st_size != source.st_size:
+        return False
+    if destination.st_mtime_ns == source.st_mtime_ns:
+        return True
+    if file_hash(source_path) == file_hash(destination_path):
+        os.utime(destination_path, ns=(source.st_atime_ns, source.st_mtime_ns))
+        return True
+    return False
+
+
+def kernel_copy(source_file, destination_file, size: int, on_chunk: Callable[[int], None]) -> None:
+    """
+    Copies a file in chunks, inside the kernel where possible: with copy_file_range, then sendfile, then falling back
+    to reads and writes if neither is supported for these files
+    :param source_file: source opened in binary mode
+    :param destination_file: destination opened in binary mode
+    :param size: size of the source
+    :param on_chunk: called with the number of bytes after each chunk; may raise SyncCancelled
+    :return: None
+    """
+    source_fd = source_file.fileno()
+    destination_fd = destination_file.fileno()
+    copied = 0
+    for name in ("copy_file_range", "sendfile"):
+        copy = getattr(os, name, None)
+        if copy is None or (name == "sendfile" and not sys.platform.startswith("linux")):
+            continue
+        try:
+            while copied < size:
+                if name == "copy_file_range":
+                    length = copy(source_fd, destination_fd, min(SYNC_CHUNK_SIZE, size - copied))
+                else:
+                    length = copy(destination_fd, source_fd, copied, min(SYNC_CHUNK_SIZE, size - copied))
+                if length == 0:
+                    return
+                copied += length
+                on_chunk(length)
+            return
+        except OSError as error:
+            if copied or error.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP,
+                                             errno.ENOTSUP, errno.EBADF):
+                raise
+    while True:
+        chunk = source_file.read(SYNC_CHUNK_SIZE)
+        if not chunk:
+            return
+        destination_file.write(chunk)
+        on_chunk(len(chunk))
+
+
+def export_attachment(source_path: str, destination_path: str, mode: str,
+                      on_chunk: Callable[[int], None]) -> bool:
+    """
+    Exports one attachment through a temporary file, so that an interrupted sync never leaves a partial attachment
+    :param source_path: path of the attachment
+    :param destination_path: path to export it to
+    :param mode: one of ATTACHMENT_MODES
+    :param on_chunk: called with the number of bytes after each copied chunk
+    :return: whether the attachment was linked instead of copied
+    """
+    directory, name = os.path.split(destination_path)
+    temp_path = os.path.join(directory, ".{}.partial".format(name))
+    if os.path.lexists(temp_path):
+        os.remove(temp_path)
+    try:
+        if mode == "hardlink":
+            try:
+                os.link(source_path, temp_path)
+                os.replace(temp_path, destination_path)
+                return True
+            except OSError:
+                pass
+        with open(source_path, "rb") as source_file, open(temp_path, "wb") as destination_file:
+            cloned = False
+            if mode == "reflink" and fcntl is not None and sys.platform.startswith("linux"):
+                try:
+                    fcntl.ioctl(destination_file.fileno(), FICLONE, source_file.fileno())
+                    cloned = True
+                except OSError:
+                    pass
+            if not cloned:
+                kernel_copy(source_file, destination_file, os.fstat(source_file.fileno()).st_size, on_chunk)
+        shutil.copystat(source_path, temp_path)
+        os.replace(temp_path, destination_path)
+        return cloned
+    except BaseException:
+        if os.path.lexists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def sync_attachments(source_dir: str, destination_dir: str, mode: str = "copy", workers: int = SYNC_WORKERS,
+                     progress: Optional[Callable[[int, int], None]] = None,
+                     cancel_event: Optional[threading.Event] = None) -> SyncStats:
+    """
+    Brings the exported attachments up to date with the journal. Attachments already in the destination are skipped,
+    and the rest are copied by a pool of threads, or linked when the mode allows it and both folders are on the same
+    filesystem.
+    :param source_dir: attachments folder of the journal
+    :param destination_dir: attachments folder of the export
+    :param mode: one of ATTACHMENT_MODES
+    :param workers: number of attachments copied at the same time
+    :param progress: called from the worker threads with the number of bytes done and the total number of bytes
+    :param cancel_event: stops the sync when set; attachments being copied are discarded
+    :return: statistics about the sync
+    """
+    stats = SyncStats()
+    os.makedirs(destination_dir, exist_ok=True)
+    if mode != "copy" and os.stat(source_dir).st_dev != os.stat(destination_dir).st_dev:
+        mode = "copy"
+    pending = []
+    with os.scandir(source_dir) as scan:
+        for dir_entry in scan:
+            if not dir_entry.is_file():
+                continue
+            source = dir_entry.stat()
+            destination_path = os.path.join(destination_dir, dir_entry.name)
+            if is_synced(source, dir_entry.path, destination_path):
+                stats.skipped += 1
+            else:
+                pending.append((dir_entry.path, destination_path, source.st_size))
+    total = sum(size for _, _, size in pending)
+    done = [0]
+    lock = threading.Lock()
+
+    def on_chunk(length: int) -> None:
+        if cancel_event is not None and cancel_event.is_set():
+            raise SyncCancelled()
+        if progress is not None:
+            with lock:
+                done[0] += length
+                done_bytes = done[0]
+            progress(done_bytes, total)
+
+    def export(source_path: str, destination_path: str, size: int) -> None:
+        if cancel_event is not None and cancel_event.is_set():
+            raise SyncCancelled()
+        with Tracing.span("export attachment", "export", size=size, mode=mode):
+            linked = export_attachment(source_path, destination_path, mode, on_chunk)
+        with lock:
+            if linked:
+                stats.linked += 1
+                done[0] += size
+            else:
+                stats.copied += 1
+                stats.bytes_copied += size
+            done_bytes = done[0]
+        if linked and progress is not None:
+            progress(done_bytes, total)
+
+    with Tracing.span("sync attachments", "export", attachments=len(pending), bytes=total), \
+            ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = [(executor.submit(export, *item), item[0]) for item in pending]
+        for future, source_path in futures:
+            try:
+                future.result()
+            except SyncCancelled:
+                stats.cancelled = True
+            except OSError:
+                stats.failed.append(os.path.basename(source_path))
+    if progress is not None and not stats.cancelled:
+        progress(total, total)
+    return stats
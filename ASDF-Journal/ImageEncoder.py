@@ -0,0 +1,92 @@
+"""
+Encodes pasted images off the GUI thread; QImage can be used from any thread, so this needs no widgets
+"""
+
+import threading
+from typing import Callable, List, Optional
+
+from PyQt5.QtCore import QBuffer, QByteArray, QIODevice, Qt
+from PyQt5.QtGui import QImage, QImageWriter, QPainter
+
+# image formats that pasted images can be saved as, and their file extensions
+IMAGE_FORMATS = {"png": ".png", "jpeg": ".jpg", "webp": ".webp"}
+DEFAULT_FORMAT = "png"
+
+
+def image_format(name: str) -> str:
+    """
+    :param name: format from the settings
+    :return: the format, or the default format if it is unknown or Qt has no plugin to write it
+    """
+    name = name.lower()
+    if name == "jpg":
+        name = "jpeg"
+    if name not in IMAGE_FORMATS or name.encode() not in [bytes(supported) for supported in
+                                                          QImageWriter.supportedImageFormats()]:
+        return DEFAULT_FORMAT
+    return name
+
+
+def encode_image(image: QImage, format_name: str = DEFAULT_FORMAT, quality: int = -1, max_dimension: int = 0) -> bytes:
+    """
+    :param image: the image
+    :param format_name: one of IMAGE_FORMATS
+    :param quality: 0 to 100, or -1 for the default; for png this trades encoding time for compression, where lower
+    values compress more
+    :param max_dimension: images wider or taller than this many pixels are scaled down; 0 to keep the original size
+    :return: the encoded image
+    """
+    if max_dimension > 0 and max(image.width(), image.height()) > max_dimension:
+        image = image.scaled(max_dimension, max_dimension, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+    if format_name == "jpeg" and image.hasAlphaChannel():
+        # jpeg has no transparency, which would otherwise turn black
+        opaque = QImage(image.size(), QImage.Format_RGB32)
+        opaque.fill(Qt.white)
+        painter = QPainter(opaque)
+        painter.drawImage(0, 0, image)
+        painter.end()
+        image = opaque
+    data = QByteArray()
+    image_buffer = QBuffer(data)
+    image_buffer.open(QIODevice.WriteOnly)
+    writer = QImageWriter(image_buffer, format_name.encode())
+    if quality >= 0:
+        writer.setQuality(quality)
+    if not writer.write(image):
+        raise OSError(writer.errorString())
+    image_buffer.close()
+    return bytes(data)
+
+
+def import_image(store, image: QImage, name: str, format_name: str = DEFAULT_FORMAT, quality: int = -1,
+                 max_dimension: int = 0, progress: Optional[Callable[[int, int], None]] = None,
+                 cancel_event: Optional[threading.Event] = None,
+                 on_done: Optional[Callable[[int, str, str], None]] = None) -> List[str]:
+    """
+    Encodes an image and adds it to the attachments; has the same interface as AttachmentStore.import_files so that it
+    can be run by an AttachmentImporter
+    :param store: the attachment store of the journal
+    :param image: the image
+    :param name: file name to give the attachment, without the extension
+    :param format_name: one of IMAGE_FORMATS
+    :param quality: see encode_image
+    :param max_dimension: see encode_image
+    :param progress: called with the number of images done and the total
+    :param cancel_event: the image is not added if this is set
+    :param on_done: called with 0, the file name of the attachment, or an empty string if it failed, and the error
+    :return: a list with the file name of the attachment, or an empty string if it was not added
+    """
+    result, error = "", ""
+    try:
+        data = encode_image(image, format_name, quality, max_dimension)
+        if cancel_event is not None and cancel_event.is_set():
+            error = "cancelled"
+        else:
+            result = store.import_bytes(data, name + IMAGE_FORMATS[format_name])
+    except OSError as os_error:
+        error = "{}: {}".format(name, os_error.strerror or os_error)
+    if progress is not None:
+        progress(1, 1)
+    if on_done is not None:
+        on_done(0, result, error)
+    return [result]
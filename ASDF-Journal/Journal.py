@@ -0,0 +1,351 @@
+"""
+Journal logic shared by the interface and the command line: settings, the entry index, new entries, attachments and
+export. Has no Qt dependency, so that scripts can use it without a display and without the cost of loading Qt.
+"""
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+from datetime import datetime
+from typing import TYPE_CHECKING, Optional, Tuple
+
+import EntryIndex
+import Tracing
+from Settings import DEFAULT_DATA, Settings, get_settings
+
+if TYPE_CHECKING:
+    import AttachmentStore
+    import Export
+    import SiteExport
+
+DATA_FILE_NAME = "data.json"
+COMBINED_FILE_NAME = "combined_journal.md"
+SITE_DIR_NAME = "site"
+
+# journal used instead of the one in data.json; see use_journal
+_journal_dir_override: Optional[str] = None
+
+
+def get_directory() -> str:
+    """
+    Gets the directory of the python file or executable
+    :return: directory of python file or executable
+    """
+    if getattr(sys, "frozen", False):
+        return os.path.dirname(sys.executable)
+    elif __file__:
+        return os.path.dirname(__file__)
+
+
+def get_resources_dir() -> str:
+    """
+    :return: resources directory
+    """
+    return os.path.join(get_directory(), "Resources")
+
+
+def settings() -> Settings:
+    """
+    :return: the process-wide settings object for data.json
+    """
+    return get_settings(get_data_path())
+
+
+def get_data_path() -> str:
+    """
+    :return: path of data.json
+    """
+    return os.path.join(get_directory(), DATA_FILE_NAME)
+
+
+def create_default_settings() -> None:
+    """
+    Creates data.json with the default settings if it does not exist, as on the first run of the app
+    :return: None
+    """
+    if not os.path.isfile(get_data_path()):
+        with open(get_data_path(), "w") as data_file:
+            json.dump(DEFAULT_DATA, data_file, indent=4)
+
+
+def use_journal(journal_dir: Optional[str]) -> None:
+    """
+    Works on another journal for the rest of the process, without changing the journal that the app opens
+    :param journal_dir: folder of the journal, or None to go back to the journal in data.json
+    :return: None
+    """
+    global _journal_dir_override
+    _journal_dir_override = journal_dir
+
+
+def get_data(field):
+    """
+    gets the specified value from data.json
+    :param field: the key of the value to retrieve
+    :return: the requested value
+    """
+    return settings().get(field)
+
+
+def set_data(field: str, value) -> None:
+    """
+    Sets the specified value in data.json
+    :param field: the field to alter the value of
+    :param value: the value to set
+    :return: None
+    """
+    settings().set(field, value)
+
+
+def get_journal_dir():
+    """
+    :return: the current journal directory
+    """
+    if _journal_dir_override is not None:
+        return _journal_dir_override
+    return os.path.join(get_data("journal_dir"))
+
+
+def set_journal_dir(journal_dir) -> None:
+    """
+    :param journal_dir: path of current journal
+    :return: None
+    """
+    set_data("journal_dir", journal_dir)
+
+
+def get_entries_dir():
+    """
+    :return: the entries directory in the current journal
+    """
+    return os.path.join(get_journal_dir(), "entries")
+
+
+def get_attachments_dir():
+    """
+    :return: the attachments directory in the journal
+    """
+    return os.path.join(get_journal_dir(), "attachments")
+
+
+def get_datetime_format() -> str:
+    """
+    :return: the format for datetime in entries
+    """
+    return get_data("datetime_format")
+
+
+def get_attachment_export_mode() -> str:
+    """
+    :return: how attachments are exported: "copy", "hardlink" or "reflink"
+    """
+    return get_data("attachment_export_mode")
+
+
+def get_seperator() -> str:
+    """
+    :return: the string to be inserted after each entry when exporting as a single file
+    """
+    return get_data("entry_seperator")
+
+
+_entry_index = None
+_entry_index_lock = threading.Lock()
+_attachment_store = None
+
+
+def get_entry_index() -> "EntryIndex.EntryIndex":
+    """
+    Gets the index of the current journal, creating it when the journal or datetime format changes. The index is
+    brought up to date before it is returned, which only rescans the entries directory if it has changed.
+    :return: the entry index of the current journal
+    """
+    global _entry_index
+    # the index is opened on a background thread at startup; see load_entry_index
+    with _entry_index_lock:
+        journal_dir = get_journal_dir()
+        datetime_format = get_datetime_format()
+        if _entry_index is None or _entry_index.journal_dir != journal_dir or \
+                _entry_index.datetime_format != datetime_format:
+            if _entry_index is not None:
+                _entry_index.close()
+            _entry_index = EntryIndex.EntryIndex(journal_dir, datetime_format)
+        _entry_index.refresh()
+    return _entry_index
+
+
+def load_entry_index(progress=None, cancel_event=None) -> None:
+    """
+    Opens and scans the index of the current journal; run on a background thread at startup, before anything listens
+    to the index, so that the window is shown while the journal is scanned
+    :param progress: part of the BackgroundTask interface; not used
+    :param cancel_event: part of the BackgroundTask interface; not used
+    :return: None
+    """
+    if get_journal_dir() and os.path.isdir(get_entries_dir()):
+        get_entry_index()
+
+
+def get_attachment_store() -> "AttachmentStore.AttachmentStore":
+    """
+    Gets the attachment store of the current journal, creating it when the journal changes
+    :return: the attachment store of the current journal
+    """
+    global _attachment_store
+    # imported on first use, like Export, since they load thread pools that the command line rarely needs
+    import AttachmentStore
+    journal_dir = get_journal_dir()
+    if _attachment_store is None or _attachment_store.journal_dir != journal_dir:
+        if _attachment_store is not None:
+            _attachment_store.close()
+        _attachment_store = AttachmentStore.AttachmentStore(journal_dir)
+    return _attachment_store
+
+
+def save_text_atomically(path: str, text: str, newline: Optional[str] = None) -> None:
+    """
+    Writes a text file through a temporary file that is flushed to disk and then renamed over it, so that a crash
+    leaves either the old or the new contents and never a truncated file
+    :param path: path of the file
+    :param text: the new contents
+    :param newline: how line endings are written, as for open; "" writes the text as it is, for text that was read with
+    newline=""
+    :return: None
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(prefix=".save-", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "w", encoding="utf8", newline=newline) as temp_file:
+            temp_file.write(text)
+            temp_file.flush()
+            os.fsync(temp_file.fileno())
+        if os.path.exists(path):
+            shutil.copymode(path, temp_path)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    # makes the rename itself durable; directories cannot be opened on Windows
+    if hasattr(os, "O_DIRECTORY"):
+        try:
+            dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+        except OSError:
+            pass
+
+
+def replace_chars_for_file(file_name: str) -> str:
+    """
+    Replaces characters that should not be in a file name
+    :param file_name: The string to replace characters in
+    :return:
+    """
+    for char in (" ", "/", "\\", "|", ":"):
+        file_name = file_name.replace(char, "_")
+    return file_name
+
+
+def attachment_reference(file_name: str) -> str:
+    insert_text = "!" if os.path.splitext(file_name)[1].lower() in (".jpg", ".jpeg", ".png", ".gif", ".webp") else ""
+    insert_text += "[](../attachments/" + file_name + ")\n\n"
+    return insert_text
+
+
+def attachment_file_name(path: str) -> str:
+    """
+    :param path: path of a file being attached
+    :return: the file name to give the attachment
+    """
+    return replace_chars_for_file(datetime.now().strftime(get_datetime_format()) + "_" + os.path.basename(path))
+
+
+def copy_files_to_attachments(files: list[str]):
+    """
+    Copies files to the attachments folder; files that are already attached are referenced instead of copied again
+    :param files: paths of the files
+    :return: markdown references to the attachments
+    """
+    insert_text = ""
+    store = get_attachment_store()
+    for file in files:
+        # files already in the attachments folder are found by the store and referenced as they are
+        insert_text += attachment_reference(store.import_file(file, attachment_file_name(file)))
+
+    return insert_text
+
+
+def new_entry(title: str = "", text: str = "", timestamp: Optional[datetime] = None) -> str:
+    """
+    Adds an entry to the journal, named after the time it was made and its title. An entry with the same name is never
+    appended to: a number is added to the name instead.
+    :param title: title of the entry; optional
+    :param text: text written after the heading of the entry
+    :param timestamp: time the entry was made; defaults to now
+    :return: path of the entry
+    """
+    entry_name = (timestamp or datetime.now()).strftime(get_datetime_format())
+    if title:
+        entry_name += " " + title
+    base_path = os.path.join(get_entries_dir(), replace_chars_for_file(entry_name))
+    path = base_path + EntryIndex.ENTRY_EXTENSION
+    number = 1
+    while True:
+        try:
+            with open(path, "x", encoding="utf8") as entry:
+                entry.write("# " + entry_name + "\n" + ("\n" + text if text else ""))
+            return path
+        except FileExistsError:
+            number += 1
+            path = "{}_{}{}".format(base_path, number, EntryIndex.ENTRY_EXTENSION)
+
+
+def export_journal(export_dir: str) -> Tuple["Export.ExportStats", str]:
+    """
+    Exports the journal as a single markdown file, in a folder named after the journal. Attachments are synced
+    separately with Export.sync_attachments, which the interface runs in the background.
+    :param export_dir: folder to export to
+    :return: statistics about the export and the folder to sync the attachments to
+    """
+    import Export
+    journal_name = os.path.basename(get_journal_dir())
+    export_file_dir = os.path.join(export_dir, journal_name, "journal")
+    attachments_dir = os.path.join(export_dir, journal_name, "attachments")
+    os.makedirs(export_file_dir, exist_ok=True)
+    os.makedirs(attachments_dir, exist_ok=True)
+    names = get_entry_index().names()
+    with Tracing.span("export single file", "export", entries=len(names)):
+        stats = Export.export_single_file(get_entries_dir(), names, get_seperator(),
+                                          os.path.join(export_file_dir, COMBINED_FILE_NAME))
+    return stats, attachments_dir
+
+
+def export_site(export_dir: str, entries: Optional[list] = None, workers: Optional[int] = None, progress=None,
+                cancel_event=None) -> Tuple["SiteExport.SiteStats", str]:
+    """
+    Exports the journal as a static HTML site, in a folder named after the journal. Attachments are synced
+    separately with Export.sync_attachments, as for export_journal.
+    :param export_dir: folder to export to
+    :param entries: the entries of the journal; taken from the index by default, which must then not be listened to by
+    another thread
+    :param workers: number of processes converting entries; every core by default
+    :param progress: called with the number of entries converted and the number to convert
+    :param cancel_event: stops the export when set
+    :return: statistics about the export and the folder to sync the attachments to
+    """
+    import SiteExport
+    if entries is None:
+        entries = get_entry_index().entries()
+    journal_name = os.path.basename(get_journal_dir())
+    site_dir = os.path.join(export_dir, journal_name, SITE_DIR_NAME)
+    with Tracing.span("export site", "export", entries=len(entries)):
+        stats = SiteExport.export_site(get_entries_dir(), entries, get_datetime_format(), site_dir, journal_name,
+                                       os.path.join(get_resources_dir(), SiteExport.STYLE_NAME), workers, progress,
+                                       cancel_event)
+    return stats, os.path.join(site_dir, SiteExport.ATTACHMENTS_DIR_NAME)
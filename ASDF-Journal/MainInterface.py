@@ -2,24 +2,57 @@
 Main interface/window for program
 """
 
-import glob
 import os
-import shutil
 import subprocess
 import sys
-from datetime import datetime
-from typing import List
+from typing import Callable, List
 
 from PyQt5.QtCore import QTimer, Qt
-from PyQt5.QtGui import QKeySequence, QCloseEvent, QIcon, QResizeEvent
+from PyQt5.QtGui import QKeySequence, QCloseEvent, QIcon, QShowEvent
 from PyQt5.QtWidgets import QMainWindow, QWidget, QMenuBar, QMenu, QAction, QSplitter, QFileDialog, \
-    QInputDialog, QMessageBox, QShortcut, QSizePolicy, QListWidgetItem
+    QInputDialog, QMessageBox, QShortcut, QSizePolicy, QProgressDialog, QLabel, QVBoxLayout
 
+import AttachmentStore
+import Export
+import Tracing
 import Utilities
+from RecoveryLog import RecoveryLog
+from BackgroundTask import BackgroundTask
 from Calendar import Calendar
 from EntrySelector import EntrySelector
 from MarkdownEditor import MarkdownEditor
-from PreviewPanel import PreviewPanel
+
+# stages shown in the status bar when tracing is turned on, as (label, span name)
+TRACE_STATUS_SPANS = (("Render", "markdown conversion"), ("Page load", "page load"), ("Scan", "scan entries"),
+                      ("Entry list", "update_selector"))
+
+
+class LazyPanel(QWidget):
+    """
+    Placeholder that creates the widget it holds the first time it is shown. The widget is created after the show event
+    has been handled, so that the window is painted before an expensive widget is built.
+    """
+
+    def __init__(self, factory: Callable[[QWidget], QWidget], parent=None):
+        """
+        :param factory: creates the widget, given the placeholder as its parent
+        :param parent: parent widget
+        """
+        super(LazyPanel, self).__init__(parent)
+        self.factory = factory
+        self.widget = None
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+
+    def showEvent(self, event: QShowEvent) -> None:
+        super().showEvent(event)
+        if self.widget is None:
+            QTimer.singleShot(0, self.create_widget)
+
+    def create_widget(self) -> None:
+        if self.widget is None and self.isVisible():
+            self.widget = self.factory(self)
+            self.layout().addWidget(self.widget)
 
 
 class MainInterface(QMainWindow):
@@ -35,8 +68,11 @@ class MainInterface(QMainWindow):
         self.markdown_editor = MarkdownEditor(self)
         self.splitter.addWidget(self.markdown_editor)
 
-        self.preview_panel = PreviewPanel(self)
-        self.splitter.addWidget(self.preview_panel)
+        # the preview loads QtWebEngine and starts a worker process, so it is only created once it is first shown,
+        # after the window has been painted
+        self.preview_panel = None
+        self.preview_container = LazyPanel(self.create_preview_panel, self)
+        self.splitter.addWidget(self.preview_container)
 
         self.calendar = Calendar(self)
         self.calendar_action = None
@@ -48,8 +84,7 @@ class MainInterface(QMainWindow):
         self.setCentralWidget(self.splitter)
         self.entry_selector.setHidden(not Utilities.get_toggle_states()[0])
         self.markdown_editor.setHidden(not Utilities.get_toggle_states()[1])
-        self.preview_panel.setHidden(not Utilities.get_toggle_states()[2])
-        self.update_selector()
+        self.preview_container.setHidden(not Utilities.get_toggle_states()[2])
 
         self.menu_bar = QMenuBar()
         self.toolbar = self.addToolBar("Toolbar")
@@ -62,13 +97,74 @@ class MainInterface(QMainWindow):
         # self.nav_down_shortcut = QShortcut(QKeySequence("Alt+Down"), self)
         # self.nav_down_shortcut.activated.connect(lambda: self.entry_selector.navigate_direction(False))
 
+        # Writes unsaved edits to the journal folder in the background so that they can be recovered after a crash
+        self.recovery_log = RecoveryLog(Utilities.get_autosave_interval())
+        self.markdown_editor.edited.connect(self.recovery_log.record)
+        self.markdown_editor.text_saved.connect(
+            lambda: self.recovery_log.reset(Utilities.get_journal_dir(), self.markdown_editor.entry_path))
+
         self.setup_connections()
         self.markdown_editor.update_editor(self.entry_selector.current_entry_path())
 
-        # For updating the preview panel
+        # For updating the preview panel; restarted on every edit so that the preview is rendered once typing pauses
         self.update_timer = QTimer(self)
+        self.update_timer.setSingleShot(True)
         self.update_timer.timeout.connect(self.timer_updated)
-        self.update_timer.start(1000)
+        self.markdown_editor.contents_changed.connect(
+            lambda: self.update_timer.start(self.preview_panel.render_delay() if self.preview_panel else 0))
+
+        # Renders the entries next to the current one once the user stops switching entries, so that they are shown
+        # immediately when navigated to
+        self.prefetch_timer = QTimer(self)
+        self.prefetch_timer.setSingleShot(True)
+        self.prefetch_timer.timeout.connect(self.prefetch_neighbours)
+        self.entry_selector.current_entry_changed.connect(lambda: self.prefetch_timer.start(300))
+
+        # attachment sync of the last export, the last HTML site export and the last duplicate attachment removal,
+        # which run in the background
+        self.attachment_sync = None
+        self.site_export = None
+        self.dedupe_task = None
+
+        # shows how long the last render and scan took when tracing is turned on
+        self.trace_status = None
+        if Tracing.is_enabled():
+            self.trace_status = QLabel()
+            self.statusBar().addPermanentWidget(self.trace_status)
+            self.trace_status_timer = QTimer(self)
+            self.trace_status_timer.timeout.connect(self.update_trace_status)
+            self.trace_status_timer.start(1000)
+
+        # the journal is scanned in the background once the window is shown
+        self.journal_loader = None
+        QTimer.singleShot(0, self.load_journal)
+
+    def load_journal(self) -> None:
+        """
+        Opens the index of the journal on a background thread, and fills the entry selector and calendar when it is
+        ready
+        :return: None
+        """
+        self.journal_loader = BackgroundTask(self)
+        self.journal_loader.finished.connect(lambda result: self.update_selector())
+        self.journal_loader.failed.connect(lambda error: self.update_selector())
+        self.journal_loader.start(Utilities.load_entry_index)
+
+    def prefetch_neighbours(self) -> None:
+        if self.preview_panel is not None:
+            self.preview_panel.prefetch(self.entry_selector.neighbour_paths())
+
+    def create_preview_panel(self, parent: QWidget) -> QWidget:
+        """
+        Creates the preview panel and shows the current entry in it
+        :param parent: the widget the preview is placed in
+        :return: the preview panel
+        """
+        from PreviewPanel import PreviewPanel
+        self.preview_panel = PreviewPanel(parent)
+        self.markdown_editor.set_has_text_changed(True)
+        QTimer.singleShot(0, self.timer_updated)
+        return self.preview_panel
 
     def create_menu(self) -> None:
         file_menu = QMenu("&File", self)
@@ -96,6 +192,7 @@ class MainInterface(QMainWindow):
                                                               "Ctrl+Shift+D", icon="attachments.svg")
         edit_menu.addAction(existing_attachments_action)
         self.toolbar.addAction(existing_attachments_action)
+        edit_menu.addAction(self.create_menu_action("Remove Duplicate Attachments", self.dedupe_attachments))
         self.menu_bar.addMenu(edit_menu)
 
         spacerL = QWidget()
@@ -122,7 +219,7 @@ class MainInterface(QMainWindow):
         self.toolbar.addAction(toggle_editor_action)
         toggle_preview_action = self.create_menu_action("HTML Preview", self.toggle_preview_panel, "Ctrl+3",
                                                         checkable=True,
-                                                        checked_state=(not self.preview_panel.isHidden()),
+                                                        checked_state=(not self.preview_container.isHidden()),
                                                         icon="preview.svg")
         view_menu.addAction(toggle_preview_action)
         self.toolbar.addAction(toggle_preview_action)
@@ -130,16 +227,22 @@ class MainInterface(QMainWindow):
                                                        checked_state=False, icon="calendar.svg")
         view_menu.addAction(self.calendar_action)
         self.toolbar.addAction(self.calendar_action)
+        view_menu.addAction(self.create_menu_action("Refresh Preview", self.refresh_preview, "F5"))
         self.menu_bar.addMenu(view_menu)
 
         spacerR = QWidget()
         spacerR.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Preferred)
         self.toolbar.addWidget(spacerR)
 
+        self.entry_selector.search_box.setMaximumWidth(250)
+        self.toolbar.addWidget(self.entry_selector.search_box)
+        edit_menu.addAction(self.create_menu_action("&Search Entries", self.search_entries, "Ctrl+F"))
+
         export_menu = QMenu("&Export", self)
         export_action = self.create_menu_action("Export as single markdown file", self.export_single_file,
                                                 icon="export.svg")
         export_menu.addAction(export_action)
+        export_menu.addAction(self.create_menu_action("Export as HTML site", self.export_site))
         self.toolbar.addAction(export_action)
         self.menu_bar.addMenu(export_menu)
 
@@ -177,10 +280,10 @@ class MainInterface(QMainWindow):
         :return: None
         """
 
-        self.entry_selector.currentItemChanged.connect(self.confirm_save)
-        self.entry_selector.currentItemChanged.connect(
+        self.entry_selector.current_entry_changed.connect(self.confirm_save)
+        self.entry_selector.current_entry_changed.connect(
             lambda: self.markdown_editor.update_editor(self.entry_selector.current_entry_path()))
-        self.entry_selector.currentItemChanged.connect(lambda: self.timer_updated())
+        self.entry_selector.current_entry_changed.connect(lambda: self.timer_updated())
         self.markdown_editor.update_selector.connect(self.update_selector)
         self.calendar.selectionChanged.connect(
             lambda: self.entry_selector.set_entry_date(self.calendar.selectedDate()))
@@ -192,7 +295,8 @@ class MainInterface(QMainWindow):
         if (selected_folder):
             Utilities.set_journal_dir(selected_folder)
             self.update_selector()
-            self.preview_panel.init_html()
+            if self.preview_panel is not None:
+                self.preview_panel.init_html()
 
     def open_journal_folder(self) -> None:
         """
@@ -231,35 +335,39 @@ class MainInterface(QMainWindow):
         Saves the current entry
         :return: None
         """
-        if len(self.entry_selector.selectedItems()) > 0:
+        with Tracing.span("save_entry"):
             path_to_entry = self.entry_selector.current_entry_path()
-            if os.path.isfile(path_to_entry):
-                with open(path_to_entry,
-                          "w", encoding="utf8") as entry:
-                    entry.write(self.markdown_editor.toPlainText())
+            if self.markdown_editor.is_loading():
+                Utilities.alert_user("Could not save because the entry is still loading.")
+            elif path_to_entry:
+                if os.path.isfile(path_to_entry):
+                    self.write_entry(path_to_entry)
+                else:
+                    Utilities.alert_user("Selected entry does not exist.")
+
             else:
-                Utilities.alert_user("Selected entry does not exist.")
+                Utilities.alert_user("Could not save because no note is selected.")
 
-        else:
-            Utilities.alert_user("Could not save because no note is selected.")
+    def write_entry(self, path_to_entry: str) -> None:
+        """
+        Atomically writes the text in the editor to an entry
+        :param path_to_entry: path of the entry
+        :return: None
+        """
+        Utilities.save_text_atomically(path_to_entry, self.markdown_editor.toPlainText())
+        self.markdown_editor.mark_saved()
+        Utilities.get_entry_index().update_entry(path_to_entry)
 
     def new_entry(self) -> None:
         """
         Adds a new entry to the journal
         :return: None
         """
-        entries_dir = Utilities.get_entries_dir()
-        cur_datetime = datetime.now()
-        entry_name = cur_datetime.strftime(Utilities.get_datetime_format())
-
         title, confirm = QInputDialog.getText(self, "New Entry", "Entry Title (Optional):")
         if confirm:
-            if title:
-                entry_name += " " + title
-            entry_name_file = Utilities.replace_chars_for_file(entry_name) + ".md"
-            with open(os.path.join(entries_dir, entry_name_file), 'a', encoding="utf8") as entry:
-                entry.writelines(["# " + entry_name + "\n"])
+            path_to_entry = Utilities.new_entry(title)
             self.update_selector()
+            self.entry_selector.select_entry(path_to_entry)
             self.timer_updated()
 
     def import_attachments(self) -> None:
@@ -269,7 +377,7 @@ class MainInterface(QMainWindow):
         """
         selected_files = QFileDialog.getOpenFileNames(self, "Select attachments to import", Utilities.get_journal_dir())
         if selected_files:
-            self.markdown_editor.insertPlainText(Utilities.copy_files_to_attachments(selected_files[0]))
+            self.markdown_editor.import_files(selected_files[0])
 
 
     def add_existing_attachments(self) -> None:
@@ -283,6 +391,63 @@ class MainInterface(QMainWindow):
                 file_name = os.path.basename(str(selected_file))
                 self.markdown_editor.insertPlainText(Utilities.attachment_reference(file_name))
 
+    def dedupe_attachments(self) -> None:
+        """
+        Removes attachments that are identical to another attachment in the background, showing a progress dialog,
+        updates the entries that referenced them and reports how much space was reclaimed. Refused while the current
+        entry has unsaved changes or attachments are being imported, since they may reference a removed duplicate.
+        :return: None
+        """
+        if self.dedupe_task is not None and self.dedupe_task.is_running():
+            return
+        current_path = self.entry_selector.current_entry_path()
+        self.confirm_save(previous=current_path)
+        if self.markdown_editor.is_modified() or self.markdown_editor.imports:
+            Utilities.alert_user("Save the current entry and wait for attachments to be imported before removing "
+                                 "duplicate attachments.")
+            return
+        progress_dialog = QProgressDialog("Removing duplicate attachments...", "Cancel", 0, 1000, self)
+        progress_dialog.setWindowTitle("Remove Duplicate Attachments")
+        progress_dialog.setWindowModality(Qt.WindowModal)
+        # shown at once, so that the entry cannot be edited while its references are rewritten
+        progress_dialog.show()
+        task = BackgroundTask(self)
+        task.progress.connect(lambda done, total: progress_dialog.setValue(int(done * 1000 / total) if total else 1000))
+        progress_dialog.canceled.connect(task.cancel)
+
+        def dedupe_finished(stats: AttachmentStore.DedupeStats) -> None:
+            progress_dialog.reset()
+            progress_dialog.deleteLater()
+            # reloads the current entry in case its references changed
+            if stats.entries_updated and not self.markdown_editor.is_modified():
+                self.markdown_editor.update_editor(current_path)
+                self.timer_updated()
+            if stats.cancelled:
+                return
+            Utilities.alert_user("Removed {} duplicate attachments and reclaimed {:.1f} MB. {} entries were updated."
+                                 .format(len(stats.removed), stats.bytes_reclaimed / (1024 * 1024),
+                                         stats.entries_updated))
+
+        def dedupe_failed(error: str) -> None:
+            progress_dialog.reset()
+            progress_dialog.deleteLater()
+            QMessageBox.warning(self, "Remove Duplicate Attachments", "Duplicate attachments could not be removed: " +
+                                error)
+
+        task.finished.connect(dedupe_finished)
+        task.failed.connect(dedupe_failed)
+        self.dedupe_task = task
+        task.start(Utilities.get_attachment_store().dedupe, Utilities.get_entries_dir())
+
+    def search_entries(self) -> None:
+        """
+        Moves focus to the search box and shows the entry selector so that the results are visible
+        :return: None
+        """
+        self.entry_selector.show()
+        self.entry_selector.search_box.setFocus()
+        self.entry_selector.search_box.selectAll()
+
     def exit_interface(self) -> None:
         self.close()
 
@@ -300,18 +465,19 @@ class MainInterface(QMainWindow):
 
     def toggle_preview_panel(self, checked: bool) -> None:
         if checked:
-            self.preview_panel.show()
+            self.preview_container.show()
         else:
-            self.preview_panel.hide()
+            self.preview_container.hide()
 
     def update_selector(self) -> None:
         """
         Updates the entry selector to the current journal folder
         :return: None
         """
-        self.entry_selector.update_entry_selector()
-        self.setWindowTitle("ASDF Journal - " + os.path.basename(Utilities.get_journal_dir()))
-        self.calendar.highlight_dates_with_entries(self.entry_selector.get_all_entries())
+        with Tracing.span("update_selector"):
+            self.entry_selector.update_entry_selector()
+            self.setWindowTitle("ASDF Journal - " + os.path.basename(Utilities.get_journal_dir()))
+            self.calendar.highlight_dates_with_entries(Utilities.get_entry_index().entries())
 
     def toggle_calendar(self, checked: bool) -> None:
         """
@@ -322,7 +488,7 @@ class MainInterface(QMainWindow):
         self.calendar_action.setChecked(checked)
         if checked and self.calendar.isHidden():
             self.calendar.show()
-            self.calendar.highlight_dates_with_entries(self.entry_selector.get_all_entries())
+            self.calendar.highlight_dates_with_entries(Utilities.get_entry_index().entries())
         else:
             self.calendar.hide()
 
@@ -331,77 +497,172 @@ class MainInterface(QMainWindow):
         Exports the journal as a single markdown folder along with attachments
         :return: None
         """
-        entries = self.entry_selector.get_all_entries()
-        seperator = Utilities.get_seperator()
         export_path = QFileDialog.getExistingDirectory(self, "Export File", Utilities.get_journal_dir())
-        export_file_path = os.path.join(export_path, os.path.basename(Utilities.get_journal_dir()), "journal")
-        attachments_path = os.path.join(export_path, os.path.basename(Utilities.get_journal_dir()), "attachments")
-        os.makedirs(export_file_path, exist_ok=True)
-        os.makedirs(attachments_path, exist_ok=True)
-        with open(os.path.join(export_file_path, "combined_journal.md"), 'w', encoding="utf8") as export_file:
-            for entry in entries:
-                with open(os.path.join(Utilities.get_entries_dir(), entry), 'r', encoding="utf8") as entry_file:
-                    lines = entry_file.readlines()
-                export_file.write(seperator)
-                export_file.writelines(lines)
-        for attachment in glob.glob(os.path.join(Utilities.get_attachments_dir(), "*")):
-            shutil.copy2(attachment, os.path.join(attachments_path, os.path.basename(attachment)))
+        if not export_path:
+            return
+        _, attachments_path = Utilities.export_journal(export_path)
+        self.sync_attachments(attachments_path)
+
+    def export_site(self) -> None:
+        """
+        Exports the journal as a static HTML site in the background, showing a progress dialog, then exports the
+        attachments
+        :return: None
+        """
+        export_path = QFileDialog.getExistingDirectory(self, "Export HTML Site", Utilities.get_journal_dir())
+        if not export_path:
+            return
+        if self.site_export is not None and self.site_export.is_running():
+            # both exports would write the same pages
+            self.site_export.cancel()
+            self.site_export.thread.join()
+        progress_dialog = QProgressDialog("Converting entries...", "Cancel", 0, 1000, self)
+        progress_dialog.setWindowTitle("Export")
+        progress_dialog.setWindowModality(Qt.WindowModal)
+        progress_dialog.setMinimumDuration(500)
+        task = BackgroundTask(self)
+        task.progress.connect(lambda done, total: progress_dialog.setValue(int(done * 1000 / total) if total else 1000))
+        progress_dialog.canceled.connect(task.cancel)
+
+        def export_finished(result) -> None:
+            stats, attachments_path = result
+            progress_dialog.reset()
+            progress_dialog.deleteLater()
+            self.statusBar().showMessage("Converted {} entries in {:.1f} s ({:.0f} entries/s), {} unchanged".format(
+                stats.converted, stats.seconds, stats.entries_per_second, stats.skipped), 10000)
+            if stats.failed:
+                QMessageBox.warning(self, "Export", "These entries could not be exported:\n" + "\n".join(stats.failed))
+            if not stats.cancelled:
+                self.sync_attachments(attachments_path)
+
+        def export_failed(error: str) -> None:
+            progress_dialog.reset()
+            progress_dialog.deleteLater()
+            QMessageBox.warning(self, "Export", "The site could not be exported: " + error)
+
+        task.finished.connect(export_finished)
+        task.failed.connect(export_failed)
+        self.site_export = task
+        # the entries are listed here, since the index notifies the interface of changes on the thread that refreshes it
+        task.start(Utilities.export_site, export_path, Utilities.get_entry_index().entries())
+
+    def sync_attachments(self, attachments_path: str) -> None:
+        """
+        Copies the attachments that changed since the last export in the background, showing a progress dialog
+        :param attachments_path: attachments folder of the export
+        :return: None
+        """
+        if self.attachment_sync is not None and self.attachment_sync.is_running():
+            self.attachment_sync.cancel()
+        progress_dialog = QProgressDialog("Exporting attachments...", "Cancel", 0, 1000, self)
+        progress_dialog.setWindowTitle("Export")
+        progress_dialog.setWindowModality(Qt.WindowModal)
+        progress_dialog.setMinimumDuration(500)
+        task = BackgroundTask(self)
+        task.progress.connect(lambda done, total: progress_dialog.setValue(int(done * 1000 / total) if total else 1000))
+        progress_dialog.canceled.connect(task.cancel)
+
+        def sync_finished(stats: Export.SyncStats) -> None:
+            progress_dialog.reset()
+            progress_dialog.deleteLater()
+            if stats.failed:
+                QMessageBox.warning(self, "Export", "These attachments could not be exported:\n" +
+                                    "\n".join(stats.failed))
+
+        def sync_failed(error: str) -> None:
+            progress_dialog.reset()
+            progress_dialog.deleteLater()
+            QMessageBox.warning(self, "Export", "Attachments could not be exported: " + error)
+
+        task.finished.connect(sync_finished)
+        task.failed.connect(sync_failed)
+        self.attachment_sync = task
+        task.start(Export.sync_attachments, Utilities.get_attachments_dir(), attachments_path,
+                   Utilities.get_attachment_export_mode())
 
     def timer_updated(self) -> None:
         """
-        Executes every time the timer is triggered; Updates the preview panel based on current text in the editor
+        Executes when the timer is triggered after an edit; Updates the preview panel based on current text in the
+        editor
         :return: None
         """
-        if self.markdown_editor.get_has_text_changed():
-            text = self.markdown_editor.toPlainText()
-            self.preview_panel.update_preview(text, self.markdown_editor.textCursor().atEnd())
-            self.markdown_editor.set_has_text_changed(False)
+        if self.preview_panel is None:
+            # the preview shows the current text when it is created
+            return
+        with Tracing.span("timer_updated"):
+            if self.markdown_editor.get_has_text_changed():
+                if self.markdown_editor.large_entry:
+                    # converting the whole entry after every pause in typing would make the editor sluggish
+                    self.preview_panel.show_notice("This entry is too large to preview while editing. Press F5 to "
+                                                   "refresh the preview.")
+                else:
+                    self.refresh_preview()
+                self.markdown_editor.set_has_text_changed(False)
+
+    def refresh_preview(self) -> None:
+        """
+        Renders the current text in the editor, even if the entry is too large to be previewed automatically
+        :return: None
+        """
+        if self.preview_panel is not None and not self.markdown_editor.is_loading():
+            self.preview_panel.update_preview(self.markdown_editor.toPlainText(),
+                                              self.markdown_editor.textCursor().atEnd(),
+                                              self.entry_selector.current_entry_path())
+
+    def update_trace_status(self) -> None:
+        """
+        Shows the duration of the last span of each stage in TRACE_STATUS_SPANS in the status bar
+        :return: None
+        """
+        durations = Tracing.last_durations()
+        self.trace_status.setText("   ".join("{}: {:.1f} ms".format(label, durations[name])
+                                            for label, name in TRACE_STATUS_SPANS if name in durations))
 
-    def confirm_save(self, current: QListWidgetItem = None, item: QListWidgetItem = None) -> bool:
+    def confirm_save(self, current: str = "", previous: str = "") -> bool:
         """
         Asks the user if they want to save before switching entries or exiting app
         :param current: part of the signal; not used
-        :param item: the entry selector item to save to
+        :param previous: path of the entry to save to
         :return: True if the user does not press cancel
         """
-        if item:
-            path_to_entry = item.data(Qt.UserRole)
-            if os.path.isfile(path_to_entry):
-                with open(path_to_entry, 'r', encoding="utf8") as entry:
-                    if entry.read() != self.markdown_editor.toPlainText():
-                        reply = QMessageBox.question(self, "Save Changes",
-                                                     "Would you like to save your changes?",
-                                                     QMessageBox.Yes | QMessageBox.No, QMessageBox.Yes)
-                        if reply == QMessageBox.Yes:
-                            with open(path_to_entry, 'w', encoding="utf8") as entry_file:
-                                entry_file.write(self.markdown_editor.toPlainText())
-                        if reply == QMessageBox.StandardButton.Cancel:
-                            return False
+        with Tracing.span("confirm_save"):
+            if previous:
+                path_to_entry = previous
+                if self.markdown_editor.is_modified() and os.path.isfile(path_to_entry):
+                    reply = QMessageBox.question(self, "Save Changes",
+                                                 "Would you like to save your changes?",
+                                                 QMessageBox.Yes | QMessageBox.No, QMessageBox.Yes)
+                    if reply == QMessageBox.Yes:
+                        self.write_entry(path_to_entry)
+                    if reply == QMessageBox.StandardButton.Cancel:
+                        return False
 
         return True
 
-    def resizeEvent(self, event: QResizeEvent) -> None:
-        """
-        Overrides the resizeEvent method in order to update the bottom margin of the editor (so that the user can scroll
-        past the bottom)
-        :param event: QReizeEvent
-        :return: None
-        """
-        self.markdown_editor.update_margin(self.splitter.height())
-
-        event.accept()
-
     def closeEvent(self, event: QCloseEvent) -> None:
         """
         Overrides closeEvent method in order to store current state
         :param event: QCloseEvent
         :return: None
         """
-        Utilities.set_page_zoom(self.preview_panel.page().zoomFactor())
-        Utilities.set_splitter_sizes(self.splitter.sizes())
-        Utilities.set_toggle_states([not self.entry_selector.isHidden(), not self.markdown_editor.isHidden(),
-                                     not self.preview_panel.isHidden()])
-
-        self.confirm_save(item=self.entry_selector.currentItem())
+        with Utilities.settings().batch():
+            if self.preview_panel is not None:
+                Utilities.set_page_zoom(self.preview_panel.page().zoomFactor())
+            Utilities.set_splitter_sizes(self.splitter.sizes())
+            Utilities.set_toggle_states([not self.entry_selector.isHidden(), not self.markdown_editor.isHidden(),
+                                         not self.preview_container.isHidden()])
+
+        self.confirm_save(previous=self.entry_selector.current_entry_path())
+        if self.preview_panel is not None:
+            self.preview_panel.render_worker.shutdown()
+            self.preview_panel.thumbnails.shutdown()
+        if self.attachment_sync is not None:
+            self.attachment_sync.cancel()
+        if self.site_export is not None:
+            self.site_export.cancel()
+        if self.dedupe_task is not None:
+            self.dedupe_task.cancel()
+        self.markdown_editor.cancel_imports()
+        self.recovery_log.close()
 
         event.accept()
@@ -3,33 +3,65 @@ Editor for the markdown formatted entries
 """
 
 import os
+import time
 from datetime import datetime
-from typing import List
+from typing import List, Tuple
 
-from PyQt5.QtCore import Qt, QRegularExpression, pyqtSignal, QMimeData
-from PyQt5.QtGui import QTextCursor, QFont, QSyntaxHighlighter, QTextDocument, QTextCharFormat, QKeyEvent, QKeySequence, \
-    QImage
-from PyQt5.QtWidgets import QTextEdit, QListWidgetItem, QShortcut, QInputDialog
+from PyQt5.QtCore import Qt, QRegularExpression, QTimer, pyqtSignal, QMimeData
+from PyQt5.QtGui import QTextCursor, QFont, QSyntaxHighlighter, QTextBlockUserData, QTextCharFormat, QKeyEvent, \
+    QKeySequence, QImage, QColor, QResizeEvent
+from PyQt5.QtWidgets import QPlainTextEdit, QShortcut, QInputDialog
 
 import Utilities
+from AttachmentImporter import AttachmentImporter
 
 
-class MarkdownEditor(QTextEdit):
+# characters that QTextDocument.toPlainText replaces, which selectedText keeps
+PLAIN_TEXT_CHARACTERS = str.maketrans({"\u2029": "\n", "\u2028": "\n", "\ufdd0": "\n", "\ufdd1": "\n",
+                                       "\u00a0": " "})
+# number of characters of a large entry that are added to the editor at a time
+LOAD_CHUNK_SIZE = 512 * 1024
+
+
+class MarkdownEditor(QPlainTextEdit):
     update_selector = pyqtSignal()
+    # emitted for every edit of the text with its position and the number of characters removed, both in UTF-16 code
+    # units, and the text inserted
+    edited = pyqtSignal(int, int, str)
+    # emitted when the text matches the saved entry, after it is loaded or saved
+    text_saved = pyqtSignal()
+    # emitted when characters are added or removed, including when an entry is loaded; unlike textChanged, it is not
+    # emitted when the highlighter formats blocks, which it does while scrolling and after every edit
+    contents_changed = pyqtSignal()
 
     def __init__(self, parent):
         super(MarkdownEditor, self).__init__(parent)
-        self.frame_format = self.document().rootFrame().frameFormat()
         self.has_text_changed = False
+        # set while the text is replaced, which is not an edit
+        self.loading = False
+        # path of the entry being edited
+        self.entry_path = ""
+        # whether the entry is large enough that the editor avoids work on the whole text
+        self.large_entry = False
+        # text of a large entry that is being loaded, and how much of it is in the editor
+        self.pending_text = None
+        self.load_offset = 0
+        self.load_timer = QTimer(self)
+        self.load_timer.timeout.connect(self.load_next_chunk)
+        # attachment imports that are still running
+        self.imports: List[AttachmentImporter] = []
         self.font = QFont()
         self.font.setFamily("Consolas")
         self.font.setPointSize(Utilities.get_editor_font_size())
         self.setFont(self.font)
-        self.init_frame_format()
+        self.document().setDocumentMargin(30)
+        # lets the user scroll below the bottom of the text
+        self.setCenterOnScroll(True)
         self.setUndoRedoEnabled(True)
-        self.setAcceptRichText(False)
+        self.highlighter = MarkdownSyntaxHighlighter(self)
 
-        self.textChanged.connect(lambda: self.set_has_text_changed(True))
+        self.document().contentsChange.connect(self.text_contents_changed)
+        self.document().contentsChange.connect(self.record_edit)
 
         # Shortcuts
         self.bold_shortcut = QShortcut(QKeySequence("Ctrl+B"), self)
@@ -37,6 +69,56 @@ class MarkdownEditor(QTextEdit):
         self.italics_shortcut = QShortcut(QKeySequence("Ctrl+I"), self)
         self.italics_shortcut.activated.connect(lambda: self.emphasize_selected_text("*"))
 
+    def is_modified(self) -> bool:
+        """
+        :return: whether the text differs from the saved entry; tracked by the document, so the file is not read and
+        undoing back to the saved text counts as unmodified
+        """
+        return self.pending_text is None and self.document().isModified()
+
+    def visible_block_range(self) -> Tuple[int, int]:
+        """
+        :return: numbers of the first and last block that can be visible; blocks are at least one line high, so this may
+        include a few blocks below the viewport
+        """
+        first = self.firstVisibleBlock().blockNumber()
+        return first, first + self.viewport().height() // max(self.fontMetrics().lineSpacing(), 1) + 1
+
+    def resizeEvent(self, event: QResizeEvent) -> None:
+        super(MarkdownEditor, self).resizeEvent(event)
+        self.highlighter.highlight_visible_blocks()
+
+    def is_loading(self) -> bool:
+        """
+        :return: whether a large entry is still being loaded, in which case the editor does not have its whole text
+        """
+        return self.pending_text is not None
+
+    def mark_saved(self) -> None:
+        self.document().setModified(False)
+        self.text_saved.emit()
+
+    def text_contents_changed(self, position: int, removed: int, added: int) -> None:
+        if removed or added:
+            self.set_has_text_changed(True)
+            self.contents_changed.emit()
+
+    def record_edit(self, position: int, removed: int, added: int) -> None:
+        """
+        Emits an edit of the document; only the inserted text is read, so this takes the same time however long the
+        entry is
+        :param position: position of the edit
+        :param removed: number of characters removed
+        :param added: number of characters added
+        :return: None
+        """
+        if self.loading:
+            return
+        cursor = QTextCursor(self.document())
+        cursor.setPosition(position)
+        cursor.setPosition(min(position + added, self.document().characterCount() - 1), QTextCursor.KeepAnchor)
+        self.edited.emit(position, removed, cursor.selectedText().translate(PLAIN_TEXT_CHARACTERS))
+
     def get_has_text_changed(self) -> bool:
         return self.has_text_changed
 
@@ -49,35 +131,74 @@ class MarkdownEditor(QTextEdit):
         :param path_to_entry: The path to the current selected entry
         :return: None
         """
+        self.entry_path = path_to_entry
+        self.stop_loading()
+        self.large_entry = False
         if path_to_entry:
             if os.path.isfile(path_to_entry):
                 with open(path_to_entry, encoding="utf8") as current_entry:
-                    self.setPlainText(current_entry.read())
+                    text = current_entry.read()
+                if len(text) > Utilities.get_large_entry_size():
+                    self.load_progressively(text)
+                    return
+                self.set_text(text)
             else:
                 Utilities.alert_user("Selected entry does not exist.")
                 self.update_selector.emit()
         else:
-            self.setPlainText("")
-        self.init_frame_format()
+            self.set_text("")
+        if self.highlighter.document() is None:
+            # set after the text so that the large entry is not highlighted
+            self.highlighter.setDocument(self.document())
+        self.highlighter.highlight_visible_blocks()
+        self.mark_saved()
 
-    def init_frame_format(self) -> None:
+    def load_progressively(self, text: str) -> None:
         """
-        Sets the margins of the editor
+        Shows the start of a large entry immediately and adds the rest in chunks between events, so that the window
+        stays responsive while it loads. The editor is read-only until the whole entry is loaded.
+        :param text: text of the entry
         :return: None
         """
-        self.frame_format.setLeftMargin(30)
-        self.frame_format.setRightMargin(30)
-        self.frame_format.setTopMargin(30)
-        self.document().rootFrame().setFrameFormat(self.frame_format)
+        self.large_entry = True
+        # highlighting every block as it is added would slow down loading and every edit that changes the state of the
+        # blocks after it
+        self.highlighter.setDocument(None)
+        self.set_text(text[:LOAD_CHUNK_SIZE])
+        self.pending_text = text
+        self.load_offset = LOAD_CHUNK_SIZE
+        self.setReadOnly(True)
+        self.document().setUndoRedoEnabled(False)
+        self.mark_saved()
+        self.load_timer.start(0)
 
-    def update_margin(self, height: int) -> None:
-        """
-        Updates the bottom margin of the editor so that the user can scroll below the bottom of the text
-        :param height: The height to set the bottom margin
-        :return: None
-        """
-        self.frame_format.setBottomMargin(height)
-        self.document().rootFrame().setFrameFormat(self.frame_format)
+    def load_next_chunk(self) -> None:
+        cursor = QTextCursor(self.document())
+        cursor.movePosition(QTextCursor.End)
+        self.loading = True
+        try:
+            cursor.insertText(self.pending_text[self.load_offset:self.load_offset + LOAD_CHUNK_SIZE])
+        finally:
+            self.loading = False
+        self.load_offset += LOAD_CHUNK_SIZE
+        if self.load_offset >= len(self.pending_text):
+            self.stop_loading()
+            self.mark_saved()
+
+    def stop_loading(self) -> None:
+        if self.pending_text is None:
+            return
+        self.load_timer.stop()
+        self.pending_text = None
+        self.document().setUndoRedoEnabled(True)
+        self.setReadOnly(False)
+
+    def set_text(self, text: str) -> None:
+        self.loading = True
+        try:
+            self.setPlainText(text)
+        finally:
+            self.loading = False
 
     def emphasize_selected_text(self, emphasis_text: str) -> None:
         """
@@ -113,18 +234,44 @@ class MarkdownEditor(QTextEdit):
             image_name, confirm = QInputDialog.getText(self, "Insert Image", "Image Name (Optional):")
             if confirm:
                 cur_datetime = datetime.now()
-                file_name = cur_datetime.strftime(Utilities.get_datetime_format()) + "_" + image_name + ".png"
+                file_name = cur_datetime.strftime(Utilities.get_datetime_format()) + "_" + image_name
                 file_name = Utilities.replace_chars_for_file(file_name)
-                image.save(os.path.join(Utilities.get_attachments_dir(), file_name))
-                self.insertPlainText(Utilities.attachment_reference(file_name))
+                # encoded in the background; pasting an image that is already attached references the existing one
+                self.create_importer().start_image(image, file_name)
         elif source.hasUrls():
             urls = source.urls()
             urls = [url.toLocalFile() for url in urls if url.isLocalFile()]
-            self.insertPlainText(Utilities.copy_files_to_attachments(urls))
+            self.import_files(urls)
         else:
             super(MarkdownEditor, self).insertFromMimeData(source)
         
         
+    def import_files(self, paths: List[str]) -> None:
+        """
+        Imports files as attachments in the background, inserting placeholders for their references at the cursor
+        :param paths: paths of the files
+        :return: None
+        """
+        if paths:
+            self.create_importer().start(paths)
+
+    def create_importer(self) -> AttachmentImporter:
+        """
+        :return: an importer for the current entry, which is kept until it is done
+        """
+        importer = AttachmentImporter(self, self.entry_path)
+        importer.done.connect(lambda: self.import_done(importer))
+        self.imports.append(importer)
+        return importer
+
+    def import_done(self, importer: AttachmentImporter) -> None:
+        self.imports.remove(importer)
+        importer.deleteLater()
+
+    def cancel_imports(self) -> None:
+        for importer in self.imports:
+            importer.cancel()
+
     def keyPressEvent(self, e: QKeyEvent) -> None:
         """
         Overrides keyPressEvent in order to insert new list elements and allow indenting lists with tab
@@ -171,29 +318,225 @@ class MarkdownEditor(QTextEdit):
         super().keyPressEvent(e)
 
 
-# Not currently being used
+class BlockData(QTextBlockUserData):
+    """
+    Whether the inline formats of a block have been applied; they are skipped for blocks that are not visible
+    """
+    __slots__ = ("formatted",)
+
+    def __init__(self, formatted: bool):
+        super(BlockData, self).__init__()
+        self.formatted = formatted
+
+
+def char_format(color: str = "", bold: bool = False, italic: bool = False, background: str = "") -> QTextCharFormat:
+    text_format = QTextCharFormat()
+    if color:
+        text_format.setForeground(QColor(color))
+    if bold:
+        text_format.setFontWeight(QFont.Bold)
+    if italic:
+        text_format.setFontItalic(True)
+    if background:
+        text_format.setBackground(QColor(background))
+    return text_format
+
+
 class MarkdownSyntaxHighlighter(QSyntaxHighlighter):
-    def __init__(self, document: QTextDocument):
-        super(MarkdownSyntaxHighlighter, self).__init__(document)
-        self.formatting = {
-            "h1": "^(.+)[ \t]*\n(=+|-+)[ \t]*\n+",
-            "h2": "/^## (.*$)/gim",
-            "h3": "/^### (.*$)/gim",
-            "blockquote": "/^\> (.*$)/gim",
-            "bold": "/\*\*(.*)\*\*/gim",
-            "italics": "/\*(.*)\*/gim",
-            "link": "/\[(.*?)\]\((.*?)\)/gim"
+    """
+    Highlights markdown in the editor. Fenced code blocks and front matter span several blocks, so whether a block is
+    inside one is kept in its block state; Qt then only highlights the blocks that were edited, and the blocks after
+    them whose state changed. Inline formats are only applied to visible blocks, and to the others when they are
+    scrolled into view. Each pass has a time budget: once it is spent, blocks that are not visible keep their old state,
+    which stops the pass, and are highlighted in later passes between events.
+    """
+    # seconds that a pass may spend on blocks that are not visible
+    BUDGET = 0.005
+    NORMAL = 0
+    FRONT_MATTER = 1
+    # states from this one up are inside a fenced code block; they encode the length and character of the fence
+    FENCE = 2
+
+    HEADING = QRegularExpression(r"^ {0,3}#{1,6}(\s.*)?$")
+    BLOCKQUOTE = QRegularExpression(r"^ {0,3}>.*$")
+    LIST_MARKER = QRegularExpression(r"^\s*(?:[-*+]|\d+[.)])(?=\s)(?: \[[ xX]\])?")
+    HORIZONTAL_RULE = QRegularExpression(r"^ {0,3}([-*_])(?:\s*\1){2,}\s*$")
+    FENCE_LINE = QRegularExpression(r"^ {0,3}(`{3,}|~{3,})")
+    # inline patterns, applied in order so that later ones take precedence
+    INLINE_PATTERNS = [
+        (QRegularExpression(r"(?<![*\w])\*(?![\s*])(.+?)(?<![\s*])\*(?![*\w])|"
+                            r"(?<![_\w])_(?![\s_])(.+?)(?<![\s_])_(?![_\w])"), "italic"),
+        (QRegularExpression(r"(\*\*|__)(?=\S)(.+?)(?<=\S)\1"), "bold"),
+        (QRegularExpression(r"!?\[[^\]]*\]\([^)]*\)|<https?://[^>]+>"), "link"),
+        (QRegularExpression(r"(`+)(?!`).+?(?<!`)\1(?!`)"), "code"),
+    ]
+
+    def __init__(self, editor: QPlainTextEdit):
+        """
+        :param editor: the editor whose document is highlighted; used to find the visible blocks
+        """
+        super(MarkdownSyntaxHighlighter, self).__init__(editor)
+        self.editor = editor
+        # connected before the highlighter's own connection so that each pass starts with a new budget
+        editor.document().contentsChange.connect(self.start_pass)
+        self.deadline = 0.0
+        # first and last block that were skipped when passes ran out of time; the cursor follows edits
+        self.deferred_start = None
+        self.deferred_end = None
+        self.resume_timer = QTimer(self)
+        self.resume_timer.setSingleShot(True)
+        self.resume_timer.timeout.connect(self.highlight_deferred_blocks)
+        self.formats = {
+            "heading": char_format("#1f5fa8", bold=True),
+            "blockquote": char_format("#6a737d", italic=True),
+            "list": char_format("#b05000", bold=True),
+            "rule": char_format("#999999"),
+            "front_matter": char_format("#6a737d"),
+            "code_block": char_format("#3a3a3a", background="#f3f3f3"),
+            "italic": char_format(italic=True),
+            "bold": char_format(bold=True),
+            "link": char_format("#0366d6"),
+            "code": char_format("#3a3a3a", background="#f3f3f3"),
         }
-        for key in self.formatting:
-            expression = QRegularExpression(self.formatting[key])
-            self.formatting[key] = expression
+        # block numbers that are highlighted fully; updated by highlight_visible_blocks
+        self.visible_range = (0, 0)
+        self.editor.verticalScrollBar().valueChanged.connect(self.highlight_visible_blocks)
+        self.setDocument(editor.document())
+
+    def start_pass(self) -> None:
+        self.deadline = time.perf_counter() + self.BUDGET
 
     def highlightBlock(self, text: str) -> None:
-        format = QTextCharFormat()
-        format.setFontWeight(QFont.Bold)
+        previous_state = self.previousBlockState()
+        block = self.currentBlock()
+        first, last = self.visible_range
+        visible = first <= block.blockNumber() <= last
+        if not visible and time.perf_counter() > self.deadline:
+            self.defer(block)
+            return
 
-        iter = self.formatting["h1"].globalMatch(text)
+        # front matter is only recognized at the start of the entry
+        if previous_state == self.FRONT_MATTER or (block.blockNumber() == 0 and text.rstrip() == "---"):
+            self.setFormat(0, len(text), self.formats["front_matter"])
+            self.set_formatted(True)
+            closing = previous_state == self.FRONT_MATTER and text.rstrip() in ("---", "...")
+            self.setCurrentBlockState(self.NORMAL if closing else self.FRONT_MATTER)
+            return
+
+        fence = self.FENCE_LINE.match(text) if "``" in text or "~~" in text else None
+        if previous_state >= self.FENCE:
+            self.setFormat(0, len(text), self.formats["code_block"])
+            self.set_formatted(True)
+            length, tilde = divmod(previous_state - self.FENCE, 2)
+            closing = fence is not None and fence.hasMatch() and fence.capturedLength(1) >= length and \
+                (fence.captured(1)[0] == "~") == bool(tilde) and not text[fence.capturedEnd(1):].strip()
+            self.setCurrentBlockState(self.NORMAL if closing else previous_state)
+            return
+        if fence is not None and fence.hasMatch():
+            self.setFormat(0, len(text), self.formats["code_block"])
+            self.set_formatted(True)
+            self.setCurrentBlockState(self.FENCE + fence.capturedLength(1) * 2 + (fence.captured(1)[0] == "~"))
+            return
+        self.setCurrentBlockState(self.NORMAL)
+
+        self.set_formatted(visible)
+        if visible and text:
+            self.format_inline(text)
+
+    def set_formatted(self, formatted: bool) -> None:
+        data = self.currentBlockUserData()
+        if data is None:
+            self.setCurrentBlockUserData(BlockData(formatted))
+        else:
+            data.formatted = formatted
+
+    def defer(self, block) -> None:
+        """
+        Leaves a block to a later pass, keeping its state so that the current pass stops
+        :param block: the block
+        :return: None
+        """
+        self.setCurrentBlockState(self.currentBlockState())
+        data = self.currentBlockUserData()
+        if data is not None:
+            data.formatted = False
+        self.extend_deferred(block, block)
 
-        while iter.hasNext():
-            next = iter.next()
-            self.setFormat(next.capturedStart(), next.capturedLength(), format)
+    def extend_deferred(self, first, last) -> None:
+        """
+        Adds blocks to the range that is highlighted later
+        :param first: first block of the range
+        :param last: last block of the range; if it is no longer valid, the range extends to the end of the document
+        :return: None
+        """
+        if self.deferred_start is None:
+            self.deferred_start = QTextCursor(first)
+            self.deferred_end = last
+            self.resume_timer.start(0)
+            return
+        if first.position() < self.deferred_start.position():
+            self.deferred_start.setPosition(first.position())
+        if self.deferred_end.isValid() and (not last.isValid() or last.position() > self.deferred_end.position()):
+            self.deferred_end = last
+
+    def highlight_deferred_blocks(self) -> None:
+        """
+        Highlights the blocks that were skipped by earlier passes, for as long as the budget allows
+        :return: None
+        """
+        start, end = self.deferred_start, self.deferred_end
+        self.deferred_start = self.deferred_end = None
+        if start is None or self.document() is None:
+            return
+        # the rest of the document is highlighted if the last skipped block was removed
+        end_position = end.position() if end.isValid() else self.document().characterCount()
+        self.start_pass()
+        block = start.block()
+        while block.isValid() and block.position() <= end_position:
+            if time.perf_counter() > self.deadline:
+                self.extend_deferred(block, end)
+                return
+            self.rehighlightBlock(block)
+            block = block.next()
+
+    def format_inline(self, text: str) -> None:
+        """
+        Applies the formats of a block that is not part of a code block or front matter
+        :param text: text of the block
+        :return: None
+        """
+        if self.HEADING.match(text).hasMatch():
+            self.setFormat(0, len(text), self.formats["heading"])
+            return
+        if self.HORIZONTAL_RULE.match(text).hasMatch():
+            self.setFormat(0, len(text), self.formats["rule"])
+            return
+        if self.BLOCKQUOTE.match(text).hasMatch():
+            self.setFormat(0, len(text), self.formats["blockquote"])
+        marker = self.LIST_MARKER.match(text)
+        if marker.hasMatch():
+            self.setFormat(0, marker.capturedEnd(), self.formats["list"])
+        # most lines have no inline markup, which this check finds faster than running the patterns
+        if not any(char in text for char in "*_[`<"):
+            return
+        for pattern, name in self.INLINE_PATTERNS:
+            matches = pattern.globalMatch(text)
+            while matches.hasNext():
+                match = matches.next()
+                self.setFormat(match.capturedStart(), match.capturedLength(), self.formats[name])
+
+    def highlight_visible_blocks(self) -> None:
+        """
+        Applies the inline formats of the visible blocks that were skipped while they were not visible
+        :return: None
+        """
+        if self.document() is None:
+            return
+        self.visible_range = self.editor.visible_block_range()
+        self.start_pass()
+        block = self.document().findBlockByNumber(self.visible_range[0])
+        while block.isValid() and block.blockNumber() <= self.visible_range[1]:
+            data = block.userData()
+            if data is None or not data.formatted:
+                self.rehighlightBlock(block)
+            block = block.next()
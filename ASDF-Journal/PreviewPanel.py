@@ -2,29 +2,200 @@
 Preview panel that renders the markdown code in the editor
 """
 
+import json
+import multiprocessing
 import os
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from html import escape
+from typing import List
 
-import markdown
-from PyQt5.QtCore import QUrl, Qt
+from PyQt5.QtCore import QUrl, Qt, QObject, pyqtSignal
 from PyQt5.QtGui import QDesktopServices
 from PyQt5.QtWebEngineWidgets import QWebEngineView, QWebEnginePage
 
+import Rendering
+import Tracing
 import Utilities
+from Thumbnails import THUMBNAIL_SCRIPT, ThumbnailCache
+
+# Replaces the children of the content element from start to start + count with the given blocks of html
+PATCH_SCRIPT = """
+function patchBlocks(start, count, blocks) {
+    var content = document.getElementById("content");
+    for (var i = 0; i < count; i++) {
+        content.removeChild(content.children[start]);
+    }
+    var next = content.children[start] || null;
+    for (var j = 0; j < blocks.length; j++) {
+        var block = document.createElement("div");
+        block.className = "md-block";
+        block.innerHTML = blocks[j];
+        content.insertBefore(block, next);
+    }
+}
+"""
+
+
+class RenderWorker(QObject):
+    """
+    Runs markdown conversion in a separate process so that the editor stays responsive. Only the latest job matters:
+    submitting a job cancels the previous one if it has not started, and results of older jobs are not reported. A job
+    that fails in the worker process, which may have been killed, is run again in this process; the process pool is
+    replaced once it is broken.
+    """
+    # emitted with the id of the job and its result
+    finished = pyqtSignal(int, object)
+    # emitted with the id of the job and a description of the error if it also fails in this process
+    failed = pyqtSignal(int, str)
+    # emitted with the result of Rendering.render_file for each prefetched entry
+    prefetched = pyqtSignal(object)
+    # emitted from the executor's thread with the id of a job that failed in the worker process
+    worker_failed = pyqtSignal(int)
+
+    def __init__(self, parent=None):
+        super(RenderWorker, self).__init__(parent)
+        self.executor = self.create_executor()
+        self.job_id = 0
+        self.future = None
+        # function and arguments of the latest job, to run it again if it fails in the worker process
+        self.job = None
+        self.prefetch_futures = []
+        self.worker_failed.connect(self.run_in_process)
+
+    @staticmethod
+    def create_executor() -> ProcessPoolExecutor:
+        # spawn instead of fork, since forking a process that is running Qt threads is unsafe
+        return ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+
+    def submit_to_executor(self, function, *args) -> Future:
+        """
+        Submits a function to the worker process, starting a new one if the previous one died
+        :return: the future of the function
+        """
+        try:
+            return self.executor.submit(function, *args)
+        except BrokenProcessPool:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = self.create_executor()
+            return self.executor.submit(function, *args)
+
+    def submit(self, function, *args) -> int:
+        """
+        Submits a job to the worker process
+        :param function: module-level function to run
+        :param args: arguments of the function
+        :return: the id of the job
+        """
+        self.job_id += 1
+        job_id = self.job_id
+        if self.future is not None:
+            self.future.cancel()
+        # prefetching that has not started yet would delay this job
+        for future in self.prefetch_futures:
+            future.cancel()
+        self.prefetch_futures = []
+        self.job = (function, args)
+        self.future = self.submit_to_executor(function, *args)
+        self.future.add_done_callback(lambda future: self.job_done(job_id, future))
+        return job_id
+
+    def job_done(self, job_id: int, future: Future) -> None:
+        """
+        Called from the executor's thread; the signals are delivered on the GUI thread
+        :return: None
+        """
+        if job_id != self.job_id or future.cancelled():
+            return
+        if future.exception() is None:
+            self.finished.emit(job_id, future.result())
+        else:
+            self.worker_failed.emit(job_id)
+
+    def run_in_process(self, job_id: int) -> None:
+        """
+        Runs a job that failed in the worker process in this one, reporting the error if it fails again
+        :param job_id: the id of the job
+        :return: None
+        """
+        if job_id != self.job_id or self.job is None:
+            return
+        function, args = self.job
+        try:
+            result = function(*args)
+        except Exception as error:
+            self.failed.emit(job_id, "{}: {}".format(type(error).__name__, error))
+            return
+        self.finished.emit(job_id, result)
+
+    def prefetch(self, paths: List[str]) -> None:
+        """
+        Renders entries in the background so that they can be shown immediately when selected
+        :param paths: paths of the entries
+        :return: None
+        """
+        for path in paths:
+            future = self.submit_to_executor(Rendering.render_file, path)
+            future.add_done_callback(self.prefetch_done)
+            self.prefetch_futures.append(future)
+
+    def prefetch_done(self, future: Future) -> None:
+        if not future.cancelled() and future.exception() is None:
+            self.prefetched.emit(future.result())
+
+    def cancel(self) -> None:
+        """
+        Drops the current job; its result will not be reported
+        :return: None
+        """
+        self.job_id += 1
+        if self.future is not None:
+            self.future.cancel()
+
+    def shutdown(self) -> None:
+        self.job_id += 1
+        self.executor.shutdown(wait=False, cancel_futures=True)
 
 
 class PreviewPanel(QWebEngineView):
+    # minimum and maximum delay between an edit and rendering the preview, in milliseconds
+    MIN_RENDER_DELAY = 30
+    MAX_RENDER_DELAY = 1000
+
     def __init__(self, parent):
         super(PreviewPanel, self).__init__(parent)
         self.setPage(WebEnginePage(self))
         self.setContextMenuPolicy(Qt.NoContextMenu)
         self.html_code = ""
         self.placeholder_path = None
+        # markdown source of each block currently shown, whether the page shows separate blocks, and whether it has
+        # finished loading; the page can only be patched when both are true
+        self.blocks: List[str] = []
+        self.block_html = {}
+        self.block_mode = False
+        self.page_ready = False
+        # time.perf_counter() when the page was last set, for tracing how long it takes to load
+        self.load_start = 0.0
+        self.loadFinished.connect(self.page_loaded)
+        self.render_cache = Rendering.RenderCache()
+        self.shown_path = ""
+        # message shown instead of an entry, if any
+        self.notice = ""
+        self.thumbnails = ThumbnailCache(self)
+        self.thumbnails.thumbnail_ready.connect(self.show_thumbnail)
+        # thumbnails that became ready while the page was loading
+        self.pending_thumbnails = []
         self.init_html()
-        self.markdown = markdown.Markdown(
-            extensions=["markdown.extensions.abbr", "markdown.extensions.attr_list", "markdown.extensions.def_list",
-                        "markdown.extensions.fenced_code", "markdown.extensions.footnotes",
-                        "markdown.extensions.md_in_html", "markdown.extensions.tables"])
-        self.setHtml(self.html_code.format(""), self.placeholder_path)
+        # details of the job being rendered: its id, the blocks of the document (None if rendered as a whole),
+        # whether to scroll to the end, and the entry path, text hash and whether the entry was just opened for caching
+        self.pending_job = None
+        self.last_render_time = 0.0
+        self.render_worker = RenderWorker(self)
+        self.render_worker.finished.connect(self.render_finished)
+        self.render_worker.failed.connect(self.render_failed)
+        self.render_worker.prefetched.connect(self.prefetch_finished)
+        self.set_full_html("")
         if Utilities.get_page_zoom():
             self.page().setZoomFactor(Utilities.get_page_zoom())
 
@@ -34,21 +205,218 @@ class PreviewPanel(QWebEngineView):
         :return: None
         """
         css_path = os.path.join(Utilities.get_resources_dir(), "style.css")
-        self.html_code = '<!DOCTYPE html>\n<html>\n<head>\n\t<link rel="stylesheet" href="' + css_path + '">\n</head>\n<body>\n{}\n</body>\n</html>'
+        self.html_code = '<!DOCTYPE html>\n<html>\n<head>\n\t<link rel="stylesheet" href="' + css_path + \
+                         '">\n\t<script>' + PATCH_SCRIPT + THUMBNAIL_SCRIPT + '</script>\n</head>\n<body>\n' \
+                         '<div id="content">{content}</div>\n</body>\n</html>'
         # Needed so that attachment links work in the preview
         self.placeholder_path = QUrl.fromLocalFile(os.path.join(Utilities.get_entries_dir(), "placeholder.txt"))
+        self.block_mode = False
+        self.thumbnails.set_journal(Utilities.get_journal_dir(), Utilities.get_attachment_store()
+                                    if Utilities.get_journal_dir() else None)
+        on_disk = Utilities.get_render_cache_on_disk() and Utilities.get_journal_dir()
+        self.render_cache.set_disk_dir(os.path.join(Utilities.get_journal_dir(), ".render_cache") if on_disk else None)
+
+    def page_html(self, body: str) -> str:
+        """
+        :param body: html of the content
+        :return: the whole page; not built with str.format since the scripts in the head contain braces
+        """
+        return self.html_code.replace("{content}", body, 1)
+
+    def page_loaded(self, ok: bool) -> None:
+        self.page_ready = ok
+        Tracing.record("page load", time.perf_counter() - self.load_start, "preview")
+        for name, source in self.pending_thumbnails:
+            self.show_thumbnail(name, source)
+        self.pending_thumbnails = []
+
+    def show_thumbnail(self, name: str, source: str) -> None:
+        """
+        Shows the thumbnail of an attachment in place of its pending image
+        :param name: file name of the attachment
+        :param source: url of the thumbnail
+        :return: None
+        """
+        if self.page_ready:
+            self.page().runJavaScript("setThumbnail({}, {});".format(json.dumps(name), json.dumps(source)))
+        else:
+            self.pending_thumbnails.append((name, source))
+
+    def render_delay(self) -> int:
+        """
+        :return: how long to wait after an edit before rendering, in milliseconds; longer for documents that are slow
+        to render so that typing is not interrupted by renders that would be immediately outdated
+        """
+        return int(min(max(self.last_render_time * 2000, self.MIN_RENDER_DELAY), self.MAX_RENDER_DELAY))
+
+    def set_full_html(self, body: str) -> None:
+        """
+        Reloads the whole page; used when the page cannot be patched
+        :param body: html of the content
+        :return: None
+        """
+        self.blocks = []
+        self.block_html = {}
+        self.block_mode = False
+        self.page_ready = False
+        self.notice = ""
+        self.load_start = time.perf_counter()
+        with Tracing.span("setHtml", "preview", length=len(body)):
+            self.setHtml(self.page_html(self.thumbnails.rewrite_images(body)), self.placeholder_path)
 
-    def update_preview(self, text, at_end: bool = False) -> None:
+    def update_preview(self, text, at_end: bool = False, path: str = "") -> None:
         """
         Updates the preview with the current text in the editor and scrolls to the bottom if the user added to the end
-        of the document
+        of the document. Cached or prefetched renderings are shown immediately. Otherwise only the blocks that changed
+        are rendered, in the worker process, and then replaced in the page; if every block has already been rendered
+        the page is updated immediately.
         :param text: The markdown text to be rendered
         :param at_end: if the user added to the end of the document
+        :param path: path of the entry being shown, used to cache the rendering
+        :return: None
+        """
+        text_hash = Rendering.content_hash(text) if path else ""
+        opened = path != self.shown_path
+        self.shown_path = path
+        cached = self.render_cache.get(path, text_hash) if path else None
+        if cached is not None:
+            self.render_worker.cancel()
+            self.pending_job = None
+            self.show_rendered(cached, at_end)
+            return
+        if Rendering.CROSS_BLOCK_PATTERN.search(text):
+            job_id = self.render_worker.submit(Rendering.render_document, text)
+            self.pending_job = (job_id, None, at_end, path, text_hash, opened)
+            return
+        blocks = Rendering.split_blocks(text)
+        missing = list({block for block in blocks if block not in self.block_html})
+        if missing:
+            job_id = self.render_worker.submit(Rendering.render_blocks, missing)
+            self.pending_job = (job_id, blocks, at_end, path, text_hash, opened)
+        else:
+            # any job that is still running is older than this text
+            self.render_worker.cancel()
+            self.pending_job = None
+            html = self.show_blocks(blocks, {}, at_end)
+            if path:
+                self.render_cache.put(path, text_hash, {"blocks": blocks, "html": html}, write_disk=opened)
+
+    def show_notice(self, message: str) -> None:
+        """
+        Shows a message instead of an entry
+        :param message: the message
+        :return: None
+        """
+        if message == self.notice:
+            return
+        self.render_worker.cancel()
+        self.pending_job = None
+        self.shown_path = ""
+        self.set_full_html('<p class="notice">' + escape(message) + '</p>')
+        self.notice = message
+
+    def prefetch(self, paths: List[str]) -> None:
+        """
+        Renders the given entries in the background unless they are already cached or too large to be previewed
+        automatically
+        :param paths: paths of the entries
+        :return: None
+        """
+        # entries are at least as many bytes as characters, so this never skips an entry below the limit
+        self.render_worker.prefetch([path for path in paths if path and not self.render_cache.contains(path) and
+                                     os.path.isfile(path) and
+                                     os.path.getsize(path) <= Utilities.get_large_entry_size()])
+
+    def prefetch_finished(self, result) -> None:
+        path, text_hash, rendered = result
+        # the entry may have been opened and rendered while it was being prefetched
+        if not self.render_cache.contains(path):
+            self.render_cache.put(path, text_hash, rendered)
+
+    def show_rendered(self, rendered: dict, at_end: bool) -> None:
+        """
+        Shows a document rendered by Rendering.render_text
+        :param rendered: the rendered document
+        :param at_end: if the user added to the end of the document
+        :return: None
+        """
+        if "blocks" in rendered:
+            self.show_blocks(rendered["blocks"], dict(zip(rendered["blocks"], rendered["html"])), at_end)
+        else:
+            self.set_full_html(rendered["html"])
+            if at_end:
+                self.page().runJavaScript("window.scrollTo(0,document.body.scrollHeight);")
+
+    def render_finished(self, job_id: int, result) -> None:
+        """
+        Shows the result of the latest render job
+        :param job_id: the id of the job
+        :param result: the html and the time taken to render it
+        :return: None
+        """
+        if self.pending_job is None or self.pending_job[0] != job_id:
+            return
+        _, blocks, at_end, path, text_hash, opened = self.pending_job
+        self.pending_job = None
+        html, self.last_render_time = result
+        # timed in the worker process
+        Tracing.record("markdown conversion", self.last_render_time, "preview",
+                       blocks=len(html) if blocks is not None else 1)
+        if blocks is None:
+            rendered = {"html": html}
+            self.show_rendered(rendered, at_end)
+        else:
+            rendered = {"blocks": blocks, "html": self.show_blocks(blocks, html, at_end)}
+        if path:
+            self.render_cache.put(path, text_hash, rendered, write_disk=opened)
+
+    def render_failed(self, job_id: int, error: str) -> None:
+        """
+        Shows why the latest render job failed; the preview is rendered again after the next edit
+        :param job_id: the id of the job
+        :param error: description of the error
         :return: None
         """
-        self.setHtml(self.html_code.format(self.markdown.reset().convert(text)), self.placeholder_path)
+        if self.pending_job is None or self.pending_job[0] != job_id:
+            return
+        self.pending_job = None
+        self.show_notice("The preview could not be rendered. " + error)
+
+    def show_blocks(self, blocks: List[str], new_html: dict, at_end: bool) -> List[str]:
+        """
+        Replaces the blocks that changed since the last update
+        :param blocks: blocks of the document
+        :param new_html: html of blocks that were not rendered before
+        :param at_end: if the user added to the end of the document
+        :return: html of each block
+        """
+        html = [new_html[block] if block in new_html else self.block_html[block] for block in blocks]
+        # thumbnails are applied when blocks are shown, so the html that is cached does not depend on them
+        shown_html = [self.thumbnails.rewrite_images(block_html) for block_html in html]
+        if self.block_mode and self.page_ready:
+            start = 0
+            while start < min(len(blocks), len(self.blocks)) and blocks[start] == self.blocks[start]:
+                start += 1
+            end = 0
+            while end < min(len(blocks), len(self.blocks)) - start and blocks[-1 - end] == self.blocks[-1 - end]:
+                end += 1
+            with Tracing.span("patch blocks", "preview", replaced=len(self.blocks) - start - end):
+                self.page().runJavaScript("patchBlocks({}, {}, {});".format(
+                    start, len(self.blocks) - start - end, json.dumps(shown_html[start:len(blocks) - end])))
+        else:
+            self.block_mode = True
+            self.page_ready = False
+            self.notice = ""
+            self.load_start = time.perf_counter()
+            with Tracing.span("setHtml", "preview", blocks=len(blocks)):
+                self.setHtml(self.page_html(
+                    "".join('<div class="md-block">' + block + '</div>' for block in shown_html)),
+                    self.placeholder_path)
+        self.blocks = blocks
+        self.block_html = dict(zip(blocks, html))
         if at_end:
             self.page().runJavaScript("window.scrollTo(0,document.body.scrollHeight);")
+        return html
 
 
 class WebEnginePage(QWebEnginePage):
@@ -0,0 +1,213 @@
+"""
+Log of the unsaved edits to the open entry, so that they can be recovered if the app crashes
+"""
+
+import json
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+
+RECOVERY_LOG_NAME = ".recovery.log"
+
+
+class Recovery:
+    """
+    Unsaved text of an entry, found in the recovery log of a journal
+    """
+    __slots__ = ("entry_path", "text")
+
+    def __init__(self, entry_path: str, text: str):
+        self.entry_path = entry_path
+        self.text = text
+
+
+class RecoveryLog:
+    """
+    Appends the edits made to the open entry since it was last saved to a log in the journal folder. Edits are queued by
+    the GUI thread and written by a background thread, which batches the edits made during each interval into one write
+    and fsync. Each edit is stored as its position, the number of characters it removed and the text it inserted, so an
+    autosave costs the same however long the entry is. The log starts with the size and mtime of the saved entry the
+    edits apply to, and is removed when the entry is saved or another entry is opened.
+    """
+
+    def __init__(self, interval: float = 2.0):
+        """
+        :param interval: seconds between writes of the log
+        """
+        self.interval = interval
+        self.log_path = ""
+        self.journal_dir = ""
+        self.entry_path = ""
+        self.has_header = False
+        # (log path, record) waiting to be written; a dict starts a new log, a list is an edit and None removes the log
+        self.pending: List[Tuple[str, Optional[object]]] = []
+        self.lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="RecoveryLog", daemon=True)
+        self.thread.start()
+
+    def reset(self, journal_dir: str, entry_path: str) -> None:
+        """
+        Drops the logged edits; called whenever the editor text matches the saved entry, after loading or saving it
+        :param journal_dir: folder of the journal
+        :param entry_path: path of the entry in the editor, or an empty string if there is none
+        :return: None
+        """
+        with self.lock:
+            self.pending = [item for item in self.pending if item[0] != self.log_path]
+            if self.has_header:
+                self.pending.append((self.log_path, None))
+            self.journal_dir = journal_dir
+            self.entry_path = entry_path
+            self.log_path = os.path.join(journal_dir, RECOVERY_LOG_NAME) if journal_dir and entry_path else ""
+            self.has_header = False
+        self._wake.set()
+
+    def record(self, position: int, removed: int, text: str) -> None:
+        """
+        Queues an edit of the entry in the editor
+        :param position: position of the edit, in UTF-16 code units as counted by Qt
+        :param removed: number of UTF-16 code units removed
+        :param text: text inserted
+        :return: None
+        """
+        with self.lock:
+            if not self.log_path:
+                return
+            if not self.has_header:
+                try:
+                    stat_result = os.stat(self.entry_path)
+                except OSError:
+                    return
+                self.pending.append((self.log_path, {"entry": os.path.relpath(self.entry_path, self.journal_dir),
+                                                     "size": stat_result.st_size,
+                                                     "mtime_ns": stat_result.st_mtime_ns}))
+                self.has_header = True
+            last = self.pending[-1][1] if self.pending else None
+            # consecutive typing is merged into one edit
+            if not removed and isinstance(last, list) and position == last[0] + utf16_length(last[2]):
+                last[2] += text
+            else:
+                self.pending.append((self.log_path, [position, removed, text]))
+        self._wake.set()
+
+    def _run(self) -> None:
+        while not self._closed.is_set():
+            self._wake.wait()
+            # lets the edits made in the meantime be written with the same fsync
+            self._closed.wait(self.interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except OSError:
+                # the edits stay in the editor; only their recovery is lost
+                pass
+
+    def flush(self) -> None:
+        """
+        Writes the queued edits to the log and flushes it to disk
+        :return: None
+        """
+        with self.lock:
+            pending, self.pending = self.pending, []
+            # edits still being typed are serialized as they are now
+            pending = [(log_path, list(record) if isinstance(record, list) else record)
+                       for log_path, record in pending]
+        # log path -> whether the log is started over and the lines to write, or None to remove it
+        writes: Dict[str, Optional[Tuple[bool, List[str]]]] = {}
+        for log_path, record in pending:
+            if record is None:
+                writes[log_path] = None
+            elif isinstance(record, dict):
+                writes[log_path] = (True, [json.dumps(record)])
+            elif writes.get(log_path) is not None:
+                writes[log_path][1].append(json.dumps(record, ensure_ascii=False))
+            else:
+                writes[log_path] = (False, [json.dumps(record, ensure_ascii=False)])
+        for log_path, batch in writes.items():
+            if batch is None:
+                try:
+                    os.remove(log_path)
+                except FileNotFoundError:
+                    pass
+                continue
+            start_over, lines = batch
+            with open(log_path, "w" if start_over else "a", encoding="utf8") as log:
+                log.write("\n".join(lines) + "\n")
+                log.flush()
+                os.fsync(log.fileno())
+
+    def close(self) -> None:
+        """
+        Stops the background thread and removes the log; called when the app exits normally
+        :return: None
+        """
+        self.reset("", "")
+        self._closed.set()
+        self._wake.set()
+        self.thread.join()
+        self.flush()
+
+
+def utf16_length(text: str) -> int:
+    """
+    :return: the length of the text as counted by Qt, where characters outside the basic plane take two units
+    """
+    if text.isascii():
+        return len(text)
+    return len(text) + sum(1 for char in text if ord(char) > 0xFFFF)
+
+
+def find_recovery(journal_dir: str) -> Optional[Recovery]:
+    """
+    Reads the recovery log of a journal. The edits are only applied if the log is newer than the entry and the entry is
+    the one they were made to, i.e. it was neither saved nor changed by another program afterwards.
+    :param journal_dir: folder of the journal
+    :return: the unsaved text, or None if there is nothing to recover
+    """
+    log_path = os.path.join(journal_dir, RECOVERY_LOG_NAME)
+    try:
+        with open(log_path, encoding="utf8") as log:
+            log_mtime = os.fstat(log.fileno()).st_mtime_ns
+            # the edits may contain line separators that splitlines would split on
+            lines = log.read().rstrip("\n").split("\n")
+        header = json.loads(lines[0])
+        entry_path = os.path.join(journal_dir, header["entry"])
+        stat_result = os.stat(entry_path)
+    except (OSError, ValueError, IndexError, KeyError, TypeError):
+        return None
+    if stat_result.st_size != header["size"] or stat_result.st_mtime_ns != header["mtime_ns"] or \
+            log_mtime < stat_result.st_mtime_ns:
+        return None
+    try:
+        # read like the editor reads entries, which the positions refer to
+        with open(entry_path, encoding="utf8") as entry:
+            saved_text = entry.read()
+    except (OSError, ValueError):
+        return None
+    # Qt counts positions in UTF-16 code units
+    text = bytearray(saved_text.encode("utf-16-le"))
+    for line in lines[1:]:
+        try:
+            position, removed, inserted = json.loads(line)
+        except ValueError:
+            # the last edit may have been cut off by the crash
+            break
+        text[position * 2:(position + removed) * 2] = inserted.encode("utf-16-le")
+    recovered_text = text.decode("utf-16-le")
+    if recovered_text == saved_text:
+        return None
+    return Recovery(entry_path, recovered_text)
+
+
+def discard_recovery(journal_dir: str) -> None:
+    """
+    Removes the recovery log of a journal
+    :param journal_dir: folder of the journal
+    :return: None
+    """
+    try:
+        os.remove(os.path.join(journal_dir, RECOVERY_LOG_NAME))
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,254 @@
+"""
+Markdown conversion used by the preview; has no Qt dependency so that it can run in a worker process
+"""
+
+import hashlib
+import json
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    import markdown
+
+MARKDOWN_EXTENSIONS = ["markdown.extensions.abbr", "markdown.extensions.attr_list", "markdown.extensions.def_list",
+                       "markdown.extensions.fenced_code", "markdown.extensions.footnotes",
+                       "markdown.extensions.md_in_html", "markdown.extensions.tables"]
+
+FENCE_PATTERN = re.compile(r"^\s{0,3}(`{3,}|~{3,})")
+LIST_PATTERN = re.compile(r"^\s{0,3}([*+-]|\d+[.)])\s")
+# Footnotes, abbreviations, reference links and raw html can affect or span other blocks, so documents containing them
+# are always rendered as a whole
+CROSS_BLOCK_PATTERN = re.compile(r"\[\^|^\s{0,3}\*\[[^\]]+\]:|^\s{0,3}\[[^\]]+\]:|^\s{0,3}<[a-zA-Z!/]", re.MULTILINE)
+
+_markdown = None
+
+
+def create_markdown() -> "markdown.Markdown":
+    """
+    :return: a markdown converter with the extensions used by the preview
+    """
+    # imported on first use, since the interface only converts markdown in the worker process
+    import markdown
+    return markdown.Markdown(extensions=MARKDOWN_EXTENSIONS)
+
+
+def get_markdown() -> "markdown.Markdown":
+    """
+    :return: the converter of the current process, creating it on first use
+    """
+    global _markdown
+    if _markdown is None:
+        _markdown = create_markdown()
+    return _markdown
+
+
+def split_blocks(text: str) -> List[str]:
+    """
+    Splits markdown into top-level blocks that can be rendered independently. Blocks are separated by blank lines,
+    except inside fenced code, and indented text, list items and definitions stay with the block before them.
+    :param text: markdown text
+    :return: list of blocks
+    """
+    blocks = []
+    current = []
+    fence = None
+    after_blank = False
+    for line in text.split("\n"):
+        if fence:
+            current.append(line)
+            if line.strip().startswith(fence):
+                fence = None
+            continue
+        if not line.strip():
+            after_blank = True
+            if current:
+                current.append(line)
+            continue
+        if after_blank and current:
+            continues_block = line[0] in " \t" or line.startswith(": ") or \
+                (LIST_PATTERN.match(line) and LIST_PATTERN.match(current[0]))
+            if not continues_block:
+                blocks.append("\n".join(current).rstrip("\n"))
+                current = []
+        after_blank = False
+        match = FENCE_PATTERN.match(line)
+        if match:
+            fence = match.group(1)
+        current.append(line)
+    if current:
+        blocks.append("\n".join(current).rstrip("\n"))
+    return blocks
+
+
+def render_document(text: str) -> Tuple[str, float]:
+    """
+    :param text: markdown text
+    :return: the text rendered as html, and the time taken in seconds
+    """
+    start = time.perf_counter()
+    html = get_markdown().reset().convert(text)
+    return html, time.perf_counter() - start
+
+
+def render_blocks(blocks: List[str]) -> Tuple[Dict[str, str], float]:
+    """
+    :param blocks: blocks of markdown
+    :return: a mapping of each block to its html, and the time taken in seconds
+    """
+    start = time.perf_counter()
+    converter = get_markdown()
+    html = {block: converter.reset().convert(block) for block in blocks}
+    return html, time.perf_counter() - start
+
+
+def content_hash(text: str) -> str:
+    """
+    :param text: markdown text
+    :return: hash identifying the text
+    """
+    return hashlib.sha1(text.encode("utf8")).hexdigest()
+
+
+def render_text(text: str) -> dict:
+    """
+    Renders a whole document, split into blocks unless it has to be rendered as a whole
+    :param text: markdown text
+    :return: {"html": html} for documents rendered as a whole, otherwise {"blocks": blocks, "html": html of each block}
+    """
+    if CROSS_BLOCK_PATTERN.search(text):
+        return {"html": render_document(text)[0]}
+    blocks = split_blocks(text)
+    html = render_blocks(blocks)[0]
+    return {"blocks": blocks, "html": [html[block] for block in blocks]}
+
+
+def render_file(path: str) -> Tuple[str, str, dict]:
+    """
+    Reads and renders an entry; used to prefetch entries in the worker process
+    :param path: path of the entry
+    :return: the path, the hash of its text and the rendered document as returned by render_text
+    """
+    with open(path, encoding="utf8") as entry:
+        text = entry.read()
+    return path, content_hash(text), render_text(text)
+
+
+def rendered_size(rendered: dict) -> int:
+    """
+    :return: approximate number of bytes used by a rendered document
+    """
+    if "blocks" in rendered:
+        return sum(len(block) for block in rendered["blocks"]) + sum(len(html) for html in rendered["html"])
+    return len(rendered["html"])
+
+
+class RenderCache:
+    """
+    Least recently used cache of rendered documents, keyed by entry path and the hash of the rendered text. Holds one
+    version per entry and is bounded by the total size of the html. Can optionally keep a second tier on disk.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, max_disk_bytes: int = 256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.total_bytes = 0
+        self._entries: "OrderedDict[str, Tuple[str, dict, int]]" = OrderedDict()
+        self.disk_dir: Optional[str] = None
+        self._disk_bytes = 0
+
+    def set_disk_dir(self, disk_dir: Optional[str]) -> None:
+        """
+        :param disk_dir: directory for the on-disk tier, or None to only cache in memory
+        :return: None
+        """
+        self.disk_dir = disk_dir
+        self._disk_bytes = 0
+        if disk_dir:
+            try:
+                os.makedirs(disk_dir, exist_ok=True)
+                with os.scandir(disk_dir) as scan:
+                    self._disk_bytes = sum(dir_entry.stat().st_size for dir_entry in scan)
+            except OSError:
+                self.disk_dir = None
+
+    def _disk_path(self, path: str) -> str:
+        return os.path.join(self.disk_dir, hashlib.sha1(path.encode("utf8")).hexdigest() + ".json")
+
+    def contains(self, path: str) -> bool:
+        """
+        :return: whether any version of the entry is cached in memory
+        """
+        return path in self._entries
+
+    def get(self, path: str, text_hash: str) -> Optional[dict]:
+        """
+        :param path: path of the entry
+        :param text_hash: hash of the current text of the entry
+        :return: the rendered document, or None if that version of the entry is not cached
+        """
+        cached = self._entries.get(path)
+        if cached is not None and cached[0] == text_hash:
+            self._entries.move_to_end(path)
+            return cached[1]
+        if self.disk_dir:
+            try:
+                with open(self._disk_path(path), encoding="utf8") as cache_file:
+                    stored = json.load(cache_file)
+            except (OSError, ValueError):
+                return None
+            if stored.get("hash") == text_hash:
+                self.put(path, text_hash, stored["rendered"], write_disk=False)
+                return stored["rendered"]
+        return None
+
+    def put(self, path: str, text_hash: str, rendered: dict, write_disk: bool = True) -> None:
+        """
+        Caches a rendered document, replacing any other version of the same entry
+        :param path: path of the entry
+        :param text_hash: hash of the rendered text
+        :param rendered: the rendered document as returned by render_text
+        :param write_disk: whether to also write it to the on-disk tier
+        :return: None
+        """
+        size = rendered_size(rendered)
+        previous = self._entries.pop(path, None)
+        if previous is not None:
+            self.total_bytes -= previous[2]
+        if size > self.max_bytes:
+            return
+        self._entries[path] = (text_hash, rendered, size)
+        self.total_bytes += size
+        while self.total_bytes > self.max_bytes:
+            _, (_, _, evicted_size) = self._entries.popitem(last=False)
+            self.total_bytes -= evicted_size
+        if write_disk and self.disk_dir:
+            self._write_disk(path, text_hash, rendered)
+
+    def _write_disk(self, path: str, text_hash: str, rendered: dict) -> None:
+        disk_path = self._disk_path(path)
+        try:
+            if os.path.exists(disk_path):
+                self._disk_bytes -= os.path.getsize(disk_path)
+            with open(disk_path, "w", encoding="utf8") as cache_file:
+                json.dump({"hash": text_hash, "rendered": rendered}, cache_file)
+            self._disk_bytes += os.path.getsize(disk_path)
+            if self._disk_bytes > self.max_disk_bytes:
+                self._trim_disk()
+        except OSError:
+            pass
+
+    def _trim_disk(self) -> None:
+        """
+        Removes the least recently written files until the on-disk tier is at most half of its maximum size
+        :return: None
+        """
+        with os.scandir(self.disk_dir) as scan:
+            files = sorted((dir_entry.stat().st_mtime, dir_entry.stat().st_size, dir_entry.path) for dir_entry in scan)
+        for _, size, path in files:
+            if self._disk_bytes <= self.max_disk_bytes // 2:
+                break
+            os.remove(path)
+            self._disk_bytes -= size
@@ -0,0 +1,191 @@
+"""
+Full-text search over the entries in a journal, stored as an SQLite FTS5 inverted index in the journal folder
+"""
+
+import os
+import queue
+import re
+import sqlite3
+import threading
+from typing import Iterable, List, Optional, Tuple
+
+from EntryIndex import Entry
+
+SEARCH_FILE_NAME = ".journal_search.sqlite"
+# weights of the title and body columns when ranking results
+TITLE_WEIGHT = 5.0
+BODY_WEIGHT = 1.0
+# number of entries indexed per transaction
+BATCH_SIZE = 500
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+# (file name, title, size, mtime) of an entry
+EntryInfo = Tuple[str, str, int, int]
+
+
+def build_query(text: str) -> str:
+    """
+    Converts text typed by the user into an FTS5 query that matches entries containing every word as a prefix
+    :param text: search text
+    :return: the FTS5 query, or an empty string if the text has no words
+    """
+    return " ".join('"{}"*'.format(token) for token in TOKEN_PATTERN.findall(text))
+
+
+class SearchIndex:
+    """
+    Keeps an inverted index of entry titles and bodies. Updates are queued and applied by a background thread, so
+    indexing never blocks the interface, while searches are answered directly from the index on disk.
+    """
+
+    def __init__(self, journal_dir: str):
+        self.journal_dir = journal_dir
+        self.entries_dir = os.path.join(journal_dir, "entries")
+        self.db_path = os.path.join(journal_dir, SEARCH_FILE_NAME)
+        self.available = False
+        self._jobs = queue.Queue()
+        # set by close to stop the worker between batches, without applying the updates still queued
+        self._stop = threading.Event()
+        self._read_db = None
+        db = None
+        try:
+            db = self._connect()
+            with db:
+                db.execute("CREATE TABLE IF NOT EXISTS files (id INTEGER PRIMARY KEY, name TEXT UNIQUE, size INTEGER, "
+                           "mtime INTEGER)")
+                db.execute("CREATE VIRTUAL TABLE IF NOT EXISTS entries USING fts5(title, body, "
+                           "tokenize='unicode61 remove_diacritics 2', prefix='2 3')")
+                db.execute("INSERT INTO entries(entries, rank) VALUES('rank', 'bm25({}, {})')".format(
+                    TITLE_WEIGHT, BODY_WEIGHT))
+            self._read_db = db
+            self.available = True
+        except sqlite3.Error:
+            # the journal folder is not writable or sqlite was built without FTS5
+            if db is not None:
+                db.close()
+            return
+        self._worker = threading.Thread(target=self._run, name="SearchIndex", daemon=True)
+        self._worker.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.db_path, timeout=10)
+        db.execute("PRAGMA journal_mode=WAL")
+        return db
+
+    def sync(self, entries: Iterable[Entry]) -> None:
+        """
+        Queues a comparison of the whole journal with the index; only entries whose size or mtime changed are read
+        :param entries: every entry in the journal
+        :return: None
+        """
+        if self.available:
+            self._jobs.put(("sync", [self._entry_info(entry) for entry in entries], []))
+
+    def update(self, updated: Iterable[Entry], removed: Iterable[str]) -> None:
+        """
+        Queues changes to individual entries
+        :param updated: entries that were added or modified
+        :param removed: file names of entries that were removed
+        :return: None
+        """
+        if self.available:
+            self._jobs.put(("update", [self._entry_info(entry) for entry in updated], list(removed)))
+
+    @staticmethod
+    def _entry_info(entry: Entry) -> EntryInfo:
+        return entry.name, entry.title, entry.size, entry.mtime
+
+    def search(self, text: str, limit: Optional[int] = None) -> List[str]:
+        """
+        Finds entries whose title or body contain every word in the text, best matches first
+        :param text: search text
+        :param limit: maximum number of results
+        :return: file names of the matching entries
+        """
+        query = build_query(text)
+        if not query or not self.available:
+            return []
+        try:
+            return [name for name, in self._read_db.execute(
+                "SELECT files.name FROM entries JOIN files ON files.id = entries.rowid WHERE entries MATCH ? "
+                "ORDER BY rank LIMIT ?", (query, -1 if limit is None else limit))]
+        except sqlite3.Error:
+            return []
+
+    def wait(self) -> None:
+        """
+        Blocks until every queued update has been applied
+        :return: None
+        """
+        if self.available:
+            self._jobs.join()
+
+    def close(self) -> None:
+        if self.available:
+            self.available = False
+            self._stop.set()
+            # each batch is committed on its own, so the next sync indexes whatever was dropped here
+            try:
+                while True:
+                    self._jobs.get_nowait()
+                    self._jobs.task_done()
+            except queue.Empty:
+                pass
+            self._jobs.put(None)
+            self._worker.join()
+            self._read_db.close()
+
+    def _run(self) -> None:
+        """
+        Applies queued updates on the background thread
+        :return: None
+        """
+        db = self._connect()
+        while True:
+            job = self._jobs.get()
+            try:
+                if job is None:
+                    break
+                if self._stop.is_set():
+                    continue
+                kind, updated, removed = job
+                if kind == "sync":
+                    stored = {name: (size, mtime) for name, size, mtime in
+                              db.execute("SELECT name, size, mtime FROM files")}
+                    names = {entry[0] for entry in updated}
+                    removed = [name for name in stored if name not in names]
+                    updated = [entry for entry in updated if stored.get(entry[0]) != (entry[2], entry[3])]
+                self._apply(db, updated, removed)
+            except sqlite3.Error:
+                pass
+            finally:
+                self._jobs.task_done()
+        db.close()
+
+    def _apply(self, db: sqlite3.Connection, updated: List[EntryInfo], removed: List[str]) -> None:
+        with db:
+            for name in removed:
+                self._remove(db, name)
+        for start in range(0, len(updated), BATCH_SIZE):
+            if self._stop.is_set():
+                return
+            with db:
+                for name, title, size, mtime in updated[start:start + BATCH_SIZE]:
+                    try:
+                        with open(os.path.join(self.entries_dir, name), encoding="utf8", errors="replace") as entry:
+                            body = entry.read()
+                    except OSError:
+                        # removed before it could be indexed; the removal is queued after this update
+                        continue
+                    self._remove(db, name)
+                    cursor = db.execute("INSERT INTO files (name, size, mtime) VALUES (?, ?, ?)", (name, size, mtime))
+                    db.execute("INSERT INTO entries (rowid, title, body) VALUES (?, ?, ?)",
+                               (cursor.lastrowid, title, body))
+
+    @staticmethod
+    def _remove(db: sqlite3.Connection, name: str) -> None:
+        row = db.execute("SELECT id FROM files WHERE name = ?", (name,)).fetchone()
+        if row:
+            db.execute("DELETE FROM entries WHERE rowid = ?", row)
+            db.execute("DELETE FROM files WHERE id = ?", row)
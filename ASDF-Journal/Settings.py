@@ -0,0 +1,174 @@
+"""
+Process-wide settings store backed by data.json
+"""
+
+import atexit
+import json
+import os
+import stat
+import tempfile
+import time
+from contextlib import contextmanager
+
+
+# Values used when data.json is first created, or when a setting added in a later version is missing from it
+DEFAULT_DATA = {
+    "journal_dir": "",
+    "page_zoom": 1,
+    "splitter_sizes": [],
+    "toggle_selector": True,
+    "toggle_editor": True,
+    "toggle_preview": True,
+    "datetime_format": "%Y-%m-%d %H%M",
+    "editor_font_size": 12,
+    "entry_seperator": "\n\n-----\n-----\n\n",
+    "render_cache_on_disk": False,
+    "attachment_export_mode": "copy",
+    "pasted_image_format": "png",
+    "pasted_image_quality": -1,
+    "pasted_image_max_dimension": 0,
+    "autosave_interval": 2,
+    "large_entry_size": 1000000,
+    "tracing": False
+}
+
+
+class Settings:
+    """
+    Loads data.json once and serves reads from memory. Writes are buffered and flushed to disk with a single atomic
+    temp-file-plus-rename, and the file is reloaded if it is edited externally (detected by its mtime).
+    """
+
+    def __init__(self, path: str, check_interval: float = 1.0):
+        """
+        :param path: path of data.json
+        :param check_interval: minimum number of seconds between mtime checks for external edits
+        """
+        self.path = path
+        self.check_interval = check_interval
+        self._data = None
+        self._mtime = None
+        self._last_check = 0.0
+        self._pending = {}
+        self._batch_depth = 0
+        # counters used by the benchmarks to show how much file I/O is done
+        self.reads = 0
+        self.writes = 0
+
+    def _load(self) -> None:
+        """
+        Reads data.json from disk, keeping any values that have not been flushed yet
+        :return: None
+        """
+        with open(self.path, "r") as data_file:
+            self._mtime = os.fstat(data_file.fileno()).st_mtime_ns
+            self._data = json.load(data_file)
+        self._data.update(self._pending)
+        self._last_check = time.monotonic()
+        self.reads += 1
+
+    def _check_external_change(self) -> None:
+        """
+        Reloads data.json if it has been modified since it was last read or written
+        :return: None
+        """
+        if self._data is None:
+            self._load()
+            return
+        now = time.monotonic()
+        if now - self._last_check < self.check_interval:
+            return
+        self._last_check = now
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime != self._mtime:
+            self._load()
+
+    def get(self, field: str):
+        """
+        :param field: the key of the value to retrieve
+        :return: the requested value
+        """
+        self._check_external_change()
+        if field not in self._data:
+            return DEFAULT_DATA[field]
+        return self._data[field]
+
+    def set(self, field: str, value) -> None:
+        """
+        Sets a value; it is written to disk immediately unless inside a batch
+        :param field: the field to alter the value of
+        :param value: the value to set
+        :return: None
+        """
+        self.update({field: value})
+
+    def update(self, values: dict) -> None:
+        """
+        Sets several values with a single write
+        :param values: mapping of fields to values
+        :return: None
+        """
+        self._check_external_change()
+        self._data.update(values)
+        self._pending.update(values)
+        if not self._batch_depth:
+            self.flush()
+
+    @contextmanager
+    def batch(self):
+        """
+        Context manager that coalesces all writes made inside it into a single flush
+        """
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if not self._batch_depth:
+                self.flush()
+
+    def flush(self) -> None:
+        """
+        Atomically writes pending changes to data.json
+        :return: None
+        """
+        if not self._pending:
+            return
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, temp_path = tempfile.mkstemp(prefix=".data-", suffix=".json", dir=directory)
+        try:
+            with os.fdopen(fd, "w") as temp_file:
+                json.dump(self._data, temp_file, indent=4)
+                temp_file.flush()
+                os.fsync(temp_file.fileno())
+            if os.path.exists(self.path):
+                os.chmod(temp_path, stat.S_IMODE(os.stat(self.path).st_mode))
+            os.replace(temp_path, self.path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        self._mtime = os.stat(self.path).st_mtime_ns
+        self._pending.clear()
+        self.writes += 1
+
+
+_settings = None
+
+
+def get_settings(path: str) -> Settings:
+    """
+    Gets the process-wide settings object, creating it on first use
+    :param path: path of data.json
+    :return: the shared Settings instance
+    """
+    global _settings
+    if _settings is None or _settings.path != path:
+        if _settings is not None:
+            _settings.flush()
+        _settings = Settings(path)
+        atexit.register(_settings.flush)
+    return _settings
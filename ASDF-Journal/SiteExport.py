@@ -0,0 +1,311 @@
+"""
+Exports a journal as a static HTML site: a page for each entry, index pages for each year and month, and the
+attachments. Entries are converted by a pool of processes with the extensions used by the preview, and only entries that
+changed since the last export are converted again. Has no Qt dependency.
+"""
+
+import json
+import multiprocessing
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime
+from html import escape
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import quote
+
+import Export
+import Rendering
+import Tracing
+from EntryIndex import ENTRY_EXTENSION, Entry, entry_display_text
+
+SITE_MANIFEST_NAME = ".site_manifest.json"
+# change when the pages change, so that the next export converts every entry again
+SITE_VERSION = 1
+ENTRIES_DIR_NAME = "entries"
+# entry pages link to ../attachments, like the entries themselves, so the attachments go next to the entry pages
+ATTACHMENTS_DIR_NAME = "attachments"
+STYLE_NAME = "style.css"
+UNDATED_PAGE_NAME = "undated.html"
+# entries converted by a worker at a time; larger batches spend less time passing work between processes
+BATCH_SIZE = 32
+# fewer entries than this are converted in this process, since starting the pool takes longer than converting them
+SERIAL_LIMIT = 64
+
+PAGE_TEMPLATE = '<!DOCTYPE html>\n<html>\n<head>\n\t<meta charset="utf-8">\n\t<title>{title}</title>\n' \
+                '\t<link rel="stylesheet" href="{root}' + STYLE_NAME + '">\n</head>\n<body>\n<nav>{nav}</nav>\n' \
+                '<div id="content">{content}</div>\n</body>\n</html>\n'
+
+# (path of the entry, path of its page, title of the page, navigation html) of an entry to convert
+PageJob = Tuple[str, str, str, str]
+
+
+class SiteStats:
+    """
+    What a site export did: how many entries were converted, left untouched or removed, and how long it took
+    """
+    __slots__ = ("converted", "skipped", "removed", "failed", "index_pages", "seconds", "cancelled")
+
+    def __init__(self):
+        self.converted = 0
+        self.skipped = 0
+        self.removed = 0
+        # names of entries that could not be converted
+        self.failed = []
+        self.index_pages = 0
+        self.seconds = 0.0
+        self.cancelled = False
+
+    @property
+    def entries_per_second(self) -> float:
+        return self.converted / self.seconds if self.seconds else 0.0
+
+    def __repr__(self):
+        return "SiteStats(converted={}, skipped={}, removed={}, failed={}, index_pages={}, seconds={:.2f}, " \
+               "entries_per_second={:.0f})".format(self.converted, self.skipped, self.removed, len(self.failed),
+                                                   self.index_pages, self.seconds, self.entries_per_second)
+
+
+def page_name(entry_name: str) -> str:
+    """
+    :param entry_name: file name of an entry
+    :return: file name of the entry's page
+    """
+    return entry_name[:-len(ENTRY_EXTENSION)] + ".html"
+
+
+def month_name(year: int, month: int) -> str:
+    return datetime(year, month, 1).strftime("%B")
+
+
+def entry_navigation(entry: Entry, title: str) -> str:
+    """
+    :param entry: an entry
+    :param title: title of the journal
+    :return: links from an entry page to the index pages it is listed on
+    """
+    nav = '<a href="../index.html">{}</a>'.format(escape(title))
+    if entry.timestamp is None:
+        return nav + ' / <a href="../{}">Undated</a>'.format(UNDATED_PAGE_NAME)
+    year = entry.timestamp.year
+    month = entry.timestamp.month
+    return nav + ' / <a href="../{0}/index.html">{0}</a> / <a href="../{0}/{1:02}.html">{2}</a>'.format(
+        year, month, month_name(year, month))
+
+
+def render_entries(jobs: List[PageJob]) -> Tuple[List[str], List[str], float]:
+    """
+    Converts entries to pages; runs in the worker processes
+    :param jobs: the entries to convert
+    :return: paths of the entries converted, paths of the entries that could not be read, and the time spent converting
+    """
+    converted = []
+    failed = []
+    total = 0.0
+    for entry_path, output_path, title, nav in jobs:
+        try:
+            with open(entry_path, encoding="utf8") as entry:
+                text = entry.read()
+        except (OSError, ValueError):
+            failed.append(entry_path)
+            continue
+        content, seconds = Rendering.render_document(text)
+        total += seconds
+        with open(output_path, "w", encoding="utf8") as page:
+            page.write(PAGE_TEMPLATE.format(title=escape(title), root="../", nav=nav, content=content))
+        converted.append(entry_path)
+    return converted, failed, total
+
+
+def entry_list(entries: List[Entry], root: str) -> str:
+    """
+    :param entries: entries listed on an index page
+    :param root: path from the index page to the site folder
+    :return: a list of links to the entry pages
+    """
+    return "<ul>\n" + "".join('<li><a href="{}{}/{}">{}</a></li>\n'.format(
+        root, ENTRIES_DIR_NAME, quote(page_name(entry.name)), escape(entry_display_text(entry.name)))
+        for entry in entries) + "</ul>"
+
+
+def index_pages(entries: List[Entry], title: str) -> Dict[str, str]:
+    """
+    :param entries: every entry in the journal, oldest first
+    :param title: title of the journal
+    :return: the html of each index page, keyed by its path relative to the site folder
+    """
+    years: Dict[int, Dict[int, List[Entry]]] = {}
+    undated = []
+    for entry in entries:
+        if entry.timestamp is None:
+            undated.append(entry)
+        else:
+            years.setdefault(entry.timestamp.year, {}).setdefault(entry.timestamp.month, []).append(entry)
+    # entries are sorted by name, which is only chronological if the datetime format is
+    years = {year: dict(sorted(months.items())) for year, months in sorted(years.items())}
+
+    pages = {}
+    home = '<a href="../index.html">{}</a>'.format(escape(title))
+    for year, months in years.items():
+        for month, month_entries in months.items():
+            pages[os.path.join(str(year), "{:02}.html".format(month))] = PAGE_TEMPLATE.format(
+                title=escape("{} {} - {}".format(month_name(year, month), year, title)), root="../",
+                nav=home + ' / <a href="index.html">{}</a>'.format(year),
+                content="<h1>{} {}</h1>\n{}".format(month_name(year, month), year, entry_list(month_entries, "../")))
+        pages[os.path.join(str(year), "index.html")] = PAGE_TEMPLATE.format(
+            title=escape("{} - {}".format(year, title)), root="../", nav=home,
+            content="<h1>{}</h1>\n<ul>\n{}</ul>".format(year, "".join(
+                '<li><a href="{:02}.html">{}</a> ({})</li>\n'.format(month, month_name(year, month), len(month_entries))
+                for month, month_entries in months.items())))
+    if undated:
+        pages[UNDATED_PAGE_NAME] = PAGE_TEMPLATE.format(
+            title=escape("Undated - " + title), root="", nav='<a href="index.html">{}</a>'.format(escape(title)),
+            content="<h1>Undated</h1>\n" + entry_list(undated, ""))
+    links = "".join('<li><a href="{0}/index.html">{0}</a> ({1})</li>\n'.format(
+        year, sum(len(month_entries) for month_entries in months.values())) for year, months in years.items())
+    if undated:
+        links += '<li><a href="{}">Undated</a> ({})</li>\n'.format(UNDATED_PAGE_NAME, len(undated))
+    pages["index.html"] = PAGE_TEMPLATE.format(title=escape(title), root="", nav="",
+                                               content="<h1>{}</h1>\n<ul>\n{}</ul>".format(escape(title), links))
+    return pages
+
+
+def load_manifest(manifest_path: str, datetime_format: str, title: str) -> dict:
+    """
+    :return: the manifest of the last export, or an empty one if the last export cannot be reused
+    """
+    empty = {"version": SITE_VERSION, "extensions": Rendering.MARKDOWN_EXTENSIONS,
+             "datetime_format": datetime_format, "title": title, "entries": {}, "pages": []}
+    try:
+        with open(manifest_path, encoding="utf8") as manifest_file:
+            manifest = json.load(manifest_file)
+    except (OSError, ValueError):
+        return empty
+    # entry pages link to the index pages of their timestamp and show the title, and depend on the extensions
+    if manifest.get("version") != SITE_VERSION or manifest.get("extensions") != Rendering.MARKDOWN_EXTENSIONS or \
+            manifest.get("datetime_format") != datetime_format or manifest.get("title") != title:
+        return empty
+    return manifest
+
+
+def export_site(entries_dir: str, entries: List[Entry], datetime_format: str, site_dir: str, title: str,
+                style_path: Optional[str] = None, workers: Optional[int] = None,
+                progress: Optional[Callable[[int, int], None]] = None,
+                cancel_event: Optional[threading.Event] = None) -> SiteStats:
+    """
+    Brings the site up to date with the journal. Entries whose size and mtime on disk are unchanged since the last
+    export are skipped, and pages of entries that were removed are deleted. Attachments are synced separately with
+    Export.sync_attachments, to the ATTACHMENTS_DIR_NAME folder of the site.
+    :param entries_dir: entries folder of the journal
+    :param entries: every entry in the journal, oldest first
+    :param datetime_format: the datetime format that the timestamps of the entries were parsed with
+    :param site_dir: folder of the site
+    :param title: title of the journal, shown on the index pages
+    :param style_path: stylesheet copied to the site
+    :param workers: number of processes converting entries; every core by default
+    :param progress: called with the number of entries converted and the number to convert
+    :param cancel_event: stops the export when set; entries converted so far are kept for the next export
+    :return: statistics about the export
+    """
+    start = time.perf_counter()
+    stats = SiteStats()
+    pages_dir = os.path.join(site_dir, ENTRIES_DIR_NAME)
+    os.makedirs(pages_dir, exist_ok=True)
+    if style_path:
+        shutil.copyfile(style_path, os.path.join(site_dir, STYLE_NAME))
+
+    manifest_path = os.path.join(site_dir, SITE_MANIFEST_NAME)
+    manifest = load_manifest(manifest_path, datetime_format, title)
+    exported: Dict[str, list] = manifest["entries"]
+    current = {entry.name for entry in entries}
+    for name in [name for name in exported if name not in current]:
+        del exported[name]
+        stats.removed += 1
+        if os.path.exists(os.path.join(pages_dir, page_name(name))):
+            os.remove(os.path.join(pages_dir, page_name(name)))
+
+    jobs = []
+    versions = {}
+    for entry in entries:
+        entry_path = os.path.join(entries_dir, entry.name)
+        output_path = os.path.join(pages_dir, page_name(entry.name))
+        # the index may be out of date for entries edited in place, which do not change the mtime of the folder
+        try:
+            stat_result = os.stat(entry_path)
+        except OSError:
+            stats.failed.append(entry.name)
+            continue
+        versions[entry_path] = [stat_result.st_size, stat_result.st_mtime_ns]
+        if exported.get(entry.name) == versions[entry_path] and os.path.exists(output_path):
+            stats.skipped += 1
+        else:
+            jobs.append((entry_path, output_path, entry_display_text(entry.name), entry_navigation(entry, title)))
+    batches = [jobs[index:index + BATCH_SIZE] for index in range(0, len(jobs), BATCH_SIZE)]
+
+    def batch_done(converted: List[str], failed: List[str]) -> None:
+        for path in converted:
+            exported[os.path.basename(path)] = versions[path]
+        stats.converted += len(converted)
+        stats.failed.extend(os.path.basename(path) for path in failed)
+        if progress is not None:
+            progress(stats.converted + len(stats.failed), len(jobs))
+
+    try:
+        with Tracing.span("convert entries", "export", entries=len(jobs)):
+            workers = workers or os.cpu_count() or 1
+            if len(jobs) < SERIAL_LIMIT or workers == 1:
+                for batch in batches:
+                    if cancel_event is not None and cancel_event.is_set():
+                        stats.cancelled = True
+                        break
+                    converted, failed, _ = render_entries(batch)
+                    batch_done(converted, failed)
+            else:
+                stats.cancelled = convert_in_pool(batches, workers, batch_done, cancel_event)
+
+        with Tracing.span("write index pages", "export"):
+            pages = index_pages(entries, title)
+            for relative_path, page in pages.items():
+                os.makedirs(os.path.dirname(os.path.join(site_dir, relative_path)), exist_ok=True)
+                with open(os.path.join(site_dir, relative_path), "w", encoding="utf8") as page_file:
+                    page_file.write(page)
+            # index pages of months and years that no longer have entries
+            for relative_path in manifest["pages"]:
+                if relative_path not in pages and os.path.exists(os.path.join(site_dir, relative_path)):
+                    os.remove(os.path.join(site_dir, relative_path))
+            manifest["pages"] = sorted(pages)
+            stats.index_pages = len(pages)
+    finally:
+        Export.save_manifest(manifest_path, manifest)
+    stats.seconds = time.perf_counter() - start
+    return stats
+
+
+def convert_in_pool(batches: List[List[PageJob]], workers: int,
+                    batch_done: Callable[[List[str], List[str]], None],
+                    cancel_event: Optional[threading.Event]) -> bool:
+    """
+    Converts batches of entries in a pool of processes
+    :param batches: the entries to convert
+    :param workers: number of processes
+    :param batch_done: called with the result of each batch, on this thread
+    :param cancel_event: stops the conversion when set
+    :return: whether the conversion was cancelled
+    """
+    # spawn instead of fork, since forking a process that is running Qt threads is unsafe
+    executor = ProcessPoolExecutor(max_workers=min(workers, len(batches)),
+                                   mp_context=multiprocessing.get_context("spawn"))
+    try:
+        pending = {executor.submit(render_entries, batch) for batch in batches}
+        while pending:
+            done, pending = wait(pending, timeout=0.2, return_when=FIRST_COMPLETED)
+            for future in done:
+                converted, failed, _ = future.result()
+                batch_done(converted, failed)
+            if cancel_event is not None and cancel_event.is_set():
+                return True
+        return False
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,194 @@
+"""
+Downscaled copies of image attachments, shown in the preview instead of the full-resolution originals
+"""
+
+import os
+import re
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from html import escape
+from typing import Dict, Optional, Tuple
+from urllib.parse import quote, unquote
+
+from PyQt5.QtCore import QObject, Qt, pyqtSignal
+from PyQt5.QtGui import QImageReader
+
+import AttachmentStore
+
+THUMBNAIL_DIR_NAME = ".thumbnails"
+# largest width or height of a thumbnail, in pixels
+THUMBNAIL_SIZE = 1024
+# animated gifs are shown as they are
+THUMBNAIL_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+IMAGE_PATTERN = re.compile(r'<img\b([^>]*?)\ssrc="\.\./attachments/([^"]+)"([^>]*)>')
+CLASS_PATTERN = re.compile(r'(\sclass=")')
+LOADING_PATTERN = re.compile(r'\sloading="')
+# transparent image shown until a thumbnail is ready
+PENDING_SOURCE = "data:image/gif;base64,R0lGODlhAQABAIAAAAAAAP///yH5BAEAAAAALAAAAAABAAEAAAIBRAA7"
+
+# Replaces the pending image of an attachment once its thumbnail is ready
+THUMBNAIL_SCRIPT = """
+function setThumbnail(name, src) {
+    var images = document.querySelectorAll("img[data-attachment]");
+    for (var i = 0; i < images.length; i++) {
+        if (images[i].getAttribute("data-attachment") === name) {
+            images[i].src = src;
+            images[i].classList.remove("thumbnail-pending");
+        }
+    }
+}
+"""
+
+
+def make_thumbnail(source_path: str, thumbnail_path: str, size: int = THUMBNAIL_SIZE) -> bool:
+    """
+    Writes a downscaled copy of an image. Only the scaled image is decoded, which for jpeg is much faster than decoding
+    the original and scaling it.
+    :param source_path: path of the image
+    :param thumbnail_path: path of the thumbnail; jpeg if it ends with .jpg, otherwise png
+    :param size: largest width or height of the thumbnail
+    :return: False if the image is already small enough to be shown as it is
+    """
+    reader = QImageReader(source_path)
+    reader.setAutoTransform(True)
+    original_size = reader.size()
+    if original_size.isValid() and max(original_size.width(), original_size.height()) <= size:
+        return False
+    if original_size.isValid():
+        reader.setScaledSize(original_size.scaled(size, size, Qt.KeepAspectRatio))
+    image = reader.read()
+    if image.isNull():
+        raise OSError(reader.errorString())
+    if max(image.width(), image.height()) > size:
+        # formats that cannot decode at a smaller size
+        image = image.scaled(size, size, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+    is_jpeg = thumbnail_path.endswith(".jpg")
+    fd, temp_path = tempfile.mkstemp(prefix=".thumbnail-", suffix=".jpg" if is_jpeg else ".png",
+                                     dir=os.path.dirname(thumbnail_path))
+    os.close(fd)
+    try:
+        if not image.save(temp_path, "JPEG" if is_jpeg else "PNG", 85 if is_jpeg else -1):
+            raise OSError("could not write " + thumbnail_path)
+        os.replace(temp_path, thumbnail_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return True
+
+
+class ThumbnailCache(QObject):
+    """
+    Generates thumbnails in the background and rewrites images in the preview html to use them. Thumbnails are stored
+    in the journal folder, named by the hash of the attachment and the thumbnail size, so an attachment that changes
+    (detected by its mtime) gets a new thumbnail.
+    """
+    # emitted with the file name of an attachment and the url to show for it once its thumbnail is ready
+    thumbnail_ready = pyqtSignal(str, str)
+    # emitted from the worker threads with the file name, the (mtime, size) the thumbnail was made for and the url
+    _generated = pyqtSignal(str, object, str)
+
+    def __init__(self, parent=None):
+        super(ThumbnailCache, self).__init__(parent)
+        self.journal_dir = ""
+        self.store = None
+        # url to show for each attachment, and the (mtime, size) of the attachment it was made for
+        self._sources: Dict[str, Tuple[Tuple[int, int], str]] = {}
+        self._pending = set()
+        self.executor = ThreadPoolExecutor(max_workers=2)
+        self._generated.connect(self.thumbnail_generated)
+
+    def set_journal(self, journal_dir: str, store: Optional[AttachmentStore.AttachmentStore]) -> None:
+        """
+        :param journal_dir: folder of the current journal
+        :param store: attachment store of the journal, used to hash attachments
+        :return: None
+        """
+        if journal_dir == self.journal_dir:
+            return
+        self.journal_dir = journal_dir
+        self.store = store
+        self._sources.clear()
+        self._pending.clear()
+
+    def image_source(self, name: str) -> Optional[str]:
+        """
+        :param name: file name of an image attachment
+        :return: the url of its thumbnail, or of the original if it is small; None if the thumbnail is being generated
+        """
+        try:
+            stat_result = os.stat(os.path.join(self.journal_dir, "attachments", name))
+        except OSError:
+            return "../attachments/" + quote(name)
+        key = (stat_result.st_mtime_ns, stat_result.st_size)
+        known = self._sources.get(name)
+        if known is not None and known[0] == key:
+            return known[1]
+        if name not in self._pending and self.store is not None:
+            self._pending.add(name)
+            self.executor.submit(self.generate, self.journal_dir, self.store, name, key)
+        return None
+
+    def generate(self, journal_dir: str, store: AttachmentStore.AttachmentStore, name: str,
+                 key: Tuple[int, int]) -> None:
+        """
+        Finds or makes the thumbnail of an attachment; runs on a worker thread
+        :return: None
+        """
+        source = "../attachments/" + quote(name)
+        try:
+            content_hash = store.content_hash(name)
+            if content_hash is not None:
+                thumbnail_name = "{}_{}{}".format(content_hash[:32], THUMBNAIL_SIZE,
+                                                  ".jpg" if name.lower().endswith((".jpg", ".jpeg")) else ".png")
+                thumbnail_dir = os.path.join(journal_dir, THUMBNAIL_DIR_NAME)
+                thumbnail_path = os.path.join(thumbnail_dir, thumbnail_name)
+                os.makedirs(thumbnail_dir, exist_ok=True)
+                if os.path.exists(thumbnail_path) or \
+                        make_thumbnail(os.path.join(journal_dir, "attachments", name), thumbnail_path):
+                    source = "../" + THUMBNAIL_DIR_NAME + "/" + thumbnail_name
+        except OSError:
+            # the original is shown if the image cannot be read or the thumbnail cannot be written
+            pass
+        self._generated.emit(name, (journal_dir, key), source)
+
+    def thumbnail_generated(self, name: str, generated_for: tuple, source: str) -> None:
+        journal_dir, key = generated_for
+        if journal_dir != self.journal_dir:
+            return
+        self._pending.discard(name)
+        self._sources[name] = (key, source)
+        self.thumbnail_ready.emit(name, source)
+
+    def rewrite_images(self, html: str) -> str:
+        """
+        Points image attachments in rendered html to their thumbnails, loads them lazily and links them to the originals
+        :param html: rendered html
+        :return: the rewritten html
+        """
+        if "<img" not in html:
+            return html
+        return IMAGE_PATTERN.sub(lambda match: self._rewrite_image(match, html), html)
+
+    def _rewrite_image(self, match, html: str) -> str:
+        name = unquote(match.group(2))
+        if not name.lower().endswith(THUMBNAIL_EXTENSIONS) or "/" in name:
+            return match.group(0)
+        source = self.image_source(name)
+        # attributes are added at the end, so a closing slash is dropped; it is ignored in html anyway
+        attributes = (match.group(1) + match.group(3)).rstrip(" /")
+        if not source:
+            # attr_list may have given the image a class already, and a second class attribute would be ignored
+            attributes, found = CLASS_PATTERN.subn(r'\1thumbnail-pending ', attributes, 1)
+            if not found:
+                attributes += ' class="thumbnail-pending"'
+        if not LOADING_PATTERN.search(attributes):
+            attributes += ' loading="lazy"'
+        image = '<img src="{}" data-attachment="{}"{}>'.format(source or PENDING_SOURCE, escape(name), attributes)
+        # images that are already links keep their link
+        if html.rfind("<a ", 0, match.start()) > html.rfind("</a>", 0, match.start()):
+            return image
+        return '<a href="../attachments/{}">{}</a>'.format(match.group(2), image)
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=False, cancel_futures=True)
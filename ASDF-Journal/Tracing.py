@@ -0,0 +1,237 @@
+"""
+Opt-in tracing of the slow paths of the app. Spans are written as Chrome trace events, which can be opened in
+chrome://tracing or ui.perfetto.dev; has no Qt dependency so that it can be used from any module and thread.
+"""
+
+import atexit
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+# set to 1 to write the trace next to data.json, to a path to write it there, or to 0 to turn tracing off even if
+# it is turned on in the settings
+TRACE_ENV_VAR = "ASDF_JOURNAL_TRACE"
+TRACE_FILE_NAME = "trace.json"
+# the trace is moved to trace.json.1 when it reaches this size, and older traces are shifted up to this many backups
+MAX_TRACE_BYTES = 16 * 1024 * 1024
+TRACE_BACKUPS = 2
+# events are written once this many are buffered, or when this many seconds have passed since the last write
+FLUSH_EVENTS = 200
+FLUSH_INTERVAL = 2.0
+
+
+class Tracer:
+    """
+    Buffers trace events and appends them to a file. The file is a JSON array that is left open, which trace viewers
+    accept, so that events can be appended without rewriting it and a crash loses at most the buffered events.
+    """
+
+    def __init__(self, path: str, max_bytes: int = MAX_TRACE_BYTES, backups: int = TRACE_BACKUPS):
+        """
+        :param path: path of the trace file; a trace left by the previous run is kept as the first backup
+        :param max_bytes: size at which the trace file is rotated
+        :param backups: number of rotated trace files kept
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.pid = os.getpid()
+        self.lock = threading.Lock()
+        self.events: List[str] = []
+        self.size = 0
+        self.last_flush = time.monotonic()
+        # native ids of the threads that have been named in the current file
+        self.named_threads = set()
+        # duration of the last span of each name, in milliseconds
+        self.durations: Dict[str, float] = {}
+        self._rotate()
+
+    def add(self, name: str, category: str, start: float, duration: float, args: dict) -> None:
+        """
+        Adds a complete event
+        :param name: name of the span
+        :param category: category of the span, which trace viewers can filter by
+        :param start: time.perf_counter() at the start of the span
+        :param duration: duration of the span in seconds
+        :param args: details shown with the span
+        :return: None
+        """
+        thread_id = threading.get_native_id()
+        event = {"name": name, "cat": category, "ph": "X", "ts": round(start * 1e6, 1),
+                 "dur": round(duration * 1e6, 1), "pid": self.pid, "tid": thread_id}
+        if args:
+            event["args"] = args
+        with self.lock:
+            if thread_id not in self.named_threads:
+                self.named_threads.add(thread_id)
+                self.events.append(json.dumps({"name": "thread_name", "ph": "M", "pid": self.pid, "tid": thread_id,
+                                               "args": {"name": threading.current_thread().name}}))
+            self.events.append(json.dumps(event))
+            self.durations[name] = duration * 1000
+            if len(self.events) >= FLUSH_EVENTS or time.monotonic() - self.last_flush > FLUSH_INTERVAL:
+                self._flush()
+
+    def flush(self) -> None:
+        """
+        Writes the buffered events to the trace file
+        :return: None
+        """
+        with self.lock:
+            self._flush()
+
+    def _flush(self) -> None:
+        self.last_flush = time.monotonic()
+        if not self.events:
+            return
+        # written as bytes so that the size is counted in bytes and newlines are not translated
+        data = "".join(event + ",\n" for event in self.events).encode("utf8")
+        self.events = []
+        try:
+            if self.size + len(data) > self.max_bytes:
+                self._rotate()
+            with open(self.path, "ab") as trace_file:
+                trace_file.write(data)
+            self.size += len(data)
+        except OSError:
+            # tracing must never break the app; the events are dropped
+            pass
+
+    def _rotate(self) -> None:
+        """
+        Moves the trace file to the first backup, shifting the older backups, and starts a new one
+        :return: None
+        """
+        try:
+            if os.path.exists(self.path):
+                for index in range(self.backups - 1, 0, -1):
+                    if os.path.exists("{}.{}".format(self.path, index)):
+                        os.replace("{}.{}".format(self.path, index), "{}.{}".format(self.path, index + 1))
+                if self.backups:
+                    os.replace(self.path, self.path + ".1")
+            with open(self.path, "wb") as trace_file:
+                trace_file.write(b"[\n")
+            self.size = 2
+        except OSError:
+            pass
+        self.named_threads.clear()
+
+
+class Span:
+    """
+    Context manager that adds a complete event to the trace when it exits
+    """
+    __slots__ = ("name", "category", "args", "start")
+
+    def __init__(self, name: str, category: str, args: dict):
+        self.name = name
+        self.category = category
+        self.args = args
+        self.start = 0.0
+
+    def __enter__(self) -> "Span":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        tracer = _tracer
+        if tracer is not None:
+            if exc_type is not None:
+                self.args["error"] = exc_type.__name__
+            tracer.add(self.name, self.category, self.start, time.perf_counter() - self.start, self.args)
+
+
+class NoSpan:
+    """
+    Context manager used when tracing is off, which does nothing
+    """
+    __slots__ = ()
+
+    def __enter__(self) -> "NoSpan":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        pass
+
+
+_NO_SPAN = NoSpan()
+_tracer: Optional[Tracer] = None
+
+
+def span(name: str, category: str = "app", **args):
+    """
+    Times a block of code, e.g. with Tracing.span("save entry"): ...; when tracing is off this only returns a shared
+    object that does nothing
+    :param name: name of the span
+    :param category: category of the span
+    :param args: details shown with the span; they should be cheap to compute, since they are computed even when
+    tracing is off
+    :return: a context manager
+    """
+    if _tracer is None:
+        return _NO_SPAN
+    return Span(name, category, args)
+
+
+def record(name: str, duration: float, category: str = "app", **args) -> None:
+    """
+    Adds a span that ends now and was timed elsewhere, such as in another process
+    :param name: name of the span
+    :param duration: duration of the span in seconds
+    :param category: category of the span
+    :param args: details shown with the span
+    :return: None
+    """
+    if _tracer is not None:
+        _tracer.add(name, category, time.perf_counter() - duration, duration, args)
+
+
+def is_enabled() -> bool:
+    return _tracer is not None
+
+
+def last_durations() -> Dict[str, float]:
+    """
+    :return: the duration of the last span of each name, in milliseconds; empty when tracing is off
+    """
+    if _tracer is None:
+        return {}
+    with _tracer.lock:
+        return dict(_tracer.durations)
+
+
+def enable(path: str) -> None:
+    """
+    Starts writing spans to a trace file
+    :param path: path of the trace file
+    :return: None
+    """
+    global _tracer
+    if _tracer is not None:
+        _tracer.flush()
+    _tracer = Tracer(path)
+    atexit.register(_tracer.flush)
+
+
+def disable() -> None:
+    global _tracer
+    if _tracer is not None:
+        _tracer.flush()
+        _tracer = None
+
+
+def configure(default_path: str, enabled: bool) -> None:
+    """
+    Turns tracing on if the setting or the environment variable asks for it; the environment variable takes precedence
+    :param default_path: path of the trace file unless the environment variable gives one
+    :param enabled: the tracing setting
+    :return: None
+    """
+    value = os.environ.get(TRACE_ENV_VAR, "").strip()
+    if value == "0":
+        return
+    if value and value.lower() not in ("1", "true", "yes", "on"):
+        enable(value)
+    elif value or enabled:
+        enable(default_path)
@@ -1,65 +1,17 @@
 """
-Utility functions used by rest of program
+Utility functions used by the interface. The journal logic they build on is in Journal, which has no Qt dependency, and
+is re-exported here so that the interface can keep using it through this module.
 """
 
-import json
-import os
-import shutil
-import sys
-from datetime import datetime
-from typing import List
+from typing import List, Tuple
 
 from PyQt5.QtWidgets import QMessageBox
 
-
-def get_directory() -> str:
-    """
-    Gets the directory of the python file or executable
-    :return: directory of python file or executable
-    """
-    if getattr(sys, "frozen", False):
-        return os.path.dirname(sys.executable)
-    elif __file__:
-        return os.path.dirname(__file__)
-
-
-def get_resources_dir() -> str:
-    """
-    :return: resources directory
-    """
-    return os.path.join(get_directory(), "Resources")
-
-
-def get_data(field):
-    """
-    gets the specified value from data.json
-    :param field: the key of the value to retrieve
-    :return: the requested value
-    """
-    with open(os.path.join(get_directory(), "data.json")) as data_file:
-        data = json.load(data_file)
-    return data[field]
-
-
-def get_entries_dir():
-    """
-    :return: the entries directory in the current journal
-    """
-    return os.path.join(get_data("journal_dir"), "entries")
-
-
-def get_journal_dir():
-    """
-    :return: the current journal directory
-    """
-    return os.path.join(get_data("journal_dir"))
-
-
-def get_attachments_dir():
-    """
-    :return: the attachments directory in the journal
-    """
-    return os.path.join(get_data("journal_dir"), "attachments")
+from Journal import get_directory, get_resources_dir, settings, get_data_path, create_default_settings, use_journal, \
+    get_data, set_data, get_journal_dir, set_journal_dir, get_entries_dir, get_attachments_dir, get_datetime_format, \
+    get_attachment_export_mode, get_seperator, get_entry_index, load_entry_index, get_attachment_store, \
+    save_text_atomically, replace_chars_for_file, attachment_reference, attachment_file_name, \
+    copy_files_to_attachments, new_entry, export_journal, export_site  # noqa: F401
 
 
 def set_page_zoom(zoom: float):
@@ -92,14 +44,6 @@ def set_splitter_sizes(state: List[int]) -> None:
     set_data("splitter_sizes", state)
 
 
-def set_journal_dir(journal_dir) -> None:
-    """
-    :param journal_dir: path of current journal
-    :return: None
-    """
-    set_data("journal_dir", journal_dir)
-
-
 def get_toggle_states() -> List[bool]:
     """
     :return: whether each panel should be visible
@@ -112,76 +56,51 @@ def set_toggle_states(states: List[bool]) -> None:
     :param states: Whether each panel is currently visible
     :return: None
     """
-    set_data("toggle_selector", states[0])
-    set_data("toggle_editor", states[1])
-    set_data("toggle_preview", states[2])
+    settings().update({"toggle_selector": states[0], "toggle_editor": states[1], "toggle_preview": states[2]})
 
 
-def set_data(field: str, value) -> None:
+def get_editor_font_size():
     """
-    Sets the specified value in data.json
-    :param field: the field to alter the value of
-    :param value: the value to set
-    :return: None
+    :return: the font size of the markdown editor
     """
-    data = {}
-    with open(os.path.join(get_directory(), "data.json"), "r") as data_file:
-        data = json.load(data_file)
-        data[field] = value
-    with open(os.path.join(get_directory(), "data.json"), "w") as data_file_write:
-        json.dump(data, data_file_write, indent=4)
+    return get_data("editor_font_size")
 
 
-def get_datetime_format() -> str:
+def get_pasted_image_settings() -> Tuple[str, int, int]:
     """
-    :return: the format for datetime in entries
+    :return: the format pasted images are saved as ("png", "jpeg" or "webp"), the encoding quality (0 to 100, or -1
+    for the default) and the size in pixels that larger images are scaled down to (0 to keep their size)
     """
-    return get_data("datetime_format")
+    return get_data("pasted_image_format"), get_data("pasted_image_quality"), get_data("pasted_image_max_dimension")
 
 
-def get_editor_font_size():
+def get_autosave_interval() -> float:
     """
-    :return: the font size of the markdown editor
+    :return: seconds between writes of unsaved edits to the recovery log
     """
-    return get_data("editor_font_size")
+    return get_data("autosave_interval")
 
 
-def get_seperator() -> str:
+def get_large_entry_size() -> int:
     """
-    :return: the string to be inserted after each entry when exporting as a single file
+    :return: number of characters above which entries are loaded progressively and not previewed as they are edited
     """
-    return get_data("entry_seperator")
+    return get_data("large_entry_size")
 
 
-def replace_chars_for_file(file_name: str) -> str:
+def get_tracing_enabled() -> bool:
     """
-    Replaces characters that should not be in a file name
-    :param file_name: The string to replace characters in
-    :return:
+    :return: whether the time taken by each stage is written to a trace file; see Tracing.py
     """
-    for char in (" ", "/", "\\", "|", ":"):
-        file_name = file_name.replace(char, "_")
-    return file_name
-
-def attachment_reference(file_name: str) -> str:
-    insert_text = "!" if os.path.splitext(file_name)[1].lower() in (".jpg", ".jpeg", ".png", ".gif") else ""
-    insert_text += "[](../attachments/" + file_name + ")\n\n"
-    return insert_text
-
-def copy_files_to_attachments(files: list[str]):
-    insert_text = ""
-    for file in files:
-        cur_datetime = datetime.now()
-        file_name = cur_datetime.strftime(get_datetime_format()) + "_" + os.path.basename(file)
-        file_name = replace_chars_for_file(file_name)
-        shutil.copy2(file, os.path.join(get_attachments_dir(), file_name))
-        insert_text += attachment_reference(file_name)
-
-        # deletes the original file if it was in the attachments folder
-        if os.path.abspath(os.path.dirname(file)) == os.path.abspath(get_attachments_dir()):
-            os.remove(file)
-
-    return insert_text
+    return get_data("tracing")
+
+
+def get_render_cache_on_disk() -> bool:
+    """
+    :return: whether rendered previews are also cached in the journal folder
+    """
+    return get_data("render_cache_on_disk")
+
 
 def alert_user(text: str) -> None:
     """
@@ -1,36 +1,65 @@
-import json
 import os.path
 import sys
 
-from PyQt5.QtGui import QIcon
-from PyQt5.QtWidgets import QApplication
+import Journal
+import Tracing
+
+# PyQt and the interface are imported once the app starts, so that the command line starts without them
+
+
+def offer_recovery() -> None:
+    """
+    Offers to restore the edits that were not saved when the app last closed, if it did not close normally
+    :return: None
+    """
+    from PyQt5.QtWidgets import QMessageBox
+    import RecoveryLog
+    import Utilities
+    journal_dir = Utilities.get_journal_dir()
+    if not journal_dir:
+        return
+    recovery = RecoveryLog.find_recovery(journal_dir)
+    if recovery is not None:
+        entry_name = os.path.splitext(os.path.basename(recovery.entry_path))[0]
+        reply = QMessageBox.question(None, "Recover Unsaved Changes",
+                                     "ASDF Journal did not close properly. Would you like to recover your unsaved "
+                                     "changes to \"{}\"?".format(entry_name),
+                                     QMessageBox.Yes | QMessageBox.No, QMessageBox.Yes)
+        if reply == QMessageBox.Yes:
+            Utilities.save_text_atomically(recovery.entry_path, recovery.text)
+    RecoveryLog.discard_recovery(journal_dir)
 
-import Utilities
-from MainInterface import MainInterface
 
 def main():
-    if not os.path.isfile(os.path.join(Utilities.get_directory(), "data.json")):
-        data_json = {
-            "journal_dir": "",
-            "page_zoom": 1,
-            "splitter_sizes": [],
-            "toggle_selector": True,
-            "toggle_editor": True,
-            "toggle_preview": True,
-            "datetime_format": "%Y-%m-%d %H%M",
-            "editor_font_size": 12,
-            "entry_seperator": "\n\n-----\n-----\n\n"
-        }
-        with open(os.path.join(Utilities.get_directory(), "data.json"), "w") as data_file:
-            json.dump(data_json, data_file, indent=4)
+    if len(sys.argv) > 1:
+        import CommandLine
+        Tracing.configure(os.path.join(Journal.get_directory(), Tracing.TRACE_FILE_NAME), False)
+        sys.exit(CommandLine.main(sys.argv[1:]))
+
+    from PyQt5.QtCore import QCoreApplication, Qt
+    from PyQt5.QtGui import QIcon
+    from PyQt5.QtWidgets import QApplication
+    import Utilities
+    from MainInterface import MainInterface
+
+    Journal.create_default_settings()
+    Tracing.configure(os.path.join(Utilities.get_directory(), Tracing.TRACE_FILE_NAME), Utilities.get_tracing_enabled())
 
+    # lets the preview import QtWebEngine after the app is created, so that it is only loaded once it is shown
+    QCoreApplication.setAttribute(Qt.AA_ShareOpenGLContexts)
     app = QApplication([])
     app.setWindowIcon(QIcon(os.path.join(Utilities.get_directory(), "Resources", "Icons", "journal-icon.png")))
     app.setStyle("Fusion")
+    offer_recovery()
 
     interface = MainInterface()
     interface.showMaximized()
     sys.exit(app.exec())
 
 if __name__ == '__main__':
+    if getattr(sys, "frozen", False):
+        # needed for the preview's render process in frozen executables; not imported otherwise, since it is slow to
+        # import and the command line does not need it
+        import multiprocessing
+        multiprocessing.freeze_support()
     main()
@@ -0,0 +1,52 @@
+"""
+Compares the original serial shutil.copy2 attachment export with Export.sync_attachments, for a first export and for a
+re-export where one attachment changed
+
+Usage: python bench_attachments.py [attachment count] [size in MB]
+"""
+
+import glob
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "ASDF-Journal"))
+
+import Export  # noqa: E402
+
+
+def legacy_sync(source_dir: str, destination_dir: str) -> None:
+    os.makedirs(destination_dir, exist_ok=True)
+    for attachment in glob.glob(os.path.join(source_dir, "*")):
+        shutil.copy2(attachment, os.path.join(destination_dir, os.path.basename(attachment)))
+
+
+def timed(label: str, function, *args) -> None:
+    start = time.perf_counter()
+    result = function(*args)
+    print("{:>24}: {:8.3f} s  {}".format(label, time.perf_counter() - start, result if result is not None else ""))
+
+
+def main(count: int, size: int) -> None:
+    with tempfile.TemporaryDirectory() as temp_dir:
+        source_dir = os.path.join(temp_dir, "attachments")
+        os.makedirs(source_dir)
+        for i in range(count):
+            with open(os.path.join(source_dir, "{}.jpg".format(i)), "wb") as attachment:
+                attachment.write(os.urandom(size))
+
+        timed("legacy export", legacy_sync, source_dir, os.path.join(temp_dir, "legacy"))
+        timed("legacy re-export", legacy_sync, source_dir, os.path.join(temp_dir, "legacy"))
+        for mode in Export.ATTACHMENT_MODES:
+            destination_dir = os.path.join(temp_dir, mode)
+            timed(mode + " export", Export.sync_attachments, source_dir, destination_dir, mode)
+            with open(os.path.join(source_dir, "0.jpg"), "ab") as attachment:
+                attachment.write(b"x")
+            timed(mode + " re-export", Export.sync_attachments, source_dir, destination_dir, mode)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200,
+         int(float(sys.argv[2]) * 1024 * 1024) if len(sys.argv) > 2 else 5 * 1024 * 1024)
@@ -0,0 +1,104 @@
+"""
+Measures the cost of autosaving edits to the recovery log for entries of increasing size: the time the GUI thread spends
+on each keystroke, and the time the background thread spends writing and fsyncing a batch of edits. Both should stay
+the same however long the entry is, unlike autosaving a full copy of the entry, which is shown for comparison. Also
+measures how long recovering the edits takes on startup.
+
+Usage: python bench_autosave.py [edits per batch]
+"""
+
+import json
+import os
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "ASDF-Journal"))
+
+from PyQt5.QtGui import QTextCursor  # noqa: E402
+from PyQt5.QtWidgets import QApplication  # noqa: E402
+
+import RecoveryLog  # noqa: E402
+import Settings  # noqa: E402
+import Utilities  # noqa: E402
+from MarkdownEditor import MarkdownEditor  # noqa: E402
+
+SIZES_MB = (0.1, 1, 10)
+
+
+def main(edits: int) -> None:
+    # the editor reads its font size from data.json, which is created on the first run of the app
+    data_path = os.path.join(Utilities.get_directory(), "data.json")
+    created_data = not os.path.exists(data_path)
+    if created_data:
+        with open(data_path, "w") as data_file:
+            json.dump(Settings.DEFAULT_DATA, data_file, indent=4)
+    try:
+        run(edits)
+    finally:
+        if created_data:
+            os.remove(data_path)
+
+
+def run(edits: int) -> None:
+    app = QApplication(sys.argv)
+    print("{} keystrokes per autosave".format(edits))
+    print("{:>8} {:>16} {:>16} {:>18} {:>14}".format("entry", "ms per keystroke", "ms per autosave",
+                                                     "full copy autosave", "ms to recover"))
+    for size_mb in SIZES_MB:
+        with tempfile.TemporaryDirectory() as journal_dir:
+            os.makedirs(os.path.join(journal_dir, "entries"))
+            entry_path = os.path.join(journal_dir, "entries", "entry.md")
+            line = "Some journal text with *emphasis* and a [link](http://example.com).\n"
+            with open(entry_path, "w", encoding="utf8") as entry:
+                entry.write("# Entry\n\n" + line * int(size_mb * 1024 * 1024 / len(line)))
+
+            editor = MarkdownEditor(None)
+            # flushed explicitly below so that the write can be timed
+            recovery_log = RecoveryLog.RecoveryLog(interval=3600)
+            editor.edited.connect(recovery_log.record)
+            editor.text_saved.connect(lambda: recovery_log.reset(journal_dir, editor.entry_path))
+            editor.update_editor(entry_path)
+            cursor = editor.textCursor()
+            cursor.setPosition(editor.document().characterCount() // 2)
+            editor.setTextCursor(cursor)
+
+            keystroke_total = flush_total = 0.0
+            rounds = 5
+            for _ in range(rounds):
+                start = time.perf_counter()
+                for index in range(edits):
+                    if index % 10 == 9:
+                        editor.textCursor().deletePreviousChar()
+                    else:
+                        editor.insertPlainText("a")
+                keystroke_total += time.perf_counter() - start
+                # moving the cursor starts a new edit instead of extending the last one
+                editor.moveCursor(QTextCursor.Down)
+                start = time.perf_counter()
+                recovery_log.flush()
+                flush_total += time.perf_counter() - start
+
+            start = time.perf_counter()
+            with open(os.path.join(journal_dir, "copy.md"), "w", encoding="utf8") as copy:
+                copy.write(editor.toPlainText())
+                copy.flush()
+                os.fsync(copy.fileno())
+            full_copy = time.perf_counter() - start
+
+            start = time.perf_counter()
+            recovery = RecoveryLog.find_recovery(journal_dir)
+            recover_time = time.perf_counter() - start
+            assert recovery is not None and recovery.text == editor.toPlainText()
+
+            print("{:>5} MB {:16.4f} {:16.2f} {:18.2f} {:14.1f}".format(
+                size_mb, keystroke_total * 1000 / (rounds * edits), flush_total * 1000 / rounds, full_copy * 1000,
+                recover_time * 1000))
+            recovery_log.close()
+            editor.deleteLater()
+    del app
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50)
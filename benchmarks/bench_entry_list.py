@@ -0,0 +1,71 @@
+"""
+Measures memory and time to first paint of the entry list for synthetic journals, comparing an eagerly filled
+QListWidget (the old EntrySelector) with the paged EntryListModel used by EntrySelector
+
+Usage: python bench_entry_list.py [entry counts...]
+"""
+
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "ASDF-Journal"))
+
+
+def synthetic_names(count: int):
+    start = datetime(2000, 1, 1)
+    return [(start + timedelta(hours=6 * i)).strftime("%Y-%m-%d_%H%M") + "_Entry_" + str(i) + ".md"
+            for i in range(count)]
+
+
+def rss_kib() -> int:
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+
+
+def run_single(kind: str, count: int) -> None:
+    from PyQt5.QtCore import Qt
+    from PyQt5.QtWidgets import QApplication, QListWidget, QListWidgetItem
+
+    app = QApplication([])
+    names = synthetic_names(count)
+    baseline = rss_kib()
+    start = time.perf_counter()
+    if kind == "widget":
+        view = QListWidget()
+        for name in reversed(names):
+            item = QListWidgetItem(view)
+            item.setText(os.path.splitext(name)[0].replace("_", " "))
+            item.setData(Qt.UserRole, os.path.join("/journal/entries", name))
+            view.addItem(item)
+        view.setCurrentRow(0)
+    else:
+        from EntrySelector import EntrySelector
+        view = EntrySelector(None)
+        view.entry_model.set_entries("/journal/entries", names)
+        view.set_current_row(0)
+    view.resize(300, 800)
+    view.show()
+    view.repaint()
+    app.processEvents()
+    elapsed = time.perf_counter() - start
+    print("{kind:>6} {count:>8}: first paint {elapsed:8.3f} s  memory +{memory:>8} KiB".format(
+        kind=kind, count=count, elapsed=elapsed, memory=rss_kib() - baseline))
+
+
+def main(counts) -> None:
+    for count in counts:
+        for kind in ("widget", "model"):
+            # each run gets its own process so that memory measurements are independent
+            subprocess.run([sys.executable, os.path.abspath(__file__), "--single", kind, str(count)], check=True,
+                           stderr=subprocess.DEVNULL)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == "--single":
+        run_single(sys.argv[2], int(sys.argv[3]))
+    else:
+        main([int(count) for count in sys.argv[1:]] or [10000, 100000, 1000000])
@@ -0,0 +1,83 @@
+"""
+Measures the latency of switching away from a large entry: the unsaved-changes check that runs on every switch, and
+loading the next entry into the editor. The original check re-read the entry from disk and compared it with the
+editor's text; the editor now tracks whether its document was modified since the last load or save. Also compares the
+original in-place save with the atomic save.
+
+Usage: python bench_entry_switch.py [entry size in MB]
+"""
+
+import json
+import os
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "ASDF-Journal"))
+
+from PyQt5.QtWidgets import QApplication  # noqa: E402
+
+import Settings  # noqa: E402
+import Utilities  # noqa: E402
+from MarkdownEditor import MarkdownEditor  # noqa: E402
+
+REPEATS = 5
+
+
+def legacy_is_modified(editor: MarkdownEditor, path: str) -> bool:
+    with open(path, "r", encoding="utf8") as entry:
+        return entry.read() != editor.toPlainText()
+
+
+def legacy_save(editor: MarkdownEditor, path: str) -> None:
+    with open(path, "w", encoding="utf8") as entry:
+        entry.write(editor.toPlainText())
+
+
+def best_of(function, *args) -> float:
+    times = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        function(*args)
+        times.append(time.perf_counter() - start)
+    return min(times) * 1000
+
+
+def main(size: int) -> None:
+    # the editor reads its font size from data.json, which is created on the first run of the app
+    data_path = os.path.join(Utilities.get_directory(), "data.json")
+    created_data = not os.path.exists(data_path)
+    if created_data:
+        with open(data_path, "w") as data_file:
+            json.dump(Settings.DEFAULT_DATA, data_file, indent=4)
+    try:
+        run(size)
+    finally:
+        if created_data:
+            os.remove(data_path)
+
+
+def run(size: int) -> None:
+    app = QApplication(sys.argv)
+    with tempfile.TemporaryDirectory() as entries_dir:
+        paths = [os.path.join(entries_dir, "entry_{}.md".format(i)) for i in range(2)]
+        line = "Some journal text with *emphasis* and a [link](http://example.com).\n"
+        for path in paths:
+            with open(path, "w", encoding="utf8") as entry:
+                entry.write("# Entry\n\n" + line * (size // len(line)))
+        editor = MarkdownEditor(None)
+        editor.update_editor(paths[0])
+        print("entry of {:.1f} MB".format(size / 1024 / 1024))
+        print("{:>40}: {:9.3f} ms".format("unsaved changes check, re-reading file", best_of(legacy_is_modified, editor,
+                                                                                           paths[0])))
+        print("{:>40}: {:9.3f} ms".format("unsaved changes check, document flag", best_of(editor.is_modified)))
+        print("{:>40}: {:9.3f} ms".format("loading the next entry", best_of(editor.update_editor, paths[1])))
+        print("{:>40}: {:9.3f} ms".format("save in place", best_of(legacy_save, editor, paths[1])))
+        print("{:>40}: {:9.3f} ms".format("atomic save with fsync", best_of(
+            lambda: Utilities.save_text_atomically(paths[1], editor.toPlainText()))))
+    del app
+
+
+if __name__ == "__main__":
+    main(int(float(sys.argv[1]) * 1024 * 1024) if len(sys.argv) > 1 else 5 * 1024 * 1024)
@@ -0,0 +1,80 @@
+"""
+Compares the original readlines-based single file export with Export.export_single_file on a synthetic journal, for a
+first export and for re-exports after appending, editing and inserting entries
+
+Usage: python bench_export.py [entry count]
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "ASDF-Journal"))
+
+import Export  # noqa: E402
+
+SEPARATOR = "\n\n-----\n-----\n\n"
+
+
+def legacy_export(entries_dir: str, names, output_path: str) -> None:
+    """
+    Reproduces the original export, which rewrote the whole file from lists of lines
+    """
+    with open(output_path, "w", encoding="utf8") as export_file:
+        for entry in names:
+            with open(os.path.join(entries_dir, entry), "r", encoding="utf8") as entry_file:
+                lines = entry_file.readlines()
+            export_file.write(SEPARATOR)
+            export_file.writelines(lines)
+
+
+def write_entry(entries_dir: str, index: int, rng: random.Random, words) -> str:
+    name = (datetime(2000, 1, 1) + timedelta(hours=3 * index)).strftime("%Y-%m-%d_%H%M") + \
+        "_Entry_{}.md".format(index)
+    with open(os.path.join(entries_dir, name), "w", encoding="utf8") as entry:
+        entry.write("# Entry {}\n\n".format(index) + "\n".join(" ".join(rng.choices(words, k=15)) for _ in range(10)))
+    return name
+
+
+def timed(label: str, function, *args) -> None:
+    start = time.perf_counter()
+    result = function(*args)
+    print("{:>32}: {:8.2f} s  {}".format(label, time.perf_counter() - start, result if result is not None else ""))
+
+
+def main(count: int) -> None:
+    rng = random.Random(1)
+    words = ["journal", "walk", "coffee", "morning", "evening", "mountain", "the", "quiet", "garden", "travel"]
+    with tempfile.TemporaryDirectory() as journal_dir:
+        entries_dir = os.path.join(journal_dir, "entries")
+        os.makedirs(entries_dir)
+        names = [write_entry(entries_dir, i, rng, words) for i in range(count)]
+        legacy_path = os.path.join(journal_dir, "legacy.md")
+        output_path = os.path.join(journal_dir, "combined_journal.md")
+
+        timed("legacy export", legacy_export, entries_dir, names, legacy_path)
+        timed("first export", Export.export_single_file, entries_dir, names, SEPARATOR, output_path)
+        timed("unchanged re-export", Export.export_single_file, entries_dir, names, SEPARATOR, output_path)
+
+        names += [write_entry(entries_dir, count + i, rng, words) for i in range(10)]
+        timed("10 entries appended", Export.export_single_file, entries_dir, names, SEPARATOR, output_path)
+
+        with open(os.path.join(entries_dir, names[count // 2]), "r+b") as entry:
+            entry.seek(2)
+            entry.write(b"X")
+        timed("1 entry edited in place", Export.export_single_file, entries_dir, names, SEPARATOR, output_path)
+
+        with open(os.path.join(entries_dir, names[-100]), "a", encoding="utf8") as entry:
+            entry.write("\nmore text")
+        timed("1 entry near the end resized", Export.export_single_file, entries_dir, names, SEPARATOR, output_path)
+
+        legacy_export(entries_dir, names, legacy_path)
+        with open(legacy_path, "rb") as legacy_file, open(output_path, "rb") as output_file:
+            print("output matches legacy export:", legacy_file.read() == output_file.read())
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
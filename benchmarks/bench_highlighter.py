@@ -0,0 +1,146 @@
+"""
+Measures the markdown syntax highlighter on a large entry with headings, lists, emphasis, links, fenced code blocks and
+front matter: loading it with and without highlighting, typing in a paragraph, opening and closing a fenced code block
+(which changes the state of the blocks after it up to the next fence), opening a code block that is never closed
+(which changes the state of every block after it) and scrolling a page. Exits with an error if a keystroke takes longer
+than the budget, or if scrolling reports a change of the text, which would make the interface render the preview.
+
+Usage: python bench_highlighter.py [size in MB] [keystroke budget in ms]
+"""
+
+import json
+import os
+import random
+import sys
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "ASDF-Journal"))
+
+from PyQt5.QtGui import QTextCursor  # noqa: E402
+from PyQt5.QtWidgets import QApplication  # noqa: E402
+
+import Settings  # noqa: E402
+import Utilities  # noqa: E402
+from MarkdownEditor import MarkdownEditor  # noqa: E402
+
+KEYSTROKES = 20
+
+
+def synthetic_markdown(size: int) -> str:
+    rng = random.Random(1)
+    words = ["journal", "*today*", "**walked**", "`code`", "[link](http://example.com)", "the", "river", "_slowly_",
+             "and", "then", "went", "home", "with", "friends"]
+    parts = ["---\ntitle: Synthetic\ntags: [a, b]\n---\n\n"]
+    length = len(parts[0])
+    while length < size:
+        kind = rng.random()
+        if kind < 0.1:
+            part = "## Heading {}\n\n".format(rng.randrange(1000))
+        elif kind < 0.25:
+            part = "".join("- item {}\n".format(" ".join(rng.choices(words, k=5))) for _ in range(4)) + "\n"
+        elif kind < 0.3:
+            part = "```python\n" + "".join("x = {}  # *not emphasis*\n".format(i) for i in range(6)) + "```\n\n"
+        elif kind < 0.35:
+            part = "> " + " ".join(rng.choices(words, k=12)) + "\n\n"
+        else:
+            part = " ".join(rng.choices(words, k=rng.randrange(8, 40))) + "\n\n"
+        parts.append(part)
+        length += len(part)
+    return "".join(parts)
+
+
+def timed_keystrokes(app: QApplication, editor: MarkdownEditor, text: str) -> float:
+    """
+    :return: the longest time taken by a keystroke, including the events it causes, in milliseconds
+    """
+    longest = 0.0
+    for char in text:
+        start = time.perf_counter()
+        editor.insertPlainText(char)
+        app.processEvents()
+        longest = max(longest, time.perf_counter() - start)
+    return longest * 1000
+
+
+def main(size: int, budget: float) -> int:
+    # the editor reads its settings from data.json, which is created on the first run of the app
+    data_path = os.path.join(Utilities.get_directory(), "data.json")
+    created_data = not os.path.exists(data_path)
+    if created_data:
+        with open(data_path, "w") as data_file:
+            json.dump(Settings.DEFAULT_DATA, data_file, indent=4)
+    try:
+        return run(size, budget)
+    finally:
+        if created_data:
+            os.remove(data_path)
+
+
+def run(size: int, budget: float) -> int:
+    app = QApplication(sys.argv)
+    text = synthetic_markdown(size)
+    editor = MarkdownEditor(None)
+    editor.resize(800, 600)
+    editor.show()
+
+    editor.highlighter.setDocument(None)
+    start = time.perf_counter()
+    editor.set_text(text)
+    app.processEvents()
+    plain_load = time.perf_counter() - start
+    editor.highlighter.setDocument(editor.document())
+    start = time.perf_counter()
+    editor.set_text(text)
+    editor.highlighter.highlight_visible_blocks()
+    app.processEvents()
+    load = time.perf_counter() - start
+    print("{:.1f} MB, {} blocks".format(len(text) / 1024 / 1024, editor.document().blockCount()))
+    print("{:>36}: {:8.1f} ms".format("load without highlighting", plain_load * 1000))
+    print("{:>36}: {:8.1f} ms".format("load with highlighting", load * 1000))
+
+    # the middle of a paragraph in the middle of the entry
+    block = editor.document().findBlockByNumber(editor.document().blockCount() // 2)
+    while block.text().startswith(("#", "-", ">", "`", "x")) or not block.text():
+        block = block.next()
+    cursor = QTextCursor(block)
+    cursor.movePosition(QTextCursor.EndOfBlock)
+    editor.setTextCursor(cursor)
+    app.processEvents()
+    results = [("typing in a paragraph", timed_keystrokes(app, editor, (" some *more* text" * 2)[:KEYSTROKES]))]
+    editor.insertPlainText("\n\n")
+    results.append(("opening a fenced code block", timed_keystrokes(app, editor, "```\n")))
+    results.append(("typing in the code block", timed_keystrokes(app, editor, "print(1)\n")))
+    results.append(("closing the fenced code block", timed_keystrokes(app, editor, "```")))
+    # there is no other ~~~ fence, so every block after this one becomes part of the code block
+    editor.insertPlainText("\n\n")
+    results.append(("opening an unclosed code block", timed_keystrokes(app, editor, "~~~\n")))
+    for label, longest in results:
+        print("{:>36}: {:8.2f} ms per keystroke at most".format(label, longest))
+
+    # the interface renders the preview when the editor reports a change of the text, which formatting must not cause
+    text_changes = []
+    editor.contents_changed.connect(lambda: text_changes.append(None))
+    longest_scroll = 0.0
+    for _ in range(10):
+        start = time.perf_counter()
+        editor.verticalScrollBar().setValue(editor.verticalScrollBar().value() + editor.viewport().height() // 10)
+        app.processEvents()
+        longest_scroll = max(longest_scroll, time.perf_counter() - start)
+    print("{:>36}: {:8.2f} ms per page at most".format("scrolling", longest_scroll * 1000))
+    print("{:>36}: {:8}".format("text changes reported by scrolling", len(text_changes)))
+
+    over_budget = [label for label, longest in results if longest > budget]
+    if over_budget:
+        print("over the budget of {} ms: {}".format(budget, ", ".join(over_budget)))
+    else:
+        print("every keystroke is within the budget of {} ms".format(budget))
+    if text_changes:
+        print("scrolling reported {} changes of the text".format(len(text_changes)))
+    del app
+    return 1 if over_budget or text_changes else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(int(float(sys.argv[1]) * 1024 * 1024) if len(sys.argv) > 1 else 1024 * 1024,
+                  float(sys.argv[2]) if len(sys.argv) > 2 else 16))
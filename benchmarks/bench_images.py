@@ -0,0 +1,100 @@
+"""
+Measures encoding time and size of pasted images for each format and setting supported by ImageEncoder, on a batch of
+large synthetic screenshots, and the throughput of encoding them on several threads. The original code saved every
+pasted image as a default png on the GUI thread, so the "png" row is how long a paste used to block input.
+
+Usage: python bench_images.py [image count] [width] [height]
+"""
+
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "ASDF-Journal"))
+
+from PyQt5.QtCore import QRect, Qt  # noqa: E402
+from PyQt5.QtGui import QColor, QFont, QGuiApplication, QImage, QPainter  # noqa: E402
+
+import ImageEncoder  # noqa: E402
+
+# (label, format, quality, max dimension)
+CONFIGURATIONS = [
+    ("png", "png", -1, 0),
+    ("png fastest", "png", 100, 0),
+    ("png smallest", "png", 0, 0),
+    ("png max 2560", "png", -1, 2560),
+    ("jpeg 85", "jpeg", 85, 0),
+    ("jpeg 85 max 2560", "jpeg", 85, 2560),
+    ("webp 80", "webp", 80, 0),
+]
+
+
+def synthetic_screenshot(width: int, height: int, seed: int) -> QImage:
+    """
+    :return: an image with flat areas, text and a gradient photo, like a screenshot of a desktop
+    """
+    rng = random.Random(seed)
+    image = QImage(width, height, QImage.Format_ARGB32)
+    image.fill(QColor(240, 240, 240))
+    painter = QPainter(image)
+    painter.setFont(QFont("Sans", 14))
+    for _ in range(40):
+        painter.fillRect(QRect(rng.randrange(width), rng.randrange(height), rng.randrange(50, 800),
+                               rng.randrange(20, 400)), QColor(rng.randrange(256), rng.randrange(256),
+                                                               rng.randrange(256)))
+    for line in range(0, height, 24):
+        painter.drawText(20, line, " ".join("word{}".format(rng.randrange(1000)) for _ in range(width // 90)))
+    photo = QImage(width // 3, height // 3, QImage.Format_RGB32)
+    for y in range(0, photo.height(), 4):
+        for x in range(0, photo.width(), 4):
+            photo.setPixel(x, y, QColor((x + rng.randrange(30)) % 256, (y + rng.randrange(30)) % 256, 128).rgb())
+    painter.drawImage(width // 2, height // 2, photo.scaled(photo.size(), Qt.IgnoreAspectRatio,
+                                                          Qt.SmoothTransformation))
+    painter.end()
+    return image
+
+
+def main(count: int, width: int, height: int) -> None:
+    app = QGuiApplication(sys.argv)
+    images = [synthetic_screenshot(width, height, seed) for seed in range(count)]
+    print("{} images of {}x{}".format(count, width, height))
+    print("{:>18} {:>14} {:>12}".format("", "ms per image", "KB per image"))
+    for label, format_name, quality, max_dimension in CONFIGURATIONS:
+        if ImageEncoder.image_format(format_name) != format_name:
+            print("{:>18}  not supported by the installed Qt image plugins".format(label))
+            continue
+        start = time.perf_counter()
+        size = sum(len(ImageEncoder.encode_image(image, format_name, quality, max_dimension)) for image in images)
+        elapsed = time.perf_counter() - start
+        print("{:>18} {:14.1f} {:12.1f}".format(label, elapsed * 1000 / count, size / 1024 / count))
+
+    # Qt releases the GIL while encoding, so the GUI thread keeps running while an image is encoded in the background
+    encoder = threading.Thread(target=ImageEncoder.encode_image, args=(images[0],))
+    longest_gap = 0.0
+    last = time.perf_counter()
+    encoder.start()
+    while encoder.is_alive():
+        time.sleep(0.001)
+        now = time.perf_counter()
+        longest_gap = max(longest_gap, now - last)
+        last = now
+    print("longest pause of the calling thread while a png is encoded in the background: {:.1f} ms".format(
+        longest_gap * 1000))
+
+    for workers in (1, 2, 4):
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(ImageEncoder.encode_image, images))
+        print("png on {} threads ({} cpus): {:.2f} images/s".format(workers, os.cpu_count(),
+                                                                    count / (time.perf_counter() - start)))
+    del app
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 8,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 5120,
+         int(sys.argv[3]) if len(sys.argv) > 3 else 2880)
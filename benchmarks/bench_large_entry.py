@@ -0,0 +1,104 @@
+"""
+Measures opening and typing in large entries. The editor used to be a QTextEdit, whose layout does work proportional to
+the whole document on every keystroke, and which loaded the entry with a single setPlainText; it is compared with the
+current editor, which loads large entries in chunks so that the window is usable after the first one.
+
+Usage: python bench_large_entry.py [sizes in MB...]
+"""
+
+import json
+import os
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "ASDF-Journal"))
+
+from PyQt5.QtWidgets import QApplication, QTextEdit  # noqa: E402
+
+import Settings  # noqa: E402
+import Utilities  # noqa: E402
+from MarkdownEditor import MarkdownEditor  # noqa: E402
+
+KEYSTROKES = 5
+
+
+def type_text(app: QApplication, editor, position: int) -> float:
+    """
+    :return: the longest time taken by a keystroke, including the events it causes, in milliseconds
+    """
+    cursor = editor.textCursor()
+    cursor.setPosition(position)
+    editor.setTextCursor(cursor)
+    longest = 0.0
+    for _ in range(KEYSTROKES):
+        start = time.perf_counter()
+        editor.insertPlainText("a")
+        app.processEvents()
+        longest = max(longest, time.perf_counter() - start)
+    return longest * 1000
+
+
+def main(sizes) -> None:
+    # the editor reads its settings from data.json, which is created on the first run of the app
+    data_path = os.path.join(Utilities.get_directory(), "data.json")
+    created_data = not os.path.exists(data_path)
+    if created_data:
+        with open(data_path, "w") as data_file:
+            json.dump(Settings.DEFAULT_DATA, data_file, indent=4)
+    try:
+        run(sizes)
+    finally:
+        if created_data:
+            os.remove(data_path)
+
+
+def run(sizes) -> None:
+    app = QApplication(sys.argv)
+    print("{:>7} {:>22} {:>14} {:>13} {:>14}".format("", "until usable (ms)", "full load (ms)",
+                                                      "keystroke (ms)", "longest stall"))
+    for size_mb in sizes:
+        with tempfile.TemporaryDirectory() as entries_dir:
+            path = os.path.join(entries_dir, "entry.md")
+            line = "Some journal text with *emphasis* and a [link](http://example.com).\n"
+            with open(path, "w", encoding="utf8") as entry:
+                entry.write("# Entry\n\n" + line * int(size_mb * 1024 * 1024 / len(line)))
+            with open(path, encoding="utf8") as entry:
+                text = entry.read()
+
+            old_editor = QTextEdit()
+            old_editor.resize(800, 600)
+            old_editor.show()
+            start = time.perf_counter()
+            old_editor.setPlainText(text)
+            app.processEvents()
+            old_load = (time.perf_counter() - start) * 1000
+            old_keystroke = type_text(app, old_editor, 5000)
+            old_editor.deleteLater()
+            print("{:>4} MB {:>22} {:14.0f} {:13.1f} {:>14}".format(size_mb, "{:.0f} (QTextEdit)".format(old_load),
+                                                                     old_load, old_keystroke,
+                                                                     "{:.0f}".format(old_load)))
+
+            editor = MarkdownEditor(None)
+            editor.resize(800, 600)
+            editor.show()
+            start = time.perf_counter()
+            editor.update_editor(path)
+            app.processEvents()
+            usable = (time.perf_counter() - start) * 1000
+            longest_stall = usable
+            while editor.is_loading():
+                event_start = time.perf_counter()
+                app.processEvents()
+                longest_stall = max(longest_stall, (time.perf_counter() - event_start) * 1000)
+            full_load = (time.perf_counter() - start) * 1000
+            keystroke = type_text(app, editor, 5000)
+            editor.deleteLater()
+            print("{:>7} {:>22} {:14.0f} {:13.1f} {:14.0f}".format("", "{:.0f} (editor)".format(usable), full_load,
+                                                                   keystroke, longest_stall))
+    del app
+
+
+if __name__ == "__main__":
+    main([float(size) for size in sys.argv[1:]] or [1, 10, 50])
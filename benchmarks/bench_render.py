@@ -0,0 +1,96 @@
+"""
+Measures how much a 1 MB markdown render stalls the GUI thread when it runs on the GUI thread, on a worker thread and in
+the worker process used by PreviewPanel. The GUI thread is simulated by a loop that wants to run every 16 ms (60 fps);
+the reported stall is the longest gap between its iterations.
+
+Usage: python bench_render.py [size in MB]
+"""
+
+import multiprocessing
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "ASDF-Journal"))
+
+import Rendering  # noqa: E402
+
+FRAME = 1 / 60
+
+
+def synthetic_markdown(size: int) -> str:
+    rng = random.Random(1)
+    words = ["journal", "*walk*", "**coffee**", "`code`", "morning", "evening", "[link](http://example.com)", "the"]
+    parts = []
+    length = 0
+    while length < size:
+        kind = rng.random()
+        if kind < 0.1:
+            part = "## Heading {}".format(len(parts))
+        elif kind < 0.25:
+            part = "\n".join("- " + " ".join(rng.choices(words, k=6)) for _ in range(4))
+        elif kind < 0.3:
+            part = "```\n" + "\n".join("line {}".format(i) for i in range(10)) + "\n```"
+        else:
+            part = " ".join(rng.choices(words, k=60))
+        parts.append(part)
+        length += len(part) + 2
+    return "\n\n".join(parts)
+
+
+def frame_loop(done: threading.Event, last: float):
+    """
+    Simulates the GUI event loop
+    :param last: time of the last frame before the render started
+    :return: the longest gap between frames in seconds
+    """
+    longest = 0.0
+    while True:
+        now = time.perf_counter()
+        longest = max(longest, now - last)
+        last = now
+        if done.is_set():
+            return longest
+        time.sleep(FRAME / 4)
+
+
+def measure(name: str, start_render) -> None:
+    done = threading.Event()
+    start = time.perf_counter()
+    start_render(done)
+    longest = frame_loop(done, start)
+    print("{:>14}: render {:7.3f} s, longest frame gap {:7.1f} ms".format(
+        name, time.perf_counter() - start, longest * 1000))
+
+
+def main(size_mb: float) -> None:
+    text = synthetic_markdown(int(size_mb * 1024 * 1024))
+    blocks = Rendering.split_blocks(text)
+
+    def on_gui_thread(done):
+        Rendering.render_blocks(blocks)
+        done.set()
+
+    def on_thread(done):
+        def run():
+            Rendering.render_blocks(blocks)
+            done.set()
+        threading.Thread(target=run).start()
+
+    executor = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+    executor.submit(Rendering.create_markdown).result()
+
+    def in_process(done):
+        executor.submit(Rendering.render_blocks, blocks).add_done_callback(lambda future: done.set())
+
+    measure("GUI thread", on_gui_thread)
+    measure("worker thread", on_thread)
+    measure("worker process", in_process)
+    executor.shutdown()
+
+
+if __name__ == '__main__':
+    main(float(sys.argv[1]) if len(sys.argv) > 1 else 1.0)
@@ -0,0 +1,62 @@
+"""
+Measures indexing time and query latency of SearchIndex on a synthetic journal
+
+Usage: python bench_search.py [entry count]
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "ASDF-Journal"))
+
+from EntryIndex import EntryIndex  # noqa: E402
+from SearchIndex import SearchIndex  # noqa: E402
+
+QUERIES = ["morning", "coffee walk", "mount", "tra", "the", "quiet evening garden", "zz"]
+
+
+def make_vocabulary(size: int, rng: random.Random):
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    words = {"morning", "coffee", "walk", "mountain", "travel", "train", "quiet", "evening", "garden", "the"}
+    while len(words) < size:
+        words.add("".join(rng.choice(letters) for _ in range(rng.randint(3, 10))))
+    return sorted(words)
+
+
+def main(count: int) -> None:
+    rng = random.Random(1)
+    vocabulary = make_vocabulary(20000, rng)
+    # a Zipf-like distribution, so that some words are common and most are rare
+    weights = [1 / (rank + 1) for rank in range(len(vocabulary))]
+    with tempfile.TemporaryDirectory() as journal_dir:
+        entries_dir = os.path.join(journal_dir, "entries")
+        os.makedirs(entries_dir)
+        start_date = datetime(2000, 1, 1)
+        for i in range(count):
+            name = (start_date + timedelta(hours=3 * i)).strftime("%Y-%m-%d_%H%M") + "_Entry_{}.md".format(i)
+            with open(os.path.join(entries_dir, name), "w", encoding="utf8") as entry:
+                entry.write("# Entry {}\n\n".format(i) + " ".join(rng.choices(vocabulary, weights, k=150)))
+
+        entry_index = EntryIndex(journal_dir, "%Y-%m-%d %H%M")
+        entry_index.refresh()
+        search_index = SearchIndex(journal_dir)
+        start = time.perf_counter()
+        search_index.sync(entry_index.entries())
+        search_index.wait()
+        print("indexed {} entries in {:.2f} s".format(count, time.perf_counter() - start))
+
+        for query in QUERIES:
+            start = time.perf_counter()
+            results = search_index.search(query)
+            print("{:>22}: {:8.2f} ms  {} results".format(repr(query), (time.perf_counter() - start) * 1000,
+                                                            len(results)))
+        search_index.close()
+        entry_index.close()
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
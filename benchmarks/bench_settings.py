@@ -0,0 +1,88 @@
+"""
+Compares the file I/O done by the old per-call data.json access with the in-memory Settings store
+"""
+
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "ASDF-Journal"))
+
+from Settings import Settings  # noqa: E402
+
+DEFAULT_DATA = {
+    "journal_dir": "",
+    "page_zoom": 1,
+    "splitter_sizes": [],
+    "toggle_selector": True,
+    "toggle_editor": True,
+    "toggle_preview": True,
+    "datetime_format": "%Y-%m-%d %H%M",
+    "editor_font_size": 12,
+    "entry_seperator": "\n\n-----\n-----\n\n"
+}
+
+
+class LegacyStore:
+    """
+    Reproduces the original get_data/set_data behaviour, which reads or rewrites data.json on every call
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.reads = 0
+        self.writes = 0
+
+    def get(self, field: str):
+        with open(self.path) as data_file:
+            data = json.load(data_file)
+        self.reads += 1
+        return data[field]
+
+    def set(self, field: str, value) -> None:
+        with open(self.path, "r") as data_file:
+            data = json.load(data_file)
+            data[field] = value
+        with open(self.path, "w") as data_file_write:
+            json.dump(data, data_file_write, indent=4)
+        self.reads += 1
+        self.writes += 1
+
+    def update(self, values: dict) -> None:
+        for field, value in values.items():
+            self.set(field, value)
+
+
+def run_scenario(store, iterations: int) -> float:
+    """
+    Simulates a session: calendar clicks and selector updates read settings, and the window state is saved periodically
+    :return: elapsed seconds
+    """
+    start = time.perf_counter()
+    for i in range(iterations):
+        store.get("journal_dir")
+        store.get("datetime_format")
+        [store.get("toggle_selector"), store.get("toggle_editor"), store.get("toggle_preview")]
+        if i % 10 == 0:
+            store.update({"toggle_selector": True, "toggle_editor": True, "toggle_preview": bool(i % 20)})
+    if hasattr(store, "flush"):
+        store.flush()
+    return time.perf_counter() - start
+
+
+def main(iterations: int = 1000) -> None:
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for name, store_type in (("legacy", LegacyStore), ("settings", Settings)):
+            path = os.path.join(temp_dir, name + ".json")
+            with open(path, "w") as data_file:
+                json.dump(DEFAULT_DATA, data_file, indent=4)
+            store = store_type(path)
+            elapsed = run_scenario(store, iterations)
+            print("{name:>10}: {elapsed:8.4f} s  reads={reads:<6} writes={writes}".format(
+                name=name, elapsed=elapsed, reads=store.reads, writes=store.writes))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000)
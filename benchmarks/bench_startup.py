@@ -0,0 +1,119 @@
+"""
+Measures the cold start of the app on a synthetic journal, each run in a new process: the time until the modules are
+imported, until the main window is first painted, until the entry list is filled by the background scan and, with
+--preview, until the preview has been created and has loaded its first page. Also reports whether markdown and
+QtWebEngine were loaded before the first paint, which they should not be since the preview is created once it is shown.
+
+The preview is hidden by default, since QtWebEngine does not work without a display; pass --preview to time it too.
+Building the preview fails the run, so this also checks that the page of the preview can be constructed.
+
+Usage: python bench_startup.py [--entries N] [--repeat N] [--preview]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "ASDF-Journal"))
+
+STAGES = ("imported_ms", "first_paint_ms", "entries_listed_ms", "preview_loaded_ms")
+# how long to wait for the preview to load its first page, in seconds
+PREVIEW_TIMEOUT = 30
+
+
+def startup_child(launched: float) -> None:
+    """
+    Starts up like asdf-journal.py and prints when each stage was reached as JSON
+    :param launched: the time.time() at which the parent started the process
+    :return: None
+    """
+    from PyQt5.QtCore import QCoreApplication, Qt
+    from PyQt5.QtWidgets import QApplication
+    from MainInterface import MainInterface
+    imported = time.time()
+
+    QCoreApplication.setAttribute(Qt.AA_ShareOpenGLContexts)
+    app = QApplication([])
+    app.setStyle("Fusion")
+    window = MainInterface()
+    window.showMaximized()
+    window.repaint()
+    painted = time.time()
+    heavy_modules = {name: name in sys.modules for name in ("markdown", "PyQt5.QtWebEngineWidgets")}
+
+    while window.journal_loader is None or window.journal_loader.is_running():
+        app.processEvents()
+        time.sleep(0.001)
+    # delivers the signal that fills the entry list
+    app.processEvents()
+    listed = time.time()
+    stages = {"imported_ms": (imported - launched) * 1000, "first_paint_ms": (painted - launched) * 1000,
+              "entries_listed_ms": (listed - launched) * 1000}
+
+    if window.preview_container.isVisible():
+        # the preview is created from a timer after the window is shown, and an error there aborts the process
+        deadline = time.time() + PREVIEW_TIMEOUT
+        while window.preview_panel is None or not window.preview_panel.page_ready:
+            if time.time() > deadline:
+                raise RuntimeError("the preview did not load within {} s".format(PREVIEW_TIMEOUT))
+            app.processEvents()
+            time.sleep(0.001)
+        stages["preview_loaded_ms"] = (time.time() - launched) * 1000
+        window.preview_panel.render_worker.shutdown()
+        window.preview_panel.thumbnails.shutdown()
+    print(json.dumps(dict(stages, entries=window.entry_selector.entry_model.entry_count(),
+                          loaded_before_paint=heavy_modules)))
+
+
+def measure_startup(repeat: int) -> List[Dict[str, object]]:
+    """
+    Starts the app in new processes; data.json must already point at the journal
+    :param repeat: number of processes started
+    :return: the stages reached by each process, as printed by startup_child
+    """
+    runs = []
+    for _ in range(repeat):
+        launched = time.time()
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", repr(launched)],
+                                capture_output=True, text=True, check=True).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+    return runs
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Measures the cold start of the app")
+    parser.add_argument("--entries", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--preview", action="store_true", help="show the preview, which needs QtWebEngine")
+    parser.add_argument("--child", type=float, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child is not None:
+        startup_child(args.child)
+        return
+
+    from journal_generator import generate_journal, journal_settings
+    with tempfile.TemporaryDirectory() as journal_dir:
+        generate_journal(journal_dir, args.entries)
+        with journal_settings(journal_dir, toggle_preview=args.preview):
+            # the first start creates the stored index, which every later start uses
+            measure_startup(1)
+            runs = measure_startup(args.repeat)
+    print("{} entries, median of {} starts".format(runs[-1]["entries"], args.repeat))
+    for stage in STAGES:
+        if stage not in runs[-1]:
+            continue
+        print("{:>20}: {:8.1f} ms".format(stage[:-3].replace("_", " "), statistics.median(run[stage] for run in runs)))
+    print("loaded before the first paint: {}".format(
+        ", ".join("{} {}".format(name, "yes" if loaded else "no")
+                  for name, loaded in runs[-1]["loaded_before_paint"].items())))
+
+
+if __name__ == "__main__":
+    main()
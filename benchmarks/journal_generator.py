@@ -0,0 +1,157 @@
+"""
+Generates synthetic journals for the benchmarks: an entries folder with entries named like the app names them, for any
+datetime format, with bodies whose sizes follow a log-normal distribution, and an attachments folder with images that
+some of the entries reference
+
+Usage: python journal_generator.py <journal folder> [--entries N] [--median-size BYTES] [--size-spread SIGMA]
+                                   [--attachments FRACTION] [--datetime-format FORMAT] [--seed N]
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import struct
+import sys
+import zlib
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "ASDF-Journal"))
+
+import Journal  # noqa: E402
+import Settings  # noqa: E402
+
+WORDS = ["journal", "walked", "coffee", "morning", "evening", "mountain", "the", "quiet", "garden", "travel", "and",
+         "river", "friends", "home", "*slowly*", "**today**", "`code`", "[link](http://example.com)", "café", "über"]
+TITLES = ["Morning pages", "Trip notes", "Reading list", "Weekly review", "Ideas", "Dream", "Meeting", "Workout"]
+# entries are this far apart on average, so 40000 entries span about 27 years
+MEAN_INTERVAL_HOURS = 6
+MAX_ENTRY_SIZE = 4 * 1024 * 1024
+
+
+def png_bytes(width: int, height: int, rng: random.Random) -> bytes:
+    """
+    :return: a valid PNG of random grey pixels, made without Qt so that journals can be generated without a display
+    """
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    rows = b"".join(b"\x00" + bytes(rng.randrange(256) for _ in range(width)) for _ in range(height))
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 0, 0, 0, 0)) + \
+        chunk(b"IDAT", zlib.compress(rows)) + chunk(b"IEND", b"")
+
+
+def entry_body(size: int, rng: random.Random) -> str:
+    """
+    :param size: approximate size of the body in characters
+    :return: markdown with paragraphs, headings, lists and the occasional fenced code block
+    """
+    parts = []
+    length = 0
+    while length < size:
+        kind = rng.random()
+        if kind < 0.1:
+            part = "## " + rng.choice(TITLES) + "\n\n"
+        elif kind < 0.2:
+            part = "".join("- " + " ".join(rng.choices(WORDS, k=5)) + "\n" for _ in range(3)) + "\n"
+        elif kind < 0.23:
+            part = "```\n" + "".join("x = {}\n".format(i) for i in range(4)) + "```\n\n"
+        else:
+            part = " ".join(rng.choices(WORDS, k=rng.randrange(10, 60))) + "\n\n"
+        parts.append(part)
+        length += len(part)
+    return "".join(parts)
+
+
+def generate_journal(journal_dir: str, entries: int = 1000, median_size: int = 2000, size_spread: float = 0.8,
+                     attachments: float = 0.05, datetime_format: str = Settings.DEFAULT_DATA["datetime_format"],
+                     seed: int = 1) -> List[str]:
+    """
+    Creates a journal with entries spread over the years before 2020. Roughly one in ten entries has no title, and some
+    share a day with the entry before them.
+    :param journal_dir: folder to create the journal in; it may already exist
+    :param entries: number of entries
+    :param median_size: median size of an entry body in characters
+    :param size_spread: sigma of the log-normal distribution of body sizes; 0 makes every body the median size
+    :param attachments: fraction of entries that reference an image in the attachments folder
+    :param datetime_format: the datetime format from data.json that the entry names start with
+    :param seed: seed of the random generator, so that the same arguments always generate the same journal
+    :return: the file names of the entries, oldest first
+    """
+    rng = random.Random(seed)
+    entries_dir = os.path.join(journal_dir, "entries")
+    attachments_dir = os.path.join(journal_dir, "attachments")
+    os.makedirs(entries_dir, exist_ok=True)
+    os.makedirs(attachments_dir, exist_ok=True)
+
+    timestamp = datetime(2020, 1, 1) - timedelta(hours=MEAN_INTERVAL_HOURS * entries)
+    names = []
+    seen = set()
+    for index in range(entries):
+        timestamp += timedelta(minutes=rng.randrange(1, MEAN_INTERVAL_HOURS * 120))
+        entry_name = timestamp.strftime(datetime_format)
+        if rng.random() > 0.1:
+            entry_name += " " + rng.choice(TITLES) + " " + str(index)
+        name = Journal.replace_chars_for_file(entry_name) + ".md"
+        if name in seen:
+            # the format does not tell apart untitled entries made close together
+            continue
+        seen.add(name)
+        size = min(int(median_size * math.exp(rng.gauss(0, size_spread))), MAX_ENTRY_SIZE)
+        text = "# " + entry_name + "\n\n" + entry_body(size, rng)
+        if rng.random() < attachments:
+            image_name = Journal.replace_chars_for_file(timestamp.strftime(datetime_format) + "_image.png")
+            with open(os.path.join(attachments_dir, image_name), "wb") as image:
+                image.write(png_bytes(rng.randrange(32, 256), rng.randrange(32, 256), rng))
+            text += Journal.attachment_reference(image_name)
+        with open(os.path.join(entries_dir, name), "w", encoding="utf8") as entry:
+            entry.write(text)
+        names.append(name)
+    return names
+
+
+@contextmanager
+def journal_settings(journal_dir: str, **settings):
+    """
+    Points the app at a journal by writing its data.json, which is restored when the context exits
+    :param journal_dir: folder of the journal
+    :param settings: other values to set in data.json, such as datetime_format
+    """
+    data_path = Journal.get_data_path()
+    saved_data = None
+    if os.path.exists(data_path):
+        with open(data_path, "rb") as data_file:
+            saved_data = data_file.read()
+    with open(data_path, "w") as data_file:
+        json.dump(dict(Settings.DEFAULT_DATA, journal_dir=journal_dir, **settings), data_file, indent=4)
+    try:
+        yield
+    finally:
+        if saved_data is None:
+            os.remove(data_path)
+        else:
+            with open(data_path, "wb") as data_file:
+                data_file.write(saved_data)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Generates a synthetic journal for the benchmarks")
+    parser.add_argument("journal_dir")
+    parser.add_argument("--entries", type=int, default=1000)
+    parser.add_argument("--median-size", type=int, default=2000, help="median size of an entry in characters")
+    parser.add_argument("--size-spread", type=float, default=0.8, help="sigma of the log-normal entry sizes")
+    parser.add_argument("--attachments", type=float, default=0.05,
+                        help="fraction of entries that reference an image")
+    parser.add_argument("--datetime-format", default=Settings.DEFAULT_DATA["datetime_format"])
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    names = generate_journal(args.journal_dir, args.entries, args.median_size, args.size_spread, args.attachments,
+                             args.datetime_format, args.seed)
+    print("generated {} entries in {}".format(len(names), args.journal_dir))
+
+
+if __name__ == "__main__":
+    main()
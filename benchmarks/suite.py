@@ -0,0 +1,326 @@
+"""
+Headless benchmark suite: generates a synthetic journal (see journal_generator.py), times the operations whose cost
+grows with the journal under an offscreen Qt platform and saves the results as JSON. Given the results of an earlier
+run, it reports every scenario whose median got slower by more than the threshold and exits with an error.
+
+Scenarios:
+    update_entry_selector_cold    loads the journal into the entry list with no stored index
+    update_entry_selector_stored  the same with the index stored by a previous run, as on every start after the first
+    set_entry_date                selects entries from the calendar, for a sample of dates
+    calendar_highlight            highlights the dates with entries in the calendar
+    export_single_file            exports the journal as a single file
+    export_single_file_unchanged  exports it again when no entry has changed
+    preview_conversion            converts a sample of entries to HTML as the preview panel does
+    export_site                   exports a sample of entries as an HTML site, converted by a process on every core
+    export_site_unchanged         exports it again when no entry has changed
+    startup_first_paint           starts a new process and paints the main window (see bench_startup.py)
+    startup_entries_listed        the same until the entry list is filled by the background scan
+
+The preview panel itself needs QtWebEngine, which does not work without a display, so the preview conversion scenario
+times the rendering it delegates to, and the preview is hidden during startup.
+
+Usage: python suite.py [--entries N] [--median-size BYTES] [--size-spread SIGMA] [--attachments FRACTION]
+                       [--datetime-format FORMAT] [--journal FOLDER] [--repeat N] [--output FILE]
+                       [--baseline FILE] [--threshold FRACTION]
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Tuple
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "ASDF-Journal"))
+
+from PyQt5.QtCore import QDate, PYQT_VERSION_STR, QT_VERSION_STR  # noqa: E402
+from PyQt5.QtWidgets import QApplication  # noqa: E402
+
+import EntryIndex  # noqa: E402
+import Export  # noqa: E402
+import Journal  # noqa: E402
+import Rendering  # noqa: E402
+import SearchIndex  # noqa: E402
+import Settings  # noqa: E402
+import SiteExport  # noqa: E402
+import Utilities  # noqa: E402
+from Calendar import Calendar  # noqa: E402
+from EntrySelector import EntrySelector  # noqa: E402
+from bench_startup import measure_startup  # noqa: E402
+from journal_generator import generate_journal, journal_settings  # noqa: E402
+
+RESULTS_VERSION = 1
+DATE_SAMPLE = 200
+PREVIEW_SAMPLE = 100
+SITE_SAMPLE = 500
+# slowdowns smaller than this are within the noise of a run, however large they are relative to the baseline
+NOISE_FLOOR_MS = 1.0
+
+
+def drop_entry_index(remove_stored: bool) -> None:
+    """
+    Closes the index of the journal, so that the next scenario loads it again like a new process would
+    :param remove_stored: also remove the index and search index stored in the journal folder
+    :return: None
+    """
+    if Journal._entry_index is not None:
+        Journal._entry_index.close()
+        Journal._entry_index = None
+    if remove_stored:
+        for name in (EntryIndex.INDEX_FILE_NAME, SearchIndex.SEARCH_FILE_NAME):
+            path = os.path.join(Utilities.get_journal_dir(), name)
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def timed_runs(repeat: int, function: Callable[[], None], setup: Callable[[], None] = None) -> List[float]:
+    """
+    :param repeat: number of runs
+    :param function: the code that is timed
+    :param setup: called before each run, outside of the timing
+    :return: the time taken by each run, in milliseconds
+    """
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        function()
+        times.append((time.perf_counter() - start) * 1000)
+    return times
+
+
+def bench_update_entry_selector(app: QApplication, repeat: int, remove_stored: bool) -> List[float]:
+    selector = EntrySelector(None)
+    selector.resize(300, 800)
+    selector.show()
+
+    def setup() -> None:
+        selector.reset_entries()
+        drop_entry_index(remove_stored)
+
+    def load() -> None:
+        selector.update_entry_selector()
+        app.processEvents()
+
+    if not remove_stored:
+        load()
+    times = timed_runs(repeat, load, setup)
+    # the search index is built in the background, and must be finished before the next scenario removes it
+    selector.search_index.wait()
+    selector.reset_entries()
+    selector.deleteLater()
+    return times
+
+
+def bench_set_entry_date(app: QApplication, repeat: int) -> List[float]:
+    selector = EntrySelector(None)
+    selector.update_entry_selector()
+    timestamps = [entry.timestamp for entry in Utilities.get_entry_index().entries() if entry.timestamp]
+    dates = [QDate(day.year, day.month, day.day) for day in random.Random(1).choices(timestamps, k=DATE_SAMPLE)]
+
+    def select_dates() -> None:
+        for date in dates:
+            selector.set_entry_date(date)
+        app.processEvents()
+
+    times = timed_runs(repeat, select_dates)
+    selector.search_index.wait()
+    selector.reset_entries()
+    selector.deleteLater()
+    return times
+
+
+def bench_calendar_highlight(app: QApplication, repeat: int) -> List[float]:
+    entries = Utilities.get_entry_index().entries()
+    calendars = []
+
+    def setup() -> None:
+        calendars.append(Calendar(None))
+        calendars[-1].show()
+        app.processEvents()
+
+    def highlight() -> None:
+        calendars[-1].highlight_dates_with_entries(entries)
+        app.processEvents()
+
+    times = timed_runs(repeat, highlight, setup)
+    for calendar in calendars:
+        calendar.deleteLater()
+    return times
+
+
+def bench_export(repeat: int, unchanged: bool) -> List[float]:
+    names = Utilities.get_entry_index().names()
+    with tempfile.TemporaryDirectory() as export_dir:
+        output_path = os.path.join(export_dir, "export.md")
+
+        def setup() -> None:
+            if not unchanged and os.path.exists(os.path.join(export_dir, Export.MANIFEST_NAME)):
+                os.remove(os.path.join(export_dir, Export.MANIFEST_NAME))
+
+        def export() -> None:
+            Export.export_single_file(Utilities.get_entries_dir(), names, Utilities.get_seperator(), output_path)
+
+        if unchanged:
+            export()
+        return timed_runs(repeat, export, setup)
+
+
+def bench_preview_conversion(repeat: int) -> List[float]:
+    names = Utilities.get_entry_index().names()
+    sample = names[::max(1, len(names) // PREVIEW_SAMPLE)][:PREVIEW_SAMPLE]
+    texts = []
+    for name in sample:
+        with open(os.path.join(Utilities.get_entries_dir(), name), encoding="utf8") as entry:
+            texts.append(entry.read())
+
+    def convert() -> None:
+        for text in texts:
+            Rendering.render_text(text)
+
+    return timed_runs(repeat, convert)
+
+
+def bench_export_site(repeat: int, unchanged: bool) -> Tuple[List[float], float]:
+    """
+    :return: the time taken by each run, and the median number of entries converted per second
+    """
+    entries = Utilities.get_entry_index().entries()
+    sample = entries[::max(1, len(entries) // SITE_SAMPLE)][:SITE_SAMPLE]
+    rates = []
+    with tempfile.TemporaryDirectory() as site_dir:
+        def setup() -> None:
+            if not unchanged and os.path.exists(os.path.join(site_dir, SiteExport.SITE_MANIFEST_NAME)):
+                os.remove(os.path.join(site_dir, SiteExport.SITE_MANIFEST_NAME))
+
+        def export() -> None:
+            stats = SiteExport.export_site(Utilities.get_entries_dir(), sample, Utilities.get_datetime_format(),
+                                           site_dir, "journal")
+            rates.append(stats.entries_per_second)
+
+        if unchanged:
+            export()
+        times = timed_runs(repeat, export, setup)
+    return times, statistics.median(rates)
+
+
+def summarize(times: List[float]) -> Dict[str, object]:
+    return {"median_ms": statistics.median(times), "min_ms": min(times), "max_ms": max(times), "runs_ms": times}
+
+
+def run_scenarios(repeat: int) -> Dict[str, Dict[str, object]]:
+    app = QApplication([])
+    results = {}
+
+    def record(name: str, times: List[float], **details) -> None:
+        results[name] = dict(summarize(times), **details)
+        print("{:>30}: {:10.2f} ms median  {:10.2f} ms min".format(name, results[name]["median_ms"],
+                                                                   results[name]["min_ms"]), flush=True)
+
+    record("update_entry_selector_cold", bench_update_entry_selector(app, repeat, remove_stored=True))
+    record("update_entry_selector_stored", bench_update_entry_selector(app, repeat, remove_stored=False))
+    record("set_entry_date", bench_set_entry_date(app, repeat))
+    record("calendar_highlight", bench_calendar_highlight(app, repeat))
+    record("export_single_file", bench_export(repeat, unchanged=False))
+    record("export_single_file_unchanged", bench_export(repeat, unchanged=True))
+    record("preview_conversion", bench_preview_conversion(repeat))
+    times, rate = bench_export_site(repeat, unchanged=False)
+    record("export_site", times, entries_per_second=rate)
+    print("{:>30}  {:10.0f} entries/s".format("", rate), flush=True)
+    record("export_site_unchanged", bench_export_site(repeat, unchanged=True)[0])
+    drop_entry_index(remove_stored=False)
+    startup = measure_startup(repeat)
+    record("startup_first_paint", [run["first_paint_ms"] for run in startup])
+    record("startup_entries_listed", [run["entries_listed_ms"] for run in startup])
+    del app
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> List[str]:
+    """
+    Prints the change of each scenario from the baseline
+    :param results: results of this run
+    :param baseline: results of an earlier run
+    :param threshold: fraction by which a median may grow before it counts as a regression
+    :return: names of the scenarios that regressed
+    """
+    if results["journal"] != baseline.get("journal"):
+        print("warning: the baseline was run on a different journal, {}".format(baseline.get("journal")))
+    regressions = []
+    print("{:>30}  {:>12} {:>12} {:>8}".format("", "baseline ms", "now ms", "change"))
+    for name, result in results["scenarios"].items():
+        old = baseline.get("scenarios", {}).get(name)
+        if old is None:
+            print("{:>30}  {:>12} {:12.2f}".format(name, "-", result["median_ms"]))
+            continue
+        change = result["median_ms"] / old["median_ms"] - 1 if old["median_ms"] else 0.0
+        regressed = change > threshold and result["median_ms"] - old["median_ms"] > NOISE_FLOOR_MS
+        if regressed:
+            regressions.append(name)
+        print("{:>30}  {:12.2f} {:12.2f} {:>+7.0%}{}".format(name, old["median_ms"], result["median_ms"], change,
+                                                             "  REGRESSION" if regressed else ""))
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Times the app on a synthetic journal")
+    parser.add_argument("--entries", type=int, default=5000)
+    parser.add_argument("--median-size", type=int, default=2000, help="median size of an entry in characters")
+    parser.add_argument("--size-spread", type=float, default=0.8, help="sigma of the log-normal entry sizes")
+    parser.add_argument("--attachments", type=float, default=0.05,
+                        help="fraction of entries that reference an image")
+    parser.add_argument("--datetime-format", default=Settings.DEFAULT_DATA["datetime_format"])
+    parser.add_argument("--journal", help="folder to generate the journal in, and to reuse it from if it exists; "
+                                          "a temporary folder by default")
+    parser.add_argument("--repeat", type=int, default=5, help="number of runs of each scenario")
+    parser.add_argument("--output", help="file to save the results to")
+    parser.add_argument("--baseline", help="results of an earlier run to compare with")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="fraction by which a scenario may get slower before it counts as a regression")
+    args = parser.parse_args()
+
+    journal = {"entries": args.entries, "median_size": args.median_size, "size_spread": args.size_spread,
+               "attachments": args.attachments, "datetime_format": args.datetime_format}
+    journal_dir = args.journal or tempfile.mkdtemp(prefix="asdf-journal-bench-")
+    if not os.path.isdir(os.path.join(journal_dir, "entries")):
+        start = time.perf_counter()
+        generate_journal(journal_dir, args.entries, args.median_size, args.size_spread, args.attachments,
+                         args.datetime_format)
+        print("generated {} entries in {:.1f} s".format(args.entries, time.perf_counter() - start))
+
+    # the app reads the journal folder and datetime format from data.json, which is restored afterwards
+    try:
+        with journal_settings(journal_dir, datetime_format=args.datetime_format, toggle_preview=False):
+            scenarios = run_scenarios(args.repeat)
+    finally:
+        if not args.journal:
+            shutil.rmtree(journal_dir)
+
+    results = {"version": RESULTS_VERSION, "date": datetime.now().isoformat(timespec="seconds"), "journal": journal,
+               "environment": {"python": platform.python_version(), "qt": QT_VERSION_STR, "pyqt": PYQT_VERSION_STR,
+                               "platform": platform.platform(), "cpus": os.cpu_count()},
+               "repeat": args.repeat, "scenarios": scenarios}
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=4)
+        print("saved the results to {}".format(args.output))
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.threshold)
+        if regressions:
+            print("{} scenarios are more than {:.0%} slower: {}".format(len(regressions), args.threshold,
+                                                                          ", ".join(regressions)))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())